@@ -0,0 +1,289 @@
+import io
+import os
+import logging
+import wave
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Audio Preprocessing Configuration ---
+# Whisper resamples everything to 16 kHz mono; sending more is wasted upload.
+AUDIO_TARGET_RATE = int(os.getenv("AUDIO_TARGET_RATE", "16000"))
+# "flac" (lossless), "ogg" (Opus: ~4x smaller than FLAC but far more CPU to encode) or
+# "wav" (16-bit PCM). FLAC/Opus need `soundfile`; without it chunks are sent as 16 kHz mono WAV.
+AUDIO_UPLOAD_CODEC = os.getenv("AUDIO_UPLOAD_CODEC", "flac").lower()
+AUDIO_SILENCE_DB = float(os.getenv("AUDIO_SILENCE_DB", "-45"))       # never treat louder frames as silence floor
+AUDIO_SILENCE_MARGIN_DB = float(os.getenv("AUDIO_SILENCE_MARGIN_DB", "12"))  # above the noise floor = voiced
+AUDIO_TRIM_PADDING_MS = int(os.getenv("AUDIO_TRIM_PADDING_MS", "250"))
+AUDIO_MIN_GAP_MS = int(os.getenv("AUDIO_MIN_GAP_MS", "300"))         # shortest pause a chunk may be split on
+AUDIO_CHUNK_TARGET_S = float(os.getenv("AUDIO_CHUNK_TARGET_S", "30"))
+AUDIO_CHUNK_MAX_S = float(os.getenv("AUDIO_CHUNK_MAX_S", "45"))      # hard cut if no pause is found
+AUDIO_DECODE_BLOCK_S = int(os.getenv("AUDIO_DECODE_BLOCK_S", "5"))  # source audio decoded per step
+AUDIO_PREPROCESS_ENABLED = os.getenv("AUDIO_PREPROCESS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+_FRAME_MS = 20
+_CODECS = {
+    "flac": ("FLAC", "PCM_16", "flac", "audio/flac"),
+    "ogg": ("OGG", "OPUS", "ogg", "audio/ogg"),
+}
+
+try:
+    import soundfile
+except ImportError:  # optional: only needed for FLAC/Opus output and non-WAV input
+    soundfile = None
+
+
+# --- Decoding ---
+def _pcm_to_mono(frames: bytes, width: int, channels: int):
+    """Little-endian PCM frames to mono float32 in [-1, 1], or None for an unsupported sample width."""
+    import numpy as np
+
+    frames = frames[: len(frames) - len(frames) % (width * channels)]
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16))
+        samples = (np.where(ints >= 1 << 23, ints - (1 << 24), ints)).astype(np.float32) / float(1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        return None
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples.astype(np.float32)
+
+
+def _source_blocks(file_obj):
+    """
+    Yields (mono float32 block, sample rate) of AUDIO_DECODE_BLOCK_S seconds each,
+    read from `file_obj` as they are needed. Returns None (instead of a
+    generator) if the format is not understood.
+    """
+    start = file_obj.tell()
+    try:
+        w = wave.open(file_obj)  # does not close file_obj
+        if _pcm_to_mono(b"", w.getsampwidth(), w.getnchannels()) is None:
+            w = None
+    except (wave.Error, EOFError):
+        w = None
+    if w is not None:
+        def wav_blocks():
+            channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+            with w:
+                while True:
+                    frames = w.readframes(rate * AUDIO_DECODE_BLOCK_S)
+                    if not frames:
+                        return
+                    yield _pcm_to_mono(frames, width, channels), rate
+        return wav_blocks()
+
+    if soundfile is None:
+        return None
+    file_obj.seek(start)
+    try:
+        f = soundfile.SoundFile(file_obj)
+    except Exception:
+        return None
+
+    def soundfile_blocks():
+        with f:
+            for block in f.blocks(blocksize=f.samplerate * AUDIO_DECODE_BLOCK_S, dtype="float32", always_2d=True):
+                yield block.mean(axis=1).astype("float32"), f.samplerate
+    return soundfile_blocks()
+
+
+def decode(file_obj, dst_rate: int = AUDIO_TARGET_RATE):
+    """
+    Decodes an upload block by block to (mono float32 samples at `dst_rate`,
+    source duration in seconds), or None if the format is not understood (it
+    is then uploaded unchanged). Only one block of source audio is in memory
+    at a time, never the raw upload or a full-rate copy of it.
+    """
+    import numpy as np
+
+    blocks = _source_blocks(file_obj)
+    if blocks is None:
+        return None
+    out, source_s = [], 0.0
+    try:
+        for block, rate in blocks:
+            source_s += len(block) / rate
+            out.append(resample(block, rate, dst_rate))
+    except Exception as e:
+        logger.warning(f"Could not decode the recording; sending it unchanged. Error: {e}")
+        return None
+    return (np.concatenate(out) if out else np.zeros(0, dtype=np.float32)), source_s
+
+
+def resample(samples, src_rate: int, dst_rate: int = AUDIO_TARGET_RATE):
+    """Anti-aliased resampling: box-filter averaging for downsampling, then linear interpolation."""
+    import numpy as np
+
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    ratio = src_rate / dst_rate
+    if ratio > 1:
+        if ratio == int(ratio):
+            step = int(ratio)
+            usable = len(samples) - len(samples) % step
+            return samples[:usable].reshape(-1, step).mean(axis=1).astype(np.float32)
+        width = int(np.ceil(ratio))
+        samples = np.convolve(samples, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    out_len = int(len(samples) / ratio)
+    positions = np.arange(out_len, dtype=np.float64) * ratio
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+# --- Silence Detection ---
+def _frame_levels_db(samples, rate: int):
+    import numpy as np
+
+    frame = max(1, rate * _FRAME_MS // 1000)
+    count = len(samples) // frame
+    if count == 0:
+        return np.zeros(0, dtype=np.float32), frame
+    frames = samples[: count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    return 20.0 * np.log10(rms + 1e-10), frame
+
+
+def voiced_frames(samples, rate: int):
+    """Boolean mask of 20 ms frames louder than the adaptive silence threshold, plus the frame length."""
+    import numpy as np
+
+    levels, frame = _frame_levels_db(samples, rate)
+    if len(levels) == 0:
+        return np.zeros(0, dtype=bool), frame
+    noise_floor = float(np.percentile(levels, 5))
+    peak = float(levels.max())
+    if peak <= AUDIO_SILENCE_DB:
+        return np.zeros(len(levels), dtype=bool), frame
+    # Above the noise floor by a margin, never below the absolute floor, and never so
+    # high that a recording with little background noise loses its quieter speech.
+    threshold = min(max(AUDIO_SILENCE_DB, noise_floor + AUDIO_SILENCE_MARGIN_DB), peak - 20.0)
+    return levels > threshold, frame
+
+
+def trim_silence(samples, rate: int):
+    """Drops leading and trailing silence (keeping a little padding); empty if nothing is voiced."""
+    voiced, frame = voiced_frames(samples, rate)
+    indices = voiced.nonzero()[0]
+    if len(indices) == 0:
+        return samples[:0]
+    pad = rate * AUDIO_TRIM_PADDING_MS // 1000
+    start = max(0, indices[0] * frame - pad)
+    end = min(len(samples), (indices[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def split_on_silence(samples, rate: int, target_s: float = AUDIO_CHUNK_TARGET_S, max_s: float = AUDIO_CHUNK_MAX_S) -> list:
+    """
+    Splits a long recording into chunks of at most `max_s` seconds, cutting in the
+    middle of the pause closest to `target_s` into each chunk so words are not split.
+    """
+    import numpy as np
+
+    if len(samples) <= max_s * rate:
+        return [samples]
+    voiced, frame = voiced_frames(samples, rate)
+    min_gap = max(1, AUDIO_MIN_GAP_MS // _FRAME_MS)
+
+    # Midpoints (in samples) of every silent run of at least `min_gap` frames.
+    cuts = []
+    silent = np.concatenate(([False], ~voiced, [False]))
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    for run_start, run_end in zip(edges[::2], edges[1::2]):
+        if run_end - run_start >= min_gap:
+            cuts.append((run_start + run_end) // 2 * frame)
+    cuts = np.array(cuts, dtype=np.int64)
+
+    chunks, pos = [], 0
+    max_len, target_len, min_len = int(max_s * rate), int(target_s * rate), int(min(target_s, max_s) * rate / 3)
+    while len(samples) - pos > max_len:
+        candidates = cuts[(cuts > pos + min_len) & (cuts <= pos + max_len)]
+        if len(candidates):
+            cut = int(candidates[np.argmin(np.abs(candidates - (pos + target_len)))])
+        else:
+            cut = pos + max_len
+        chunks.append(samples[pos:cut])
+        pos = cut
+    chunks.append(samples[pos:])
+    return chunks
+
+
+# --- Encoding ---
+def encode(samples, rate: int, codec: str = AUDIO_UPLOAD_CODEC) -> tuple:
+    """Encodes mono float samples; returns (bytes, filename, content_type)."""
+    import numpy as np
+
+    if codec in _CODECS and soundfile is not None:
+        fmt, subtype, ext, content_type = _CODECS[codec]
+        try:
+            buf = io.BytesIO()
+            soundfile.write(buf, samples, rate, format=fmt, subtype=subtype)
+            return buf.getvalue(), f"audio.{ext}", content_type
+        except Exception as e:
+            logger.warning(f"Could not encode audio as {codec}; sending WAV instead. Error: {e}")
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue(), "audio.wav", "audio/wav"
+
+
+def prepare(file_obj, filename: str = None, content_type: str = None) -> dict:
+    """
+    Turns an uploaded recording (a seekable file object) into transcription chunks.
+
+    Returns {"chunks": [{"samples", "data", "filename", "content_type", "size"}], "report": {...}}.
+    Decodable audio is read incrementally, resampled to 16 kHz mono, trimmed of
+    leading/trailing silence and split on pauses if long; its chunks carry
+    samples and are encoded later by encode_chunk() (so encoding runs
+    concurrently with other chunks' uploads, and a local model never needs it).
+    Anything else is passed through as one chunk whose "data" is `file_obj`
+    itself, rewound, and "samples" None. No chunks means no speech.
+    """
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(0)
+    report = {"input_bytes": size, "preprocessed": False}
+    decoded = decode(file_obj) if AUDIO_PREPROCESS_ENABLED else None
+    if decoded is None:
+        file_obj.seek(0)
+        report["chunks"] = 1
+        return {"chunks": [{"samples": None, "data": file_obj, "filename": filename or "audio",
+                            "content_type": content_type, "size": size}], "report": report}
+
+    samples, input_s = decoded
+    report["input_s"] = round(input_s, 2)
+    samples = trim_silence(samples, AUDIO_TARGET_RATE)
+    pieces = split_on_silence(samples, AUDIO_TARGET_RATE, AUDIO_CHUNK_TARGET_S, AUDIO_CHUNK_MAX_S) if len(samples) else []
+    report.update({
+        "preprocessed": True,
+        "speech_s": round(len(samples) / AUDIO_TARGET_RATE, 2),
+        "chunks": len(pieces),
+    })
+    return {"chunks": [{"samples": piece, "data": None, "filename": None, "content_type": None, "size": None}
+                       for piece in pieces],
+            "report": report}
+
+
+def encode_chunk(chunk: dict) -> dict:
+    """Fills in a prepared chunk's upload bytes (no-op for pass-through chunks)."""
+    if chunk["data"] is None:
+        chunk["data"], chunk["filename"], chunk["content_type"] = encode(chunk["samples"], AUDIO_TARGET_RATE,
+                                                                         AUDIO_UPLOAD_CODEC)
+        chunk["size"] = len(chunk["data"])
+    return chunk
+
+
+def chunk_body(chunk: dict):
+    """A readable file for an encoded or pass-through chunk's upload."""
+    return chunk["data"] if hasattr(chunk["data"], "read") else io.BytesIO(chunk["data"])
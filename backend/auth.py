@@ -1,19 +1,27 @@
 import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from fastapi import APIRouter, Depends, HTTPException, status
+import math
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
+from sqlalchemy import event, inspect, select
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from jose import jwt, JWTError
 
 # Import database dependencies
-from .sql import get_db, User
+from .sql import get_db, get_async_read_db, ReadSessionLocal, User, TokenRevocation, engine
+from .password_service import hasher, HasherBusy
+from .rate_limit import login_user_limiter, login_ip_limiter, client_ip
+from .observability import span, traced
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
-
-# --- Password Hashing ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
 
 # --- JWT Configuration ---
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
@@ -24,6 +32,14 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# --- Identity Cache Configuration ---
+AUTH_CACHE_TTL_S = float(os.getenv("AUTH_CACHE_TTL_S", "60"))  # 0 disables the cache
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+# When enabled, tokens carry the user id and requests skip the database lookup entirely.
+JWT_EMBED_USER_ID = os.getenv("JWT_EMBED_USER_ID", "0").lower() in ("1", "true", "yes")
+# How often each worker reads the revocations recorded by the others (0 = this process only).
+AUTH_REVOCATION_SYNC_S = float(os.getenv("AUTH_REVOCATION_SYNC_S", "5"))
+
 # --- Pydantic Schemas (Data Models) ---
 class TokenOut(BaseModel):
     access_token: str
@@ -35,27 +51,242 @@ class UserCreate(BaseModel):
     username: str
     password: str
 
+class AuthenticatedUser(BaseModel):
+    """The identity resolved for a request; all that downstream endpoints need."""
+    id: int
+    username: str
+
+# --- Identity Cache ---
+class IdentityCache:
+    """
+    TTL- and size-bounded map of token -> AuthenticatedUser, invalidated per
+    username. Revocation watermarks are kept until every token they can reject
+    has expired (ACCESS_TOKEN_EXPIRE_MINUTES).
+    """
+
+    def __init__(self, ttl_s: float = AUTH_CACHE_TTL_S, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()  # token -> (identity, expires_at)
+        self._tokens_by_user = {}      # username -> set of cached tokens
+        self._revoked_before = {}      # username -> unix time; older tokens are rejected
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    self._drop(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, identity: AuthenticatedUser, token_exp: float = None):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_s
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            self._entries[token] = (identity, expires_at)
+            self._entries.move_to_end(token)
+            self._tokens_by_user.setdefault(identity.username, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def _drop(self, token: str):
+        identity, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(identity.username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[identity.username]
+
+    def invalidate_user(self, username: str, revoked_at: float = None) -> bool:
+        """
+        Drops cached identities and rejects tokens issued at or before
+        `revoked_at` (default now) for this user. Returns False if an equal or
+        later watermark was already applied.
+        """
+        revoked_at = time.time() if revoked_at is None else revoked_at
+        with self._lock:
+            if self._revoked_before.get(username, float("-inf")) >= revoked_at:
+                return False
+            for token in list(self._tokens_by_user.get(username, ())):
+                self._drop(token)
+            self._revoked_before[username] = revoked_at
+            self._prune_revocations()
+            return True
+
+    def _prune_revocations(self):
+        horizon = time.time() - ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        for username in [u for u, at in self._revoked_before.items() if at < horizon]:
+            del self._revoked_before[username]
+
+    def is_revoked(self, username: str, issued_at) -> bool:
+        revoked_at = self._revoked_before.get(username)
+        return revoked_at is not None and (issued_at is None or issued_at <= revoked_at)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "revoked_users": len(self._revoked_before),
+            }
+
+identity_cache = IdentityCache()
+
+# --- Shared Revocations ---
+_revocations = TokenRevocation.__table__
+
+def _record_revocation(connection, username: str, revoked_at: float):
+    updated = connection.execute(
+        _revocations.update().where(_revocations.c.username == username).values(revoked_before=revoked_at)
+    )
+    if not updated.rowcount:
+        connection.execute(_revocations.insert().values(username=username, revoked_before=revoked_at))
+
+def invalidate_user(username: str, connection=None):
+    """
+    Call after a password change or account deletion. Takes effect in this
+    worker at once and in the others within AUTH_REVOCATION_SYNC_S, through
+    the token_revocations table (written on `connection` when given, so it
+    commits with the change itself).
+    """
+    revoked_at = time.time()
+    identity_cache.invalidate_user(username, revoked_at)
+    if connection is not None:
+        _record_revocation(connection, username, revoked_at)
+    else:
+        with engine.begin() as conn:
+            _record_revocation(conn, username, revoked_at)
+
+def sync_revocations() -> int:
+    """Applies revocations recorded by other workers and prunes expired ones (blocking); returns how many were new."""
+    horizon = time.time() - ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    # The primary, not the replica: replica lag would delay revocations.
+    with engine.begin() as conn:
+        conn.execute(_revocations.delete().where(_revocations.c.revoked_before < horizon))
+        rows = conn.execute(select(_revocations.c.username, _revocations.c.revoked_before)).all()
+    return sum(identity_cache.invalidate_user(username, revoked_at) for username, revoked_at in rows)
+
+class RevocationSync:
+    """Background task running sync_revocations every AUTH_REVOCATION_SYNC_S in each worker."""
+
+    def __init__(self, interval_s: float = AUTH_REVOCATION_SYNC_S):
+        self.interval_s = interval_s
+        self._task = None
+
+    def start(self):
+        if self.interval_s > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await run_in_threadpool(sync_revocations)
+            except Exception as e:
+                logger.warning(f"Could not sync token revocations. Error: {e}")
+            await asyncio.sleep(self.interval_s)
+
+revocation_sync = RevocationSync()
+
+@event.listens_for(User, "after_update")
+def _invalidate_on_password_change(mapper, connection, target):
+    if inspect(target).attrs.password.history.has_changes():
+        invalidate_user(target.username, connection)
+
+@event.listens_for(User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target):
+    invalidate_user(target.username, connection)
+
 # --- Helper Function to Create JWT Tokens ---
 def create_access_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": now.timestamp()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def _token_claims(user: User) -> dict:
+    claims = {"sub": user.username}
+    if JWT_EMBED_USER_ID:
+        claims["uid"] = user.id
+    return claims
+
+def _throttle(request: Request, username: str = None):
+    """Applies per-IP and per-username token buckets ahead of any bcrypt work."""
+    wait_s = login_ip_limiter.acquire(f"ip:{client_ip(request)}")
+    if not wait_s and username:
+        wait_s = login_user_limiter.acquire(f"user:{username.lower()}")
+    if wait_s:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts. Please wait before trying again.",
+            headers={"Retry-After": str(math.ceil(wait_s))},
+        )
+
+def _hasher_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is busy. Please retry shortly.",
+        headers={"Retry-After": "1"},
+    )
+
+@traced("db", "sql", "find_user")
+def _find_user(db: Session, username: str):
+    return db.query(User).filter(User.username == username).first()
+
+@traced("db", "sql", "create_user")
+def _create_user(db: Session, username: str, hashed_password: str) -> User:
+    user = User(username=username, password=hashed_password)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+@traced("db", "sql", "rehash_password")
+def _rehash_password(db: Session, user_id: int, new_hash: str):
+    # A bulk UPDATE skips the ORM events, so an upgraded hash does not revoke live tokens.
+    db.query(User).filter(User.id == user_id).update({User.password: new_hash}, synchronize_session=False)
+    db.commit()
+
 # --- Signup Endpoint ---
 @router.post("/signup", response_model=TokenOut)
-def signup(payload: UserCreate, db: Session = Depends(get_db)):
+async def signup(payload: UserCreate, request: Request, db: Session = Depends(get_db)):
     """Handles new user registration."""
-    if db.query(User).filter(User.username == payload.username).first():
+    _throttle(request)
+    if await run_in_threadpool(_find_user, db, payload.username):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists")
 
-    hashed_password = pwd_context.hash(payload.password)
-    user = User(username=payload.username, password=hashed_password)
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        with span("auth", "hash_password"):
+            hashed_password = await hasher.hash(payload.password)
+    except HasherBusy:
+        raise _hasher_busy_exception()
+    user = await run_in_threadpool(_create_user, db, payload.username, hashed_password)
 
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data=_token_claims(user))
     return {
         "access_token": access_token,
         "token_type": "bearer",
@@ -65,17 +296,27 @@ def signup(payload: UserCreate, db: Session = Depends(get_db)):
 
 # --- Login Endpoint ---
 @router.post("/login", response_model=TokenOut)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Handles user login and returns a JWT token."""
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not pwd_context.verify(form_data.password, user.password):
+    _throttle(request, form_data.username)
+    user = await run_in_threadpool(_find_user, db, form_data.username)
+    is_valid, new_hash = False, None
+    if user:
+        try:
+            with span("auth", "verify_password"):
+                is_valid, new_hash = await hasher.verify_and_update(form_data.password, user.password)
+        except HasherBusy:
+            raise _hasher_busy_exception()
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        await run_in_threadpool(_rehash_password, db, user.id, new_hash)
 
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data=_token_claims(user))
     return {
         "access_token": access_token,
         "token_type": "bearer",
@@ -84,13 +325,42 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     }
 
 # --- Dependency to Get Current User from Token ---
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Validates the token and returns the corresponding user from the database."""
+def _lookup_user_sync(username: str):
+    db = ReadSessionLocal()
+    try:
+        return db.query(User.id, User.username).filter(User.username == username).first()
+    finally:
+        db.close()
+
+@traced("db", "sql", "lookup_user")
+async def _lookup_user(db, username: str):
+    """Resolves a username on the read path: async session when available, else the threadpool."""
+    if db is not None:
+        result = await db.execute(select(User.id, User.username).where(User.username == username))
+        row = result.first()
+    else:
+        row = await run_in_threadpool(_lookup_user_sync, username)
+    return AuthenticatedUser(id=row.id, username=row.username) if row else None
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_async_read_db)) -> AuthenticatedUser:
+    """
+    Validates the token and returns the caller's identity. Identities are cached
+    per token for AUTH_CACHE_TTL_S; tokens carrying a `uid` claim skip the database.
+    """
+    with span("auth", "resolve_identity"):
+        return await _resolve_identity(token, db)
+
+async def _resolve_identity(token: str, db) -> AuthenticatedUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if identity_cache.enabled:
+        cached = identity_cache.get(token)
+        if cached is not None:
+            return cached
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -98,8 +368,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    if identity_cache.is_revoked(username, payload.get("iat")):
         raise credentials_exception
-    return user
+
+    uid = payload.get("uid")
+    if uid is not None:
+        identity = AuthenticatedUser(id=uid, username=username)
+    else:
+        identity = await _lookup_user(db, username)
+        if identity is None:
+            raise credentials_exception
+    identity_cache.put(token, identity, token_exp=payload.get("exp"))
+    return identity
@@ -0,0 +1,203 @@
+import os
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Cache Configuration ---
+CAPTION_CACHE_SIZE = int(os.getenv("CAPTION_CACHE_SIZE", "1024"))
+CAPTION_CACHE_PHASH = os.getenv("CAPTION_CACHE_PHASH", "0").lower() in ("1", "true", "yes")
+CAPTION_CACHE_PHASH_DISTANCE = int(os.getenv("CAPTION_CACHE_PHASH_DISTANCE", "4"))
+CAPTION_CACHE_DIR = os.getenv("CAPTION_CACHE_DIR")
+CAPTION_CACHE_REDIS_URL = os.getenv("CAPTION_CACHE_REDIS_URL")
+CAPTION_CACHE_REDIS_TTL_S = int(os.getenv("CAPTION_CACHE_REDIS_TTL_S", str(7 * 24 * 3600)))
+
+# Images are normalized to the resolution BLIP actually sees before hashing,
+# so re-encodes and metadata-only changes of the same photo share a key.
+NORMALIZED_SIZE = (384, 384)
+
+
+# --- Image Fingerprints ---
+def content_hash(image) -> str:
+    """SHA-256 of the RGB pixels after normalizing to the captioner's input size."""
+    from PIL import Image
+
+    normalized = image.convert("RGB").resize(NORMALIZED_SIZE, Image.BILINEAR)
+    return hashlib.sha256(normalized.tobytes()).hexdigest()
+
+
+def perceptual_hash(image) -> int:
+    """64-bit difference hash (dHash) used to match near-duplicate uploads."""
+    from PIL import Image
+
+    gray = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# --- Second-Tier Stores ---
+class DiskCaptionStore:
+    """Stores one caption per file, sharded by the first two hex digits of the key."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, caption: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(caption)
+        os.replace(tmp_path, path)
+
+
+class RedisCaptionStore:
+    """Works with any Redis-protocol server (Redis, KeyDB, Valkey, ...)."""
+
+    def __init__(self, url: str, ttl_s: int = CAPTION_CACHE_REDIS_TTL_S):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.ttl_s = ttl_s
+
+    def get(self, key: str):
+        return self.client.get(f"caption:{key}")
+
+    def set(self, key: str, caption: str):
+        self.client.set(f"caption:{key}", caption, ex=self.ttl_s)
+
+
+# --- Two-Tier Caption Cache ---
+class CaptionCache:
+    """
+    Content-addressed cache of BLIP captions.
+
+    The first tier is a size-bounded in-process LRU; an optional second tier
+    (disk or Redis) survives restarts and is shared between workers. When
+    perceptual hashing is enabled, a miss on the exact key falls back to the
+    closest in-process entry within `phash_distance` bits.
+    """
+
+    def __init__(self, max_entries: int = CAPTION_CACHE_SIZE, store=None,
+                 use_phash: bool = CAPTION_CACHE_PHASH, phash_distance: int = CAPTION_CACHE_PHASH_DISTANCE):
+        self.max_entries = max(1, max_entries)
+        self.store = store
+        self.use_phash = use_phash
+        self.phash_distance = phash_distance
+        self._entries = OrderedDict()  # key -> (caption, phash)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def fingerprint(self, image) -> tuple:
+        return content_hash(image), (perceptual_hash(image) if self.use_phash else None)
+
+    def get(self, fingerprint: tuple):
+        key, phash = fingerprint
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if phash is not None:
+                for other_key, (caption, other_phash) in reversed(self._entries.items()):
+                    if other_phash is not None and _hamming(phash, other_phash) <= self.phash_distance:
+                        self._entries.move_to_end(other_key)
+                        self.near_hits += 1
+                        return caption
+
+        if self.store is not None:
+            try:
+                caption = self.store.get(key)
+            except Exception as e:
+                logger.warning(f"Caption cache store lookup failed. Error: {e}")
+                caption = None
+            if caption is not None:
+                with self._lock:
+                    self.store_hits += 1
+                    self._insert(key, caption, phash)
+                return caption
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, fingerprint: tuple, caption: str):
+        key, phash = fingerprint
+        with self._lock:
+            self._insert(key, caption, phash)
+        if self.store is not None:
+            try:
+                self.store.set(key, caption)
+            except Exception as e:
+                logger.warning(f"Caption cache store write failed. Error: {e}")
+
+    def lookup(self, image) -> tuple:
+        """Fingerprints an image and returns (fingerprint, cached caption or None)."""
+        fingerprint = self.fingerprint(image)
+        return fingerprint, self.get(fingerprint)
+
+    def _insert(self, key: str, caption: str, phash):
+        self._entries[key] = (caption, phash)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total_hits = self.hits + self.near_hits + self.store_hits
+            lookups = total_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(total_hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _build_store():
+    try:
+        if CAPTION_CACHE_REDIS_URL:
+            return RedisCaptionStore(CAPTION_CACHE_REDIS_URL)
+        if CAPTION_CACHE_DIR:
+            return DiskCaptionStore(CAPTION_CACHE_DIR)
+    except Exception as e:
+        logger.warning(f"Could not initialize caption cache store. Using in-process cache only. Error: {e}")
+    return None
+
+
+cache = CaptionCache(store=_build_store())
@@ -0,0 +1,284 @@
+import os
+import logging
+import time
+import queue
+import asyncio
+import threading
+from dotenv import load_dotenv
+
+from .model_registry import registry, resolve_model_source
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Captioning Configuration ---
+CAPTION_MODEL = "Salesforce/blip-image-captioning-base"
+CAPTION_MAX_NEW_TOKENS = 50
+CAPTION_MAX_BATCH_SIZE = int(os.getenv("CAPTION_MAX_BATCH_SIZE", "8"))
+CAPTION_MAX_WAIT_MS = float(os.getenv("CAPTION_MAX_WAIT_MS", "25"))
+CAPTION_QUEUE_SIZE = int(os.getenv("CAPTION_QUEUE_SIZE", "32"))
+CAPTION_RETRY_AFTER_S = int(os.getenv("CAPTION_RETRY_AFTER_S", "2"))
+
+# --- Inference Backend Configuration ---
+# fp32: stock model | int8: dynamic int8 quantization of nn.Linear layers
+# torchscript / onnx: traced or ONNX-exported vision encoder (text decoder stays in torch)
+CAPTION_BACKENDS = ("fp32", "int8", "torchscript", "onnx")
+CAPTION_BACKEND = os.getenv("CAPTION_BACKEND", "fp32").lower()
+CAPTION_NUM_THREADS = int(os.getenv("CAPTION_NUM_THREADS", "0"))  # 0 keeps torch's default
+CAPTION_ONNX_PATH = os.getenv("CAPTION_ONNX_PATH", os.path.join(".model_cache", "blip_vision.onnx"))
+CAPTION_IMAGE_SIZE = 384
+
+
+class CaptionQueueFull(Exception):
+    """Raised when the captioning queue cannot accept more images."""
+
+
+class CaptionModelUnavailable(RuntimeError):
+    """Raised for queued images when the BLIP model could not be loaded."""
+
+
+def _set_result(future: asyncio.Future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _set_exception(future: asyncio.Future, exc: Exception):
+    if not future.done():
+        future.set_exception(exc)
+
+
+class CaptionEngine:
+    """
+    Runs BLIP captioning on a dedicated worker thread.
+
+    Requests are placed on a bounded queue; the worker gathers whatever arrives
+    within `max_wait_ms` (up to `max_batch_size` images) into a single
+    `generate` call and resolves each caller's future on its own event loop.
+    """
+
+    def __init__(self, model_name: str, max_batch_size: int = CAPTION_MAX_BATCH_SIZE,
+                 max_wait_ms: float = CAPTION_MAX_WAIT_MS, queue_size: int = CAPTION_QUEUE_SIZE):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """False only once the model has failed to load; it may still be loading."""
+        return not registry.is_failed(self.model_name)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        """Starts the worker thread if it is not already running."""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                apply_num_threads()
+                self._worker = threading.Thread(target=self._run, name="caption-worker", daemon=True)
+                self._worker.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Signals the worker thread to exit after draining its current batch."""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None and worker.is_alive():
+            self._queue.put(None)
+            worker.join(timeout)
+
+    def submit(self, image) -> asyncio.Future:
+        """Queues an RGB PIL image and returns a future for its caption."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            self._queue.put_nowait((image, future, loop))
+        except queue.Full:
+            raise CaptionQueueFull(f"Caption queue is full ({self._queue.maxsize} pending).")
+        return future
+
+    async def caption(self, image) -> str:
+        return await self.submit(image)
+
+    # --- Worker Internals ---
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the sentinel back so the loop exits after this batch.
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _generate(self, images: list) -> list:
+        loaded = registry.get(self.model_name)
+        if loaded is None:
+            raise CaptionModelUnavailable("BLIP captioning model is not available.")
+        processor, model = loaded
+        return generate_captions(processor, model, images)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Skip work for callers that have already gone away.
+            batch = [item for item in batch if not item[1].cancelled()]
+            if not batch:
+                continue
+            try:
+                captions = self._generate([image for image, _, _ in batch])
+            except Exception as e:
+                logger.error(f"BLIP captioning batch of {len(batch)} failed. Error: {e}")
+                for _, future, loop in batch:
+                    loop.call_soon_threadsafe(_set_exception, future, e)
+                continue
+            for (_, future, loop), caption in zip(batch, captions):
+                loop.call_soon_threadsafe(_set_result, future, caption)
+
+
+# --- Inference Backends ---
+def generate_captions(processor, model, images: list) -> list:
+    """Captions a batch of RGB PIL images with autograd fully disabled."""
+    import torch
+
+    inputs = processor(images=images, return_tensors="pt")
+    with torch.inference_mode():
+        out = model.generate(**inputs, max_new_tokens=CAPTION_MAX_NEW_TOKENS)
+    return processor.batch_decode(out, skip_special_tokens=True)
+
+
+def _wrap_vision_encoder(run):
+    """
+    Returns an nn.Module that stands in for `model.vision_model`, calling
+    `run(pixel_values) -> (last_hidden_state, pooler_output)` and restoring the
+    output type that BLIP's `generate` expects.
+    """
+    import torch
+    from transformers.modeling_outputs import BaseModelOutputWithPooling
+
+    class _ExportedVisionEncoder(torch.nn.Module):
+        def forward(self, pixel_values=None, **kwargs):
+            last_hidden_state, pooler_output = run(pixel_values)
+            return BaseModelOutputWithPooling(last_hidden_state=last_hidden_state, pooler_output=pooler_output)
+
+    return _ExportedVisionEncoder()
+
+
+def _vision_tuple_module(vision_model):
+    import torch
+
+    class _VisionTuple(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.vision_model = vision_model
+
+        def forward(self, pixel_values):
+            out = self.vision_model(pixel_values=pixel_values, return_dict=False)
+            return out[0], out[1]
+
+    return _VisionTuple().eval()
+
+
+def _example_pixels():
+    import torch
+    return torch.zeros(1, 3, CAPTION_IMAGE_SIZE, CAPTION_IMAGE_SIZE)
+
+
+def _to_torchscript(model):
+    import torch
+
+    with torch.inference_mode():
+        traced = torch.jit.trace(_vision_tuple_module(model.vision_model), _example_pixels(), check_trace=False)
+    traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+    model.vision_model = _wrap_vision_encoder(traced)
+    return model
+
+
+def _to_onnx(model):
+    import torch
+    import onnxruntime as ort
+
+    if not os.path.exists(CAPTION_ONNX_PATH):
+        os.makedirs(os.path.dirname(CAPTION_ONNX_PATH) or ".", exist_ok=True)
+        torch.onnx.export(
+            _vision_tuple_module(model.vision_model), (_example_pixels(),), CAPTION_ONNX_PATH,
+            input_names=["pixel_values"], output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "last_hidden_state": {0: "batch"}, "pooler_output": {0: "batch"}},
+            opset_version=17,
+        )
+    options = ort.SessionOptions()
+    if CAPTION_NUM_THREADS > 0:
+        options.intra_op_num_threads = CAPTION_NUM_THREADS
+    session = ort.InferenceSession(CAPTION_ONNX_PATH, options, providers=["CPUExecutionProvider"])
+
+    def run(pixel_values):
+        hidden, pooled = session.run(None, {"pixel_values": pixel_values.numpy()})
+        return torch.from_numpy(hidden), torch.from_numpy(pooled)
+
+    model.vision_model = _wrap_vision_encoder(run)
+    return model
+
+
+def apply_inference_backend(model, backend: str):
+    """Converts an fp32 BLIP model to the selected CPU inference backend."""
+    import torch
+
+    if backend not in CAPTION_BACKENDS:
+        raise ValueError(f"Unknown CAPTION_BACKEND '{backend}'. Expected one of {CAPTION_BACKENDS}.")
+    if backend == "int8":
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "torchscript":
+        return _to_torchscript(model)
+    if backend == "onnx":
+        return _to_onnx(model)
+    return model
+
+
+# --- Lazy Model Loading ---
+def apply_num_threads():
+    """
+    Sizes torch's intra-op pool for this process. Called when the caption worker
+    starts rather than at load, so a pre-fork master can load the model single-threaded.
+    """
+    if CAPTION_NUM_THREADS <= 0:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(CAPTION_NUM_THREADS)
+
+
+def load_captioner(backend: str = CAPTION_BACKEND):
+    """Loads the BLIP processor and model; transformers is only imported here."""
+    import torch
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+
+    source, local_only = resolve_model_source(CAPTION_MODEL)
+    processor = BlipProcessor.from_pretrained(source, local_files_only=local_only)
+    model = BlipForConditionalGeneration.from_pretrained(source, local_files_only=local_only)
+    model.eval()
+    model = apply_inference_backend(model, backend)
+    logger.info(f"BLIP captioner using the '{backend}' inference backend.")
+    return processor, model
+
+
+# An onnxruntime session starts its thread pool when created, and forked workers would inherit it dead.
+registry.register("blip", load_captioner, fork_safe=CAPTION_BACKEND != "onnx")
+engine = CaptionEngine("blip")
@@ -0,0 +1,175 @@
+import os
+import logging
+import time
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+from . import mongo_memory
+from . import llm_service
+from . import memory_retrieval
+from .observability import traced
+from .prompts import count_tokens, message_tokens
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Context Budget Configuration ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_FETCH_LIMIT = int(os.getenv("CONTEXT_FETCH_LIMIT", "50"))
+CONTEXT_SUMMARY_MAX_WORDS = int(os.getenv("CONTEXT_SUMMARY_MAX_WORDS", "200"))
+# Older messages are only folded into the summary once this many have accumulated.
+CONTEXT_SUMMARY_MIN_BATCH = int(os.getenv("CONTEXT_SUMMARY_MIN_BATCH", "4"))
+
+_summarizing = set()  # user_ids with a summary refresh in flight
+_summary_tasks = set()  # strong references: the event loop only keeps weak ones to running tasks
+
+
+def _summary_message(summary: str) -> dict:
+    return {"role": "system", "content": f"Summary of the earlier conversation with this user: {summary}"}
+
+
+def _memory_message(exchanges: list) -> dict:
+    lines = "\n\n".join(exchanges)
+    return {"role": "system", "content": f"Relevant earlier exchanges with this user:\n\n{lines}"}
+
+
+@traced("stage", "retrieval")
+async def _retrieve_memories(user_id: str, prompt: str) -> tuple:
+    """Returns (candidate exchanges, elapsed ms); retrieval failures degrade to no memories."""
+    start = time.perf_counter()
+    try:
+        # Over-fetch: candidates already in the verbatim window are dropped later.
+        candidates = await run_in_threadpool(
+            memory_retrieval.retrieve, user_id, prompt, memory_retrieval.MEMORY_TOP_K * 2
+        )
+    except Exception as e:
+        logger.warning(f"Long-term memory retrieval failed. Error: {e}")
+        candidates = []
+    return candidates, round((time.perf_counter() - start) * 1000, 1)
+
+
+def _select_memories(candidates: list, cutoff, cap: int) -> list:
+    """Picks the best candidates older than `cutoff` that fit within `cap` tokens."""
+    cutoff_ts = cutoff.timestamp() if cutoff is not None else None
+    selected, used = [], 0
+    for candidate in candidates:
+        ts = candidate["timestamp"]
+        if cutoff_ts is not None and ts is not None and ts >= cutoff_ts:
+            continue
+        cost = count_tokens(candidate["text"]) + 2  # blank-line separator
+        if used + cost > cap:
+            continue
+        selected.append(candidate["text"])
+        used += cost
+        if len(selected) == memory_retrieval.MEMORY_TOP_K:
+            break
+    return selected
+
+
+async def build_context(user_id: str, budget: int = CONTEXT_TOKEN_BUDGET, prompt: str = None) -> dict:
+    """
+    Builds the conversation history for the LLM within a token budget.
+
+    The stored rolling summary (if any) comes first, followed by as many of the
+    most recent messages as fit verbatim. Messages that fall out of the verbatim
+    window are folded into the summary in the background (once
+    CONTEXT_SUMMARY_MIN_BATCH have accumulated), so later requests reuse it
+    instead of resending or re-summarizing the raw turns. Until a message is
+    covered by the summary it stays verbatim, even past the budget, so the
+    model never loses it.
+
+    With a `prompt`, past exchanges relevant to it are retrieved from long-term
+    memory (concurrently with the history reads) and added last, using at most
+    MEMORY_TOKEN_CAP tokens of the budget. They change with every prompt, so
+    keeping them after the turns leaves the summary and turns a stable prefix.
+    """
+    retrieval = None
+    if prompt and memory_retrieval.MEMORY_RETRIEVAL_ENABLED:
+        retrieval = asyncio.create_task(_retrieve_memories(user_id, prompt))
+    recent, summary_doc = await asyncio.gather(
+        mongo_memory.get_recent_messages(user_id, CONTEXT_FETCH_LIMIT),
+        mongo_memory.get_summary(user_id),
+    )
+    candidates, retrieval_ms = await retrieval if retrieval is not None else ([], None)
+    summary = summary_doc["summary"] if summary_doc else ""
+    covered_until = summary_doc["covered_until"] if summary_doc else None
+    summarized_count = summary_doc.get("message_count", 0) if summary_doc else 0
+
+    messages = []
+    used = 0
+    if summary:
+        messages.append(_summary_message(summary))
+        used += message_tokens(messages[0])
+
+    # Hold back room for retrieved memories so recent turns cannot crowd them out.
+    reserved = 0
+    header = message_tokens(_memory_message([]))
+    if candidates:
+        reserved = min(memory_retrieval.MEMORY_TOKEN_CAP, max(0, budget - used) // 2,
+                       header + sum(count_tokens(c["text"]) + 2 for c in candidates))
+
+    # Walk backwards from the newest message while it still fits the budget.
+    verbatim = []
+    for message in reversed(recent):
+        cost = message_tokens(message)
+        if used + reserved + cost > budget:
+            break
+        verbatim.append(message)
+        used += cost
+    verbatim.reverse()
+
+    overflow = recent[:len(recent) - len(verbatim)]
+    unsummarized = [m for m in overflow if covered_until is None or m["timestamp"] > covered_until]
+    # These directly precede the window; without them the model would see them nowhere.
+    verbatim = unsummarized + verbatim
+    used += sum(message_tokens(m) for m in unsummarized)
+
+    messages.extend({"role": m["role"], "content": m["content"]} for m in verbatim)
+    memories = []
+    if reserved:
+        cutoff = verbatim[0]["timestamp"] if verbatim else None
+        memories = _select_memories(candidates, cutoff, reserved - header)
+        if memories:
+            messages.append(_memory_message(memories))
+            used += message_tokens(messages[-1])
+
+    if len(unsummarized) >= CONTEXT_SUMMARY_MIN_BATCH and user_id not in _summarizing:
+        _summarizing.add(user_id)
+        task = asyncio.create_task(_refresh_summary(user_id, summary, summarized_count, unsummarized))
+        _summary_tasks.add(task)
+        task.add_done_callback(_summary_tasks.discard)
+
+    raw_tokens = sum(message_tokens(m) for m in recent)
+    return {
+        "messages": messages,
+        "report": {
+            "budget": budget,
+            "tokens_used": used,
+            "tokens_saved": max(0, raw_tokens - used),
+            "verbatim_messages": len(verbatim),
+            "summarized": bool(summary),
+            "pending_summary_messages": len(unsummarized),
+            "retrieved_memories": len(memories),
+            "retrieval_ms": retrieval_ms,
+        },
+    }
+
+
+@traced("stage", "summarize")
+async def _refresh_summary(user_id: str, previous_summary: str, previous_count: int, new_messages: list):
+    """Folds newly overflowed messages into the user's stored rolling summary."""
+    try:
+        summary = await run_in_threadpool(
+            llm_service.summarize_conversation, previous_summary, new_messages, CONTEXT_SUMMARY_MAX_WORDS
+        )
+        if summary and summary != previous_summary:
+            await mongo_memory.save_summary(
+                user_id, summary,
+                covered_until=new_messages[-1]["timestamp"],
+                message_count=previous_count + len(new_messages),
+            )
+    except Exception as e:
+        logger.error(f"Failed to refresh conversation summary. Error: {e}")
+    finally:
+        _summarizing.discard(user_id)
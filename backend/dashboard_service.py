@@ -1,16 +1,125 @@
-from fastapi import APIRouter, Depends
-from typing import List, Dict, Any
+import io
+import csv
+import json
+import base64
+import hashlib
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
 
-from .mongo_memory import get_full_history_for_dashboard
-from .auth import get_current_user
-from .sql import User 
+from .mongo_memory import get_history_page, iter_history
+from .auth import get_current_user, AuthenticatedUser
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
 
-@router.get("/history", response_model=List[Dict[str, Any]])
-def get_user_history(current_user: User = Depends(get_current_user)):
-    """Fetches the complete conversation history for the logged-in user."""
+MAX_PAGE_SIZE = 200
+EXPORT_FIELDS = ["id", "timestamp", "role", "content"]
+
+# --- Pydantic Schemas ---
+class HistoryPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None  # pass as `before` to load older messages
+    prev_cursor: Optional[str] = None  # pass as `after` to load newer messages
+    has_more: bool
+
+# --- Cursor Helpers ---
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps({"t": doc["timestamp"].isoformat(), "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    from bson import ObjectId
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(data["t"]), ObjectId(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+
+def _serialize(doc: dict) -> dict:
+    """Replaces the ObjectId with a string `id` and drops internal fields."""
+    item = {k: v for k, v in doc.items() if k not in ("_id", "user_id")}
+    item["id"] = str(doc["_id"])
+    return item
+
+def _etag(page: dict) -> str:
+    """Covers the pagination fields too: a page whose items are unchanged can still gain a next page."""
+    digest = hashlib.sha1(f"{page['has_more']}|{page['next_cursor']}|{page['prev_cursor']};".encode())
+    for item in page["items"]:
+        digest.update(f"{item['id']}|{item.get('timestamp')}|{len(item.get('content', ''))};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+# --- Endpoints ---
+@router.get("/history", response_model=HistoryPage)
+async def get_user_history(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = Query(None, description="Cursor: return messages older than this one"),
+    after: Optional[str] = Query(None, description="Cursor: return messages newer than this one"),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Fetches one newest-first page of the logged-in user's conversation history."""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both.")
     user_id_str = str(current_user.id)
-    # Fetch a larger limit for the dashboard view
-    history = get_full_history_for_dashboard(user_id_str, limit=100)
-    return history
+    # Fetch one extra document to learn whether another page exists.
+    docs = await get_history_page(
+        user_id_str, limit + 1,
+        before=decode_cursor(before) if before else None,
+        after=decode_cursor(after) if after else None,
+    )
+    has_more = len(docs) > limit
+    if has_more:
+        # Newest-first: the extra doc is the oldest for `before`, the newest for `after`.
+        docs = docs[1:] if after else docs[:limit]
+
+    page = {
+        "items": jsonable_encoder([_serialize(d) for d in docs]),
+        "next_cursor": encode_cursor(docs[-1]) if docs and (has_more or after) else None,
+        "prev_cursor": encode_cursor(docs[0]) if docs and (before or (after and has_more)) else None,
+        "has_more": has_more,
+    }
+    etag = _etag(page)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return page
+
+@router.get("/export")
+async def export_user_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Streams the user's entire history as NDJSON or CSV, straight from the database cursor."""
+    user_id_str = str(current_user.id)
+
+    async def ndjson_rows():
+        async for doc in iter_history(user_id_str):
+            yield json.dumps(jsonable_encoder(_serialize(doc))) + "\n"
+
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        async for doc in iter_history(user_id_str):
+            writer.writerow(jsonable_encoder(_serialize(doc)))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    if format == "csv":
+        media_type, rows, extension = "text/csv", csv_rows(), "csv"
+    else:
+        media_type, rows, extension = "application/x-ndjson", ndjson_rows(), "ndjson"
+    return StreamingResponse(
+        rows,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="health_history.{extension}"'},
+    )
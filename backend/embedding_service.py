@@ -0,0 +1,88 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from dotenv import load_dotenv
+
+from .model_registry import registry, resolve_model_source
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Embedding Configuration ---
+# "sentence-transformers" loads EMBEDDING_MODEL; "hashing" is a dependency-free local
+# fallback (signed feature hashing of word unigrams/bigrams); "auto" prefers the model.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "auto").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_warned_fallback = False
+_register_lock = threading.Lock()
+
+
+def _hashing_embed(texts: list, dim: int = EMBEDDING_DIM) -> list:
+    import numpy as np
+
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD_RE.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            out[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (out / norms).tolist()
+
+
+def _load_sentence_transformer():
+    from sentence_transformers import SentenceTransformer
+
+    source, _ = resolve_model_source(EMBEDDING_MODEL)
+    return SentenceTransformer(source, device="cpu")
+
+
+def register_model():
+    """
+    Registers the embedding model so it is preloaded and warmed up with the others.
+    Called by the features that embed text (semantic cache, long-term memory) when
+    they are enabled, so stock deployments never load or download it.
+    """
+    if EMBEDDING_BACKEND not in ("auto", "sentence-transformers"):
+        return
+    with _register_lock:
+        if "embedder" not in registry:
+            registry.register("embedder", _load_sentence_transformer)
+
+
+def embed_texts(texts: list) -> list:
+    """Embeds a batch of texts into L2-normalized vectors (blocking; call from a worker thread)."""
+    if not texts:
+        return []
+    if EMBEDDING_BACKEND != "hashing":
+        register_model()
+        model = registry.get("embedder")
+        if model is not None:
+            vectors = model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True)
+            return vectors.tolist()
+        if EMBEDDING_BACKEND == "sentence-transformers":
+            raise RuntimeError("Embedding model is not available.")
+        _warn_fallback()
+    return _hashing_embed(texts)
+
+
+def _warn_fallback():
+    global _warned_fallback
+    if not _warned_fallback:
+        _warned_fallback = True
+        logger.warning(f"Embedding model '{EMBEDDING_MODEL}' is unavailable (is sentence-transformers installed?); "
+                       "using hashing embeddings, which only match shared words. "
+                       "Set EMBEDDING_BACKEND=hashing to silence this.")
+
+
+def embed_text(text: str) -> list:
+    return embed_texts([text])[0]
@@ -0,0 +1,155 @@
+import time
+from fastapi import APIRouter
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from fastapi.responses import JSONResponse
+
+from .model_registry import registry, STATUS_NOT_LOADED, STATUS_LOADING, STATUS_READY, STATUS_FAILED
+from .caption_cache import cache as caption_cache
+from . import caption_service
+from . import llm_service
+from .prompts import prompt_stats
+from . import speech_service
+from .password_service import hasher
+from .rate_limit import login_user_limiter, login_ip_limiter
+from .sql import pool_stats
+from .semantic_cache import cache as semantic_cache
+from . import memory_retrieval
+from .provider_client import provider
+from .jobs_service import runner as job_runner
+from .auth import identity_cache
+from .observability import register_collector
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+STARTED_AT = time.time()
+
+@router.get("/live")
+def liveness():
+    """Reports that the process is up and serving requests."""
+    return {"status": "alive", "uptime_s": round(time.time() - STARTED_AT, 3)}
+
+@router.get("/ready")
+def readiness():
+    """Reports per-model load state; returns 503 until warm-up has finished."""
+    models = registry.snapshot()
+    ready = registry.is_ready()
+    body = {
+        "status": "ready" if ready else "warming_up",
+        "degraded": any(m["status"] == "failed" for m in models.values()),
+        "models": models,
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@router.get("/stats")
+def service_stats():
+    """Reports queue depths and cache counters for the inference path."""
+    return {
+        "caption_queue_depth": caption_service.engine.queue_depth,
+        "caption_cache": caption_cache.stats(),
+        "llm_time_to_first_token": llm_service.ttft_summary(),
+        "prompts": prompt_stats.stats(),
+        "speech": speech_service.stats(),
+        "password_hashing": hasher.stats(),
+        "login_throttled": {"user": login_user_limiter.throttled, "ip": login_ip_limiter.throttled},
+        "db_pools": pool_stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "identity_cache": identity_cache.stats(),
+        "memory_indexer": memory_retrieval.indexer.stats(),
+        "memory_retrieval": memory_retrieval.retrieval_summary(),
+        "provider": provider.stats(),
+        "jobs": job_runner.stats(),
+    }
+
+
+# --- Prometheus Collector ---
+_MODEL_STATES = (STATUS_NOT_LOADED, STATUS_LOADING, STATUS_READY, STATUS_FAILED)
+
+
+class ServiceStatsCollector:
+    """Exposes the /stats counters as Prometheus metrics, read fresh on every scrape."""
+
+    def collect(self):
+        queue_depth = GaugeMetricFamily("model_queue_depth", "Items waiting for a worker.", labels=["queue"])
+        queue_depth.add_metric(["caption"], caption_service.engine.queue_depth)
+        queue_depth.add_metric(["memory_indexer"], memory_retrieval.indexer.stats()["queue_depth"])
+        queue_depth.add_metric(["jobs"], job_runner.queue_depth)
+        queue_depth.add_metric(["password_hashing"], hasher.stats()["queue_depth"])
+        yield queue_depth
+
+        running = GaugeMetricFamily("jobs_running", "Background jobs currently executing.")
+        running.add_metric([], job_runner.stats()["running"])
+        yield running
+
+        speech = speech_service.stats()
+        audio_bytes = CounterMetricFamily("stt_audio_bytes", "Recording bytes received vs uploaded to the STT provider.",
+                                          labels=["direction"])
+        audio_bytes.add_metric(["received"], speech["input_bytes"])
+        audio_bytes.add_metric(["sent"], speech["sent_bytes"])
+        yield audio_bytes
+
+        caption, semantic, identity = caption_cache.stats(), semantic_cache.stats(), identity_cache.stats()
+        lookups = CounterMetricFamily("cache_lookups", "Cache lookups by outcome.", labels=["cache", "result"])
+        for result in ("hits", "near_hits", "store_hits", "misses"):
+            lookups.add_metric(["caption", result], caption[result])
+        for result in ("hits", "misses", "bypassed"):
+            lookups.add_metric(["semantic", result], semantic[result])
+        for result in ("hits", "misses"):
+            lookups.add_metric(["identity", result], identity[result])
+        yield lookups
+
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Hits over lookups since start.", labels=["cache"])
+        ratio.add_metric(["caption"], caption["hit_ratio"])
+        ratio.add_metric(["semantic"], semantic["hit_rate"])
+        ratio.add_metric(["identity"], identity["hit_ratio"])
+        yield ratio
+
+        entries = GaugeMetricFamily("cache_entries", "Entries held in process.", labels=["cache"])
+        entries.add_metric(["caption"], caption["entries"])
+        entries.add_metric(["semantic"], semantic["entries"])
+        entries.add_metric(["identity"], identity["entries"])
+        yield entries
+
+        in_use = GaugeMetricFamily("db_pool_connections_in_use", "Checked-out connections.", labels=["pool"])
+        capacity = GaugeMetricFamily("db_pool_capacity", "Pool size plus overflow.", labels=["pool"])
+        timeouts = CounterMetricFamily("db_pool_checkout_timeouts", "Checkouts that timed out waiting for a free connection.",
+                                       labels=["pool"])
+        errors = CounterMetricFamily("db_pool_checkout_errors", "Checkouts that failed for any other reason.",
+                                     labels=["pool"])
+        for name, pool in pool_stats().items():
+            if "in_use" in pool:
+                in_use.add_metric([name], pool["in_use"])
+                capacity.add_metric([name], pool["capacity"])
+            timeouts.add_metric([name], pool["timeouts"])
+            errors.add_metric([name], pool["errors"])
+        yield in_use
+        yield capacity
+        yield timeouts
+        yield errors
+
+        provider_stats = provider.stats()
+        breakers = provider_stats.pop("breakers")
+        events = CounterMetricFamily("provider_events", "Provider client calls, retries and fallbacks.", labels=["event"])
+        for event, count in provider_stats.items():
+            events.add_metric([event], count)
+        yield events
+        circuit = GaugeMetricFamily("provider_circuit_open", "1 while a breaker is open or half-open.", labels=["breaker"])
+        for name, breaker in breakers.items():
+            circuit.add_metric([name], 0 if breaker["state"] == "closed" else 1)
+        yield circuit
+
+        prompt_tokens = CounterMetricFamily("llm_prompt_tokens", "Prompt tokens sent to the LLM by system prompt "
+                                            "variant; cached_prefix repeats the user's previous request.",
+                                            labels=["variant", "kind"])
+        for variant, v in prompt_stats.stats()["variants"].items():
+            prompt_tokens.add_metric([variant, "total"], v["prompt_tokens"])
+            prompt_tokens.add_metric([variant, "cached_prefix"], v["cached_prefix_tokens"])
+        yield prompt_tokens
+
+        models = GaugeMetricFamily("model_status", "1 for each model's current load state.", labels=["model", "status"])
+        for name, model in registry.snapshot().items():
+            for state in _MODEL_STATES:
+                models.add_metric([name, state], 1 if model["status"] == state else 0)
+        yield models
+
+
+register_collector(ServiceStatsCollector())
@@ -0,0 +1,423 @@
+import os
+import logging
+import json
+import time
+import uuid
+import shutil
+import asyncio
+from collections import deque, Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import func
+from starlette.datastructures import Headers
+
+from .auth import get_current_user, AuthenticatedUser
+from .sql import SessionLocal, Job, User
+from .upload_limits import check_upload, UPLOAD_MAX_IMAGE_BYTES, UPLOAD_MAX_AUDIO_BYTES
+from . import query_service
+from .observability import traced, observe, request_id_var, latency_summary
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/jobs", tags=["Background Jobs"])
+
+# --- Job Configuration ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("JOB_MAX_ACTIVE_PER_USER", "2"))  # queued + running
+JOB_TIMEOUT_S = float(os.getenv("JOB_TIMEOUT_S", "180"))
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", ".job_spool")
+JOB_MAX_WAIT_S = 30.0  # longest long-poll a client may request
+JOB_POLL_INTERVAL_S = 1.0  # re-read interval while long-polling (jobs may run in another process)
+
+ACTIVE_STATUSES = ("queued", "running")
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+# --- Pydantic Schemas ---
+class JobOut(BaseModel):
+    id: str
+    status: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    queue_wait_ms: Optional[float] = None
+    processing_ms: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+
+def _aware(dt: datetime):
+    """SQLite returns naive datetimes; everything here is stored in UTC."""
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _elapsed_ms(start: datetime, end: datetime):
+    if start is None or end is None:
+        return None
+    return round((_aware(end) - _aware(start)).total_seconds() * 1000, 1)
+
+
+def _job_out(job: Job) -> JobOut:
+    return JobOut(
+        id=job.id,
+        status=job.status,
+        created_at=_aware(job.created_at),
+        started_at=_aware(job.started_at),
+        finished_at=_aware(job.finished_at),
+        queue_wait_ms=_elapsed_ms(job.created_at, job.started_at),
+        processing_ms=_elapsed_ms(job.started_at, job.finished_at),
+        result=json.loads(job.result) if job.result else None,
+        error=job.error,
+    )
+
+
+# --- Job Table Access (blocking; called via the threadpool) ---
+@traced("db", "sql", "create_job")
+def _create_job(job: Job, max_active: int) -> bool:
+    """Inserts `job` unless the user already has `max_active` unfinished jobs."""
+    db = SessionLocal()
+    try:
+        # Locking the user's row serializes concurrent submits, so the count and insert act as one step.
+        db.query(User.id).filter(User.id == job.user_id).with_for_update().first()
+        active = db.query(func.count(Job.id)).filter(
+            Job.user_id == job.user_id, Job.status.in_(ACTIVE_STATUSES)
+        ).scalar()
+        if active >= max_active:
+            return False
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        db.expunge(job)
+        return True
+    finally:
+        db.close()
+
+
+@traced("db", "sql", "get_job")
+def _get_job(job_id: str, user_id: int = None):
+    db = SessionLocal()
+    try:
+        query = db.query(Job).filter(Job.id == job_id)
+        if user_id is not None:
+            query = query.filter(Job.user_id == user_id)
+        job = query.first()
+        if job is not None:
+            db.expunge(job)
+        return job
+    finally:
+        db.close()
+
+
+@traced("db", "sql", "list_jobs")
+def _list_jobs(user_id: int, limit: int) -> list:
+    db = SessionLocal()
+    try:
+        jobs = db.query(Job).filter(Job.user_id == user_id).order_by(Job.created_at.desc()).limit(limit).all()
+        for job in jobs:
+            db.expunge(job)
+        return jobs
+    finally:
+        db.close()
+
+
+@traced("db", "sql", "transition_job")
+def _transition(job_id: str, from_statuses: tuple, **fields) -> bool:
+    """Conditionally updates a job; False if it was no longer in one of `from_statuses`."""
+    db = SessionLocal()
+    try:
+        updated = db.query(Job).filter(Job.id == job_id, Job.status.in_(from_statuses)).update(
+            fields, synchronize_session=False
+        )
+        db.commit()
+        return updated == 1
+    finally:
+        db.close()
+
+
+@traced("db", "sql", "recover_jobs")
+def _recoverable_job_ids() -> list:
+    """
+    Ids of queued jobs, oldest first, after re-queueing `running` jobs older than
+    JOB_TIMEOUT_S (their process died). Several processes may enqueue the same
+    queued job; only the one whose queued -> running transition wins runs it.
+    """
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=JOB_TIMEOUT_S)
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.status == "running", Job.started_at < stale_before).update(
+            {Job.status: "queued", Job.started_at: None}, synchronize_session=False
+        )
+        db.commit()
+        return [row.id for row in db.query(Job.id).filter(Job.status == "queued").order_by(Job.created_at)]
+    finally:
+        db.close()
+
+
+def _spool(upload: UploadFile, directory: str, kind: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, kind)
+    upload.file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f)
+    return path
+
+
+def _spool_dir(job_id: str) -> str:
+    return os.path.join(JOB_SPOOL_DIR, job_id)
+
+
+def _open_upload(path: str, filename: str, content_type: str):
+    if not path:
+        return None
+    return UploadFile(
+        file=open(path, "rb"), size=os.path.getsize(path), filename=filename,
+        headers=Headers({"content-type": content_type or "application/octet-stream"}),
+    )
+
+
+# --- Worker Pool ---
+class JobRunner:
+    """
+    Runs queued jobs on `workers` asyncio workers in this process.
+
+    The job table is the source of truth: workers only pick up jobs that are
+    still `queued` and finish them with conditional updates, so a job
+    cancelled while running is never overwritten with its late result.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self._queue = None
+        self._tasks = []
+        self._running = {}  # job_id -> asyncio.Task processing it
+        self._cancel_requested = set()
+        self._events = {}   # job_id -> asyncio.Event set when the job finishes here
+        self.queue_wait_ms = deque(maxlen=1000)
+        self.processing_ms = deque(maxlen=1000)
+        self.outcomes = Counter()
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._work(), name=f"job-worker-{i}") for i in range(self.workers)]
+        for job_id in await run_in_threadpool(_recoverable_job_ids):
+            if not self.enqueue(job_id):
+                break
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def has_capacity(self) -> bool:
+        return self._queue is not None and not self._queue.full()
+
+    def enqueue(self, job_id: str) -> bool:
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            return False
+        self._events.setdefault(job_id, asyncio.Event())
+        return True
+
+    def cancel(self, job_id: str):
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancel_requested.add(job_id)
+            task.cancel()
+
+    async def wait(self, job_id: str, timeout_s: float):
+        event = self._events.get(job_id)
+        if event is None:
+            await asyncio.sleep(timeout_s)
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout_s)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            # Logs and spans emitted while running the job carry its id.
+            token = request_id_var.set(f"job-{job_id}")
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"Job worker failed on job {job_id}. Error: {e}")
+            finally:
+                event = self._events.pop(job_id, None)
+                if event is not None:
+                    event.set()
+                self._queue.task_done()
+                request_id_var.reset(token)
+
+    async def _run_job(self, job_id: str):
+        started_at = datetime.now(timezone.utc)
+        if not await run_in_threadpool(_transition, job_id, ("queued",), status="running", started_at=started_at):
+            return  # cancelled (or taken) before it reached the front of the queue
+        job = await run_in_threadpool(_get_job, job_id)
+        self.queue_wait_ms.append(_elapsed_ms(job.created_at, started_at))
+        if self.queue_wait_ms[-1] is not None:
+            observe("stage", "job_queue_wait", seconds=self.queue_wait_ms[-1] / 1000)
+
+        task = asyncio.create_task(self._process(job))
+        self._running[job_id] = task
+        start = time.perf_counter()
+        fields = {}
+        try:
+            result = await asyncio.wait_for(task, JOB_TIMEOUT_S)
+            fields = {"status": "succeeded", "result": json.dumps(result, default=str)}
+        except asyncio.CancelledError:
+            if job_id not in self._cancel_requested:
+                raise  # shutting down: the job stays `running` and is recovered once stale
+            fields = {"status": "cancelled"}
+        except asyncio.TimeoutError:
+            fields = {"status": "failed", "error": f"The job exceeded its {JOB_TIMEOUT_S:g}s time limit."}
+        except HTTPException as e:
+            fields = {"status": "failed", "error": str(e.detail)}
+        except Exception as e:
+            fields = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+        finally:
+            self._running.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
+        shutil.rmtree(_spool_dir(job_id), ignore_errors=True)
+        self.processing_ms.append(round((time.perf_counter() - start) * 1000, 1))
+        observe("stage", "job_processing", seconds=self.processing_ms[-1] / 1000, outcome=fields["status"])
+        finished = await run_in_threadpool(
+            _transition, job_id, ("running",), finished_at=datetime.now(timezone.utc), **fields
+        )
+        self.outcomes[fields["status"] if finished else "cancelled"] += 1
+
+    async def _process(self, job: Job) -> dict:
+        audio = _open_upload(job.audio_path, job.audio_name, job.audio_type)
+        image = _open_upload(job.image_path, job.image_name, job.image_type)
+        try:
+            return await query_service.run_query(
+                str(job.user_id), job.text_query, audio, image, received_at=_aware(job.created_at)
+            )
+        finally:
+            for upload in (audio, image):
+                if upload is not None:
+                    upload.file.close()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "running": len(self._running),
+            "outcomes": dict(self.outcomes),
+            "queue_wait": latency_summary(self.queue_wait_ms),
+            "processing": latency_summary(self.processing_ms),
+        }
+
+
+runner = JobRunner()
+
+
+# --- Endpoints ---
+@router.post("", response_model=JobOut, status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    text_query: str = Form(""),
+    audio_file: Optional[UploadFile] = File(None),
+    image_file: Optional[UploadFile] = File(None)
+):
+    """Accepts the same inputs as /query/multimodal and returns a job id immediately."""
+    if not text_query.strip() and not audio_file and not image_file:
+        raise HTTPException(status_code=400, detail="No input provided. Please provide text, voice, or an image.")
+    if not runner.has_capacity():
+        raise HTTPException(status_code=503, detail="The job queue is full. Please retry shortly.",
+                            headers={"Retry-After": "5"})
+
+    job_id = uuid.uuid4().hex
+    job = Job(id=job_id, user_id=current_user.id, status="queued", text_query=text_query,
+              created_at=datetime.now(timezone.utc))
+    if audio_file:
+        check_upload(audio_file, UPLOAD_MAX_AUDIO_BYTES, "audio")
+    if image_file:
+        check_upload(image_file, UPLOAD_MAX_IMAGE_BYTES, "image")
+    directory = _spool_dir(job_id)
+    try:
+        if audio_file:
+            job.audio_path = await run_in_threadpool(_spool, audio_file, directory, "audio")
+            job.audio_name, job.audio_type = audio_file.filename, audio_file.content_type
+        if image_file:
+            job.image_path = await run_in_threadpool(_spool, image_file, directory, "image")
+            job.image_name, job.image_type = image_file.filename, image_file.content_type
+        created = await run_in_threadpool(_create_job, job, JOB_MAX_ACTIVE_PER_USER)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    if not created:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"You already have {JOB_MAX_ACTIVE_PER_USER} jobs in progress. Wait for one to finish.",
+            headers={"Retry-After": "5"},
+        )
+    if not runner.enqueue(job_id):
+        await run_in_threadpool(_transition, job_id, ACTIVE_STATUSES, status="failed",
+                                error="The job queue was full.", finished_at=datetime.now(timezone.utc))
+        shutil.rmtree(directory, ignore_errors=True)
+        raise HTTPException(status_code=503, detail="The job queue is full. Please retry shortly.",
+                            headers={"Retry-After": "5"})
+    return _job_out(job)
+
+
+@router.get("", response_model=list[JobOut])
+async def list_jobs(current_user: AuthenticatedUser = Depends(get_current_user),
+                    limit: int = Query(20, ge=1, le=100)):
+    """The caller's most recent jobs, newest first."""
+    return [_job_out(job) for job in await run_in_threadpool(_list_jobs, current_user.id, limit)]
+
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(job_id: str, current_user: AuthenticatedUser = Depends(get_current_user),
+                  wait: float = Query(0, ge=0, le=JOB_MAX_WAIT_S)):
+    """Returns a job's status; with `wait`, long-polls up to that many seconds for it to finish."""
+    job = await run_in_threadpool(_get_job, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    deadline = time.monotonic() + wait
+    while job.status not in TERMINAL_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await runner.wait(job_id, min(remaining, JOB_POLL_INTERVAL_S))
+        job = await run_in_threadpool(_get_job, job_id, current_user.id)
+    return _job_out(job)
+
+
+@router.delete("/{job_id}", response_model=JobOut)
+async def cancel_job(job_id: str, current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Cancels a queued or running job."""
+    job = await run_in_threadpool(_get_job, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    cancelled = await run_in_threadpool(
+        _transition, job_id, ACTIVE_STATUSES, status="cancelled", finished_at=datetime.now(timezone.utc)
+    )
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"The job has already {job.status}.")
+    runner.cancel(job_id)
+    if job.status == "queued":
+        shutil.rmtree(_spool_dir(job_id), ignore_errors=True)
+    return _job_out(await run_in_threadpool(_get_job, job_id, current_user.id))
@@ -1,48 +1,132 @@
-import os
-from groq import Groq
+import time
+import logging
+from collections import deque
 from dotenv import load_dotenv
 
+from .provider_client import provider, ProviderError
+from .observability import observe, latency_summary
+from . import prompts
+from .prompts import prompt_stats
+
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 LLM_MODEL = "gemma2-9b-it"  # A powerful and efficient model
-client = None
-
-# Initialize the Groq client for the LLM
-if os.getenv("GROQ_API_KEY"):
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-    print("✅ Groq client for LLM initialized.")
-else:
-    print("⚠️ WARNING: GROQ_API_KEY not found! LLM service disabled.")
-
-def get_llm_response(prompt: str, conversation_history: list = None) -> str:
-    """Generates a structured, safe medical response from the LLM."""
-    if not client:
-        return "LLM service is unavailable — please check the GROQ_API_KEY in your .env file."
-
-    # This system prompt guides the AI to provide safe and responsible answers
-    system_prompt = (
-        "You are a highly sophisticated and empathetic AI Health Assistant. "
-        "Your primary role is to provide safe, informative, and helpful preliminary guidance based on user-provided symptoms, medical questions, or images. "
-        "You must adhere to the following strict guidelines for every response:\n\n"
-        "1. **Safety First Disclaimer (Mandatory):** ALWAYS begin your response with a clear and prominent disclaimer. State that you are an AI assistant, not a medical professional, and your analysis is for informational purposes only. Strongly urge the user to consult a qualified healthcare provider for an accurate diagnosis and treatment plan.\n\n"
-        "2. **Symptom Analysis:** Carefully analyze the symptoms or query provided by the user.\n\n"
-        "3. **Provide Potential Conditions:** Based on the analysis, list a few *potential* conditions that might be associated with the symptoms. Use cautious language like 'Some conditions that can cause these symptoms include...' or 'This could possibly be related to...'.\n\n"
-        "4. **Actionable Advice & Recommendations:** Provide general, safe, and actionable advice. This should include lifestyle or dietary suggestions where appropriate.\n\n"
-        "5. **NEVER Diagnose:** Under no circumstances should you provide a definitive diagnosis. Do not say 'You have...' or 'This is...'. Always frame it as a possibility.\n\n"
-        "6. **Empathetic Tone:** Maintain a professional, calm, and empathetic tone throughout the conversation."
+LLM_UNAVAILABLE_MESSAGE = "LLM service is unavailable — please check the GROQ_API_KEY in your .env file."
+LLM_ERROR_MESSAGE = "I'm sorry, I encountered an error while processing your request."
+
+# Rolling window of time-to-first-token samples for streamed responses (ms).
+_ttft_samples = deque(maxlen=1000)
+
+if not provider.configured:
+    logger.warning("GROQ_API_KEY not found! LLM service disabled.")
+
+def is_fallback_response(text: str) -> bool:
+    """True for the canned replies returned when the provider is unavailable or failed."""
+    return text in (LLM_UNAVAILABLE_MESSAGE, LLM_ERROR_MESSAGE)
+
+def _build_messages(prompt: str, conversation_history: list = None, user_id: str = None, report: dict = None) -> list:
+    """Assembles the user's system prompt variant, prior turns and the new prompt (see prompts.build_messages)."""
+    messages, prompt_report = prompts.build_messages(prompt, conversation_history, user_id)
+    if report is not None:
+        report.update(prompt_report)
+    return messages
+
+def _record_prompt(report: dict, start: float):
+    report["llm_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    prompt_stats.record(report, report["llm_ms"])
+    logger.debug("prompt", extra={"fields": report})
+
+def get_llm_response(prompt: str, conversation_history: list = None, user_id: str = None,
+                     report: dict = None) -> str:
+    """
+    Generates a structured, safe medical response from the LLM (blocking).
+    A `report` dict is filled with prompt token counts and latency.
+    """
+    if not provider.configured:
+        return LLM_UNAVAILABLE_MESSAGE
+
+    report = {} if report is None else report
+    messages = _build_messages(prompt, conversation_history, user_id, report)
+    start = time.perf_counter()
+    try:
+        text = provider.chat(messages, LLM_MODEL)
+        _record_prompt(report, start)
+        return text
+    except ProviderError as e:
+        logger.error(f"Groq LLM API call failed. Error: {e}")
+        return LLM_ERROR_MESSAGE
+
+
+async def aget_llm_response(prompt: str, conversation_history: list = None, user_id: str = None,
+                            report: dict = None) -> str:
+    """Async get_llm_response; may hedge or fall back to LLM_FALLBACK_MODEL (see provider_client)."""
+    if not provider.configured:
+        return LLM_UNAVAILABLE_MESSAGE
+
+    report = {} if report is None else report
+    messages = _build_messages(prompt, conversation_history, user_id, report)
+    start = time.perf_counter()
+    try:
+        text = await provider.achat(messages, LLM_MODEL)
+        _record_prompt(report, start)
+        return text
+    except ProviderError as e:
+        logger.error(f"Groq LLM API call failed. Error: {e}")
+        return LLM_ERROR_MESSAGE
+
+
+def summarize_conversation(previous_summary: str, messages: list, max_words: int = 200) -> str:
+    """Folds new messages into a running summary of the user's earlier conversation."""
+    if not provider.configured:
+        return previous_summary or ""
+
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    instructions = (
+        "You maintain a concise running summary of a conversation between a user and an AI Health Assistant. "
+        "Keep symptoms, conditions, medications, allergies, timelines and advice already given. "
+        f"Drop pleasantries and disclaimers. Reply with the updated summary only, at most {max_words} words."
     )
-    
-    messages = [{"role": "system", "content": system_prompt}]
-    if conversation_history:
-        messages.extend(conversation_history)
-    messages.append({"role": "user", "content": prompt})
-    
+    content = f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
     try:
-        chat_completion = client.chat.completions.create(
-            messages=messages,
-            model=LLM_MODEL,
+        summary = provider.chat(
+            [{"role": "system", "content": instructions}, {"role": "user", "content": content}],
+            LLM_MODEL,
         )
-        return chat_completion.choices[0].message.content
+        return summary.strip()
+    except ProviderError as e:
+        logger.error(f"Groq summarization call failed. Error: {e}")
+        return previous_summary or ""
+
+async def stream_llm_response(prompt: str, conversation_history: list = None, user_id: str = None,
+                              report: dict = None):
+    """
+    Yields the LLM response in chunks as they arrive; `report` is complete once
+    the stream ends. If the provider fails, LLM_ERROR_MESSAGE is yielded (possibly
+    after part of the answer) and `report["failed"]` is set.
+    """
+    if not provider.configured:
+        yield LLM_UNAVAILABLE_MESSAGE
+        return
+
+    report = {} if report is None else report
+    messages = _build_messages(prompt, conversation_history, user_id, report)
+    start = time.perf_counter()
+    try:
+        async for delta in provider.astream_chat(messages, LLM_MODEL):
+            if "ttft_ms" not in report:
+                report["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            yield delta
+        _record_prompt(report, start)
     except Exception as e:
-        print(f"❌ ERROR: Groq LLM API call failed. Error: {e}")
-        return "I'm sorry, I encountered an error while processing your request."
+        logger.error(f"Groq LLM streaming call failed. Error: {e}")
+        report["failed"] = True
+        yield LLM_ERROR_MESSAGE
+
+def record_ttft(ttft_ms: float):
+    _ttft_samples.append(ttft_ms)
+    observe("stage", "llm_first_token", seconds=ttft_ms / 1000)
+
+def ttft_summary() -> dict:
+    """p50/p95 time-to-first-token over the recent streamed responses."""
+    return latency_summary(_ttft_samples)
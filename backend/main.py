@@ -1,9 +1,26 @@
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from .observability import configure_logging, RequestContextMiddleware, router as metrics_router
+
+# Configure logging before the service modules below log their import-time status.
+configure_logging()
+
 from .sql import create_db_and_tables
 from . import auth
 from . import query_service
 from . import dashboard_service
+from . import jobs_service
+from . import caption_service
+from . import health_service
+from . import mongo_memory
+from . import pinecone_store
+from . import memory_retrieval
+from .provider_client import provider
+from .upload_limits import BodySizeLimitMiddleware
+from .model_registry import registry, MODEL_WARMUP
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="AI Health Assistant API")
 
@@ -15,18 +32,43 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Oversized uploads are refused while streaming, before they are spooled in full.
+app.add_middleware(BodySizeLimitMiddleware)
+# Outermost: request ids, in-flight gauge and latency histograms cover every response, 413s included.
+app.add_middleware(RequestContextMiddleware)
 
 # Startup Event to create database tables
 @app.on_event("startup")
-def on_startup():
-    print("--- 🚀 Backend App Starting Up ---")
+async def on_startup():
+    logger.info("Backend app starting up.")
     create_db_and_tables()
-    print("--- ✨ Startup Complete ---")
+    await mongo_memory.init_memory()
+    auth.revocation_sync.start()
+    caption_service.engine.start()
+    memory_retrieval.indexer.start()
+    await jobs_service.runner.start()
+    if MODEL_WARMUP:
+        # Load models in the background so the server accepts traffic immediately.
+        registry.warm_up()
+    logger.info("Startup complete.")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await jobs_service.runner.stop()
+    await auth.revocation_sync.stop()
+    caption_service.engine.stop()
+    await mongo_memory.close_memory()
+    memory_retrieval.indexer.stop()
+    await provider.aclose()
+    pinecone_store.persist()
 
 # Include the routers from other service files
 app.include_router(auth.router)
 app.include_router(query_service.router)
 app.include_router(dashboard_service.router)
+app.include_router(jobs_service.router)
+app.include_router(health_service.router)
+app.include_router(metrics_router)
 
 # Root Endpoint for health checks
 @app.get("/")
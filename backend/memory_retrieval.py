@@ -0,0 +1,167 @@
+import os
+import logging
+import time
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+from dotenv import load_dotenv
+
+from . import pinecone_store
+from . import embedding_service
+from .observability import latency_summary
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Long-Term Memory Configuration ---
+# Opt-in: indexes every exchange into MEMORY_NAMESPACE of the vector index (the Pinecone
+# index when VECTOR_BACKEND is pinecone) and retrieves from it for each prompt.
+MEMORY_RETRIEVAL_ENABLED = os.getenv("MEMORY_RETRIEVAL_ENABLED", "0").lower() in ("1", "true", "yes")
+MEMORY_NAMESPACE = os.getenv("MEMORY_NAMESPACE", "long-term-memory")
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "4"))
+MEMORY_MIN_SCORE = float(os.getenv("MEMORY_MIN_SCORE", "0.35"))
+MEMORY_TOKEN_CAP = int(os.getenv("MEMORY_TOKEN_CAP", "400"))
+MEMORY_EMBED_BATCH_SIZE = int(os.getenv("MEMORY_EMBED_BATCH_SIZE", "32"))
+MEMORY_EMBED_MAX_WAIT_MS = float(os.getenv("MEMORY_EMBED_MAX_WAIT_MS", "200"))
+MEMORY_QUEUE_SIZE = int(os.getenv("MEMORY_QUEUE_SIZE", "1000"))
+# Long exchanges are clipped before embedding; the stored text is what gets retrieved.
+MEMORY_MAX_EXCHANGE_CHARS = 2000
+
+
+def format_exchange(user_text: str, assistant_text: str) -> str:
+    text = f"User: {user_text}\nAssistant: {assistant_text}"
+    return text[:MEMORY_MAX_EXCHANGE_CHARS]
+
+
+class MemoryIndexer:
+    """
+    Embeds conversation turns off the request path.
+
+    `enqueue` only appends to a bounded queue; a worker thread gathers up to
+    `batch_size` turns (waiting at most `max_wait_ms`) and embeds and upserts
+    them in one call each. When the queue is full, the turn is dropped from
+    long-term memory rather than slowing the request.
+    """
+
+    def __init__(self, batch_size: int = MEMORY_EMBED_BATCH_SIZE, max_wait_ms: float = MEMORY_EMBED_MAX_WAIT_MS,
+                 queue_size: int = MEMORY_QUEUE_SIZE, namespace: str = MEMORY_NAMESPACE):
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.namespace = namespace
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        self._lock = threading.Lock()
+        self.indexed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failures = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="memory-indexer", daemon=True)
+                self._worker.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Indexes what is already queued (within `timeout`), then stops the worker."""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None and worker.is_alive():
+            self._queue.put(None)
+            worker.join(timeout)
+
+    def enqueue(self, user_id: str, user_text: str, assistant_text: str, timestamp: datetime):
+        self.start()
+        try:
+            self._queue.put_nowait((user_id, format_exchange(user_text, assistant_text), timestamp.timestamp()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    # --- Worker Internals ---
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                embeddings = embedding_service.embed_texts([text for _, text, _ in batch])
+                pinecone_store.upsert_memories(
+                    [(user_id, embedding, text, {"timestamp": ts})
+                     for (user_id, text, ts), embedding in zip(batch, embeddings)],
+                    namespace=self.namespace,
+                )
+            except Exception as e:
+                logger.error(f"Failed to index {len(batch)} conversation turns. Error: {e}")
+                with self._lock:
+                    self.failures += 1
+                continue
+            with self._lock:
+                self.indexed += len(batch)
+                self.batches += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "indexed": self.indexed,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "failures": self.failures,
+            }
+
+
+indexer = MemoryIndexer()
+if MEMORY_RETRIEVAL_ENABLED:
+    embedding_service.register_model()
+
+# --- Retrieval ---
+_retrieval_ms = deque(maxlen=1000)
+
+
+def retrieve(user_id: str, prompt: str, top_k: int = MEMORY_TOP_K) -> list:
+    """
+    Returns up to `top_k` of the user's past exchanges most similar to `prompt`,
+    best first, as dicts with text, score and timestamp. Blocking; run in a worker thread.
+    """
+    start = time.perf_counter()
+    try:
+        embedding = embedding_service.embed_text(prompt)
+        matches = pinecone_store.query_matches(
+            embedding, top_k=top_k, filter={"user_id": {"$eq": user_id}}, namespace=MEMORY_NAMESPACE
+        )
+    finally:
+        _retrieval_ms.append((time.perf_counter() - start) * 1000)
+    return [
+        {"text": m["metadata"].get("text", ""), "score": m["score"], "timestamp": m["metadata"].get("timestamp")}
+        for m in matches if m["score"] >= MEMORY_MIN_SCORE
+    ]
+
+
+def retrieval_summary() -> dict:
+    """p50/p95 retrieval latency (embedding + vector query) over recent requests."""
+    return latency_summary(_retrieval_ms)
@@ -0,0 +1,137 @@
+import os
+import logging
+import time
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Registry Configuration ---
+# Directory holding pre-downloaded model snapshots, laid out as <dir>/<org>--<name>.
+MODEL_SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1").lower() in ("1", "true", "yes")
+
+STATUS_NOT_LOADED = "not_loaded"
+STATUS_LOADING = "loading"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+
+def resolve_model_source(repo_id: str) -> tuple:
+    """
+    Returns (source, local_files_only) for a Hugging Face model id.
+    Prefers a local snapshot directory when one exists for the model.
+    """
+    if MODEL_SNAPSHOT_DIR:
+        local_path = os.path.join(MODEL_SNAPSHOT_DIR, repo_id.replace("/", "--"))
+        if os.path.isdir(local_path):
+            return local_path, True
+    return repo_id, False
+
+
+class _ModelEntry:
+    def __init__(self, name: str, loader, fork_safe: bool = True):
+        self.name = name
+        self.loader = loader
+        self.fork_safe = fork_safe
+        self.value = None
+        self.status = STATUS_NOT_LOADED
+        self.error = None
+        self.load_time_s = None
+        self.loaded_at = None
+        self.warmup_requested = False
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Loads registered models on first use or in a background warm-up thread."""
+
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name: str, loader, fork_safe: bool = True):
+        """
+        Registers a zero-argument loader; nothing is loaded until requested.
+        Pass fork_safe=False for models whose loader starts native threads (e.g. an
+        onnxruntime session): they must be loaded in each worker, not before fork.
+        """
+        self._entries[name] = _ModelEntry(name, loader, fork_safe)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def get(self, name: str):
+        """Returns the loaded model, loading it now if needed. Returns None if loading failed."""
+        entry = self._entries[name]
+        if entry.status == STATUS_READY:
+            return entry.value
+        with entry.lock:
+            if entry.status in (STATUS_NOT_LOADED, STATUS_LOADING):
+                self._load(entry)
+        return entry.value
+
+    def is_failed(self, name: str) -> bool:
+        return self._entries[name].status == STATUS_FAILED
+
+    def _load(self, entry: _ModelEntry):
+        entry.status = STATUS_LOADING
+        start = time.perf_counter()
+        try:
+            entry.value = entry.loader()
+            entry.status = STATUS_READY
+            entry.error = None
+            logger.info(f"Model '{entry.name}' loaded in {time.perf_counter() - start:.2f}s.")
+        except Exception as e:
+            entry.value = None
+            entry.status = STATUS_FAILED
+            entry.error = str(e)
+            logger.warning(f"Could not load model '{entry.name}'. Error: {e}")
+        entry.load_time_s = round(time.perf_counter() - start, 3)
+        entry.loaded_at = time.time()
+
+    def warm_up(self, names: list = None) -> threading.Thread:
+        """Loads the given (or all) models on a background thread."""
+        names = list(names or self._entries)
+        for name in names:
+            self._entries[name].warmup_requested = True
+
+        def _warm():
+            for name in names:
+                self.get(name)
+
+        thread = threading.Thread(target=_warm, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def load(self, names: list = None) -> dict:
+        """Loads the given (or all) models now, on the calling thread; returns their statuses."""
+        names = list(names or self._entries)
+        for name in names:
+            self._entries[name].warmup_requested = True
+            self.get(name)
+        return {name: self._entries[name].status for name in names}
+
+    def fork_safe_names(self) -> list:
+        return [name for name, entry in self._entries.items() if entry.fork_safe]
+
+    def is_ready(self) -> bool:
+        """True once every model scheduled for warm-up has finished loading (or failed)."""
+        return all(
+            entry.status in (STATUS_READY, STATUS_FAILED)
+            for entry in self._entries.values() if entry.warmup_requested
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            name: {
+                "status": entry.status,
+                "load_time_s": entry.load_time_s,
+                "loaded_at": entry.loaded_at,
+                "error": entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+registry = ModelRegistry()
@@ -1,62 +1,406 @@
 import os
-from datetime import datetime, timezone
-from pymongo import MongoClient
+import logging
+import asyncio
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
+from .observability import traced
+
 load_dotenv()
+logger = logging.getLogger(__name__)
 
-# --- Initialize MongoDB Client ---
+# --- MongoDB Configuration ---
 MONGO_URI = os.getenv("MONGO_URI")
-memory_collection = None
-if MONGO_URI:
+# "motor" talks to a real cluster; "memory" keeps history in-process (local runs, benchmarks).
+MONGO_BACKEND = os.getenv("MONGO_BACKEND", "motor" if MONGO_URI else "none").lower()
+MONGO_DB_NAME = "Health_Assistant"
+MONGO_COLLECTION_NAME = "Health_Memory"
+MONGO_SUMMARY_COLLECTION_NAME = "Health_Summaries"
+
+# Connection pool tuning (passed straight to the driver).
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+
+# Optional write-behind buffering of conversation turns.
+MONGO_WRITE_BEHIND = os.getenv("MONGO_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+MONGO_FLUSH_SIZE = int(os.getenv("MONGO_FLUSH_SIZE", "100"))
+MONGO_FLUSH_INTERVAL_MS = int(os.getenv("MONGO_FLUSH_INTERVAL_MS", "250"))
+# Consecutive failed flushes a batch is retried for (on later intervals) before it is dropped.
+MONGO_FLUSH_RETRIES = int(os.getenv("MONGO_FLUSH_RETRIES", "3"))
+
+# MongoDB stores datetimes with millisecond precision.
+_TIMESTAMP_STEP = timedelta(milliseconds=1)
+
+
+def _inserted_count(error: Exception) -> int:
+    """Leading documents an ordered insert_many wrote before failing (BulkWriteError details)."""
+    details = getattr(error, "details", None)
+    return details.get("nInserted", 0) if isinstance(details, dict) else 0
+
+
+def _apply_projection(doc: dict, projection: dict) -> dict:
+    """Applies a simple top-level include/exclude projection to a document."""
+    if not projection:
+        return dict(doc)
+    includes = {k for k, v in projection.items() if v and k != "_id"}
+    if includes:
+        out = {k: doc[k] for k in includes if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+
+# --- Storage Backends ---
+class MotorMemoryBackend:
+    """Async MongoDB backend using Motor with an explicitly sized connection pool."""
+
+    def __init__(self, uri: str):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.client = AsyncIOMotorClient(
+            uri,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            retryWrites=True,
+            tz_aware=True,
+        )
+        self.collection = self.client[MONGO_DB_NAME][MONGO_COLLECTION_NAME]
+        self.summaries = self.client[MONGO_DB_NAME][MONGO_SUMMARY_COLLECTION_NAME]
+
+    async def ensure_indexes(self):
+        # Serves both the recent-history sort and keyset pagination on (timestamp, _id).
+        await self.collection.create_index(
+            [("user_id", 1), ("timestamp", -1), ("_id", -1)], name="user_id_timestamp_id"
+        )
+        await self.summaries.create_index("user_id", unique=True, name="user_id_unique")
+
+    async def get_summary(self, user_id: str):
+        return await self.summaries.find_one({"user_id": user_id}, {"_id": 0})
+
+    async def upsert_summary(self, user_id: str, summary: dict):
+        await self.summaries.replace_one({"user_id": user_id}, {**summary, "user_id": user_id}, upsert=True)
+
+    async def insert_many(self, docs: list):
+        await self.collection.insert_many(docs, ordered=True)
+
+    async def find_recent(self, user_id: str, limit: int, projection: dict = None) -> list:
+        cursor = self.collection.find({"user_id": user_id}, projection).sort("timestamp", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def find_page(self, user_id: str, limit: int, before: tuple = None, after: tuple = None) -> list:
+        query = {"user_id": user_id}
+        direction = -1
+        if before is not None:
+            ts, oid = before
+            query["$or"] = [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "_id": {"$lt": oid}}]
+        elif after is not None:
+            ts, oid = after
+            query["$or"] = [{"timestamp": {"$gt": ts}}, {"timestamp": ts, "_id": {"$gt": oid}}]
+            direction = 1
+        cursor = self.collection.find(query).sort([("timestamp", direction), ("_id", direction)]).limit(limit)
+        docs = await cursor.to_list(length=limit)
+        return docs if direction == -1 else list(reversed(docs))
+
+    async def iter_all(self, user_id: str, batch_size: int = 500):
+        cursor = self.collection.find({"user_id": user_id}).sort([("timestamp", -1), ("_id", -1)]).batch_size(batch_size)
+        async for doc in cursor:
+            yield doc
+
+    def close(self):
+        self.client.close()
+
+
+class InMemoryBackend:
+    """Process-local stand-in with the same interface, for tests and local runs."""
+
+    def __init__(self):
+        self._docs = {}  # user_id -> list of documents in insertion (timestamp) order
+        self._summaries = {}
+
+    async def ensure_indexes(self):
+        return None
+
+    async def get_summary(self, user_id: str):
+        summary = self._summaries.get(user_id)
+        return dict(summary) if summary else None
+
+    async def upsert_summary(self, user_id: str, summary: dict):
+        self._summaries[user_id] = {**summary, "user_id": user_id}
+
+    async def insert_many(self, docs: list):
+        from bson import ObjectId
+
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self._docs.setdefault(doc["user_id"], []).append(doc)
+
+    async def find_recent(self, user_id: str, limit: int, projection: dict = None) -> list:
+        docs = sorted(self._docs.get(user_id, []), key=lambda d: d["timestamp"], reverse=True)[:limit]
+        return [_apply_projection(d, projection) for d in docs]
+
+    async def find_page(self, user_id: str, limit: int, before: tuple = None, after: tuple = None) -> list:
+        docs = sorted(self._docs.get(user_id, []), key=lambda d: (d["timestamp"], d["_id"]), reverse=True)
+        if before is not None:
+            docs = [d for d in docs if (d["timestamp"], d["_id"]) < before][:limit]
+        elif after is not None:
+            docs = [d for d in docs if (d["timestamp"], d["_id"]) > after][-limit:]
+        else:
+            docs = docs[:limit]
+        return [dict(d) for d in docs]
+
+    async def iter_all(self, user_id: str, batch_size: int = 500):
+        docs = sorted(self._docs.get(user_id, []), key=lambda d: (d["timestamp"], d["_id"]), reverse=True)
+        for doc in docs:
+            yield dict(doc)
+
+    def close(self):
+        return None
+
+
+# --- Write-Behind Buffer ---
+class WriteBehindBuffer:
+    """
+    Collects documents and writes them with one insert_many on size or interval.
+    A failed batch goes back to the front of the queue and is retried on the
+    next flushes, up to `max_retries` consecutive failures.
+    """
+
+    def __init__(self, backend, flush_size: int = MONGO_FLUSH_SIZE, flush_interval_ms: int = MONGO_FLUSH_INTERVAL_MS,
+                 max_retries: int = MONGO_FLUSH_RETRIES):
+        self.backend = backend
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_retries = max(0, max_retries)
+        self._pending = []
+        self._lock = asyncio.Lock()  # guards _pending
+        self._flush_lock = asyncio.Lock()  # one insert_many at a time, so batches land in order
+        self._failed_flushes = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+
+    async def add(self, docs: list):
+        async with self._lock:
+            self._pending.extend(docs)
+            full = len(self._pending) >= self.flush_size
+        if full:
+            await self.flush()
+
+    def pending_for(self, user_id: str) -> list:
+        return [d for d in self._pending if d["user_id"] == user_id]
+
+    async def flush(self):
+        async with self._flush_lock:
+            async with self._lock:
+                if not self._pending:
+                    return
+                docs, self._pending = self._pending, []
+            try:
+                await self.backend.insert_many(docs)
+                self._failed_flushes = 0
+                return
+            except Exception as e:
+                error = e
+            # insert_many is ordered: the documents before the failing one are stored.
+            docs = docs[_inserted_count(error):]
+            self._failed_flushes += 1
+            if self._failed_flushes > self.max_retries:
+                self._failed_flushes = 0
+                logger.error(f"Write-behind flush failed {self.max_retries + 1} times; "
+                             f"dropping {len(docs)} messages. Error: {error}")
+                return
+            logger.warning(f"Write-behind flush of {len(docs)} messages failed; will retry. Error: {error}")
+            async with self._lock:
+                self._pending[:0] = docs
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for _ in range(self.max_retries + 1):
+            await self.flush()
+            if not self._pending:
+                break
+
+
+# --- Module State ---
+backend = None
+write_buffer = None
+_backend_created = False
+
+
+def _create_backend():
+    if MONGO_BACKEND == "memory":
+        logger.info("Using in-memory conversation store.")
+        return InMemoryBackend()
+    if MONGO_BACKEND == "motor" and MONGO_URI:
+        try:
+            store = MotorMemoryBackend(MONGO_URI)
+            logger.info("MongoDB (Motor) client initialized.")
+            return store
+        except Exception as e:
+            logger.warning(f"Could not connect to MongoDB. Memory service disabled. Error: {e}")
+            return None
+    logger.warning("MONGO_URI not found! Memory service disabled.")
+    return None
+
+
+def get_backend():
+    """Creates the configured storage backend on first use (or returns None if disabled)."""
+    global backend, _backend_created
+    if not _backend_created:
+        backend = _create_backend()
+        _backend_created = True
+    return backend
+
+
+async def init_memory():
+    """Startup hook: connects, ensures the (user_id, timestamp) index and starts write-behind."""
+    global write_buffer
+    store = get_backend()
+    if store is None:
+        return
     try:
-        client = MongoClient(MONGO_URI)
-        db = client["Health_Assistant"]
-        memory_collection = db["Health_Memory"]
-        print("✅ MongoDB client initialized.")
+        await store.ensure_indexes()
     except Exception as e:
-        print(f"⚠️ WARNING: Could not connect to MongoDB. Memory service disabled. Error: {e}")
-else:
-    print("⚠️ WARNING: MONGO_URI not found! Memory service disabled.")
+        logger.warning(f"Could not ensure MongoDB indexes. Error: {e}")
+    if MONGO_WRITE_BEHIND and write_buffer is None:
+        write_buffer = WriteBehindBuffer(store)
+        write_buffer.start()
+
 
+async def close_memory():
+    """Shutdown hook: flushes buffered writes and closes the client."""
+    global write_buffer, backend, _backend_created
+    if write_buffer is not None:
+        await write_buffer.close()
+        write_buffer = None
+    if backend is not None:
+        backend.close()
+        backend = None
+        _backend_created = False
 
-def store_message(user_id: str, role: str, content: str):
-    """Stores a message in the user's conversation history."""
-    if memory_collection is None: return
+
+@traced("db", "mongo", "write")
+async def _write(docs: list):
+    store = get_backend()
+    if store is None:
+        return
     try:
-        memory_collection.insert_one({
-            "user_id": user_id,
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now(timezone.utc)
-        })
+        if write_buffer is not None:
+            await write_buffer.add(docs)
+        else:
+            await store.insert_many(docs)
     except Exception as e:
-        print(f"❌ ERROR: Failed to store message in MongoDB. Error: {e}")
+        logger.error(f"Failed to store messages in MongoDB. Error: {e}")
+
+
+async def store_turn(user_id: str, user_content: str, assistant_content: str, user_timestamp: datetime = None):
+    """Stores a user message and the assistant's reply with a single insert_many."""
+    now = datetime.now(timezone.utc)
+    user_timestamp = user_timestamp or now
+    await _write([
+        {"user_id": user_id, "role": "user", "content": user_content, "timestamp": user_timestamp},
+        {"user_id": user_id, "role": "assistant", "content": assistant_content,
+         "timestamp": max(now, user_timestamp + _TIMESTAMP_STEP)},
+    ])
 
-def get_user_memory(user_id: str, limit: int = 10) -> list:
-    """Retrieves the last 'limit' messages for the LLM, in chronological order."""
-    if memory_collection is None: return []
+
+@traced("db", "mongo", "find_recent")
+async def _find_recent(user_id: str, limit: int, projection: dict) -> list:
+    """Newest-first messages for a user, including any still waiting in the write-behind buffer."""
+    store = get_backend()
+    if store is None:
+        return []
+    pending = write_buffer.pending_for(user_id) if write_buffer is not None else []
+    if not pending:
+        return await store.find_recent(user_id, limit, projection)
+    stored = await store.find_recent(user_id, limit, None)
+    # A flush may land between the two reads; insert_many sets _id in place, so dedupe on it.
+    stored_ids = {d["_id"] for d in stored}
+    merged = stored + [d for d in pending if d.get("_id") not in stored_ids]
+    merged.sort(key=lambda d: d["timestamp"], reverse=True)
+    return [_apply_projection(d, projection) for d in merged[:limit]]
+
+
+async def get_recent_messages(user_id: str, limit: int = 50) -> list:
+    """Last 'limit' messages with timestamps, in chronological order (for context building)."""
     try:
-        messages = memory_collection.find(
-            {"user_id": user_id},
-            {"_id": 0, "role": 1, "content": 1} 
-        ).sort("timestamp", -1).limit(limit)
-        
-        # Reverse the results to be in chronological order for the LLM context
-        return list(reversed(list(messages)))
+        messages = await _find_recent(user_id, limit, {"_id": 0, "role": 1, "content": 1, "timestamp": 1})
+        return list(reversed(messages))
     except Exception as e:
-        print(f"❌ ERROR: Failed to retrieve user memory from MongoDB. Error: {e}")
+        logger.error(f"Failed to retrieve user memory from MongoDB. Error: {e}")
         return []
 
-def get_full_history_for_dashboard(user_id: str, limit: int = 100) -> list:
-    """Retrieves full history with timestamps for the dashboard view."""
-    if memory_collection is None: return []
+
+@traced("db", "mongo", "get_summary")
+async def get_summary(user_id: str):
+    """Returns the stored rolling summary document for a user, if any."""
+    store = get_backend()
+    if store is None:
+        return None
     try:
-        messages = memory_collection.find(
-            {"user_id": user_id},
-            {"_id": 0} 
-        ).sort("timestamp", -1).limit(limit)
-        return list(messages)
+        return await store.get_summary(user_id)
     except Exception as e:
-        print(f"❌ ERROR: Failed to retrieve dashboard history from MongoDB. Error: {e}")
+        logger.error(f"Failed to load conversation summary from MongoDB. Error: {e}")
+        return None
+
+
+@traced("db", "mongo", "save_summary")
+async def save_summary(user_id: str, summary: str, covered_until: datetime, message_count: int):
+    """Stores a user's rolling summary and the timestamp of the last message it covers."""
+    store = get_backend()
+    if store is None:
+        return
+    try:
+        await store.upsert_summary(user_id, {
+            "summary": summary,
+            "covered_until": covered_until,
+            "message_count": message_count,
+            "updated_at": datetime.now(timezone.utc),
+        })
+    except Exception as e:
+        logger.error(f"Failed to store conversation summary in MongoDB. Error: {e}")
+
+
+@traced("db", "mongo", "history_page")
+async def get_history_page(user_id: str, limit: int = 50, before: tuple = None, after: tuple = None) -> list:
+    """
+    Returns one newest-first page of history for the dashboard using keyset
+    pagination on (timestamp, _id). `before`/`after` are (timestamp, ObjectId) keys.
+    """
+    store = get_backend()
+    if store is None:
+        return []
+    if write_buffer is not None:
+        await write_buffer.flush()
+    try:
+        return await store.find_page(user_id, limit, before=before, after=after)
+    except Exception as e:
+        logger.error(f"Failed to retrieve dashboard history from MongoDB. Error: {e}")
         return []
+
+
+async def iter_history(user_id: str):
+    """Yields the user's full history newest-first without materializing it in memory."""
+    store = get_backend()
+    if store is None:
+        return
+    if write_buffer is not None:
+        await write_buffer.flush()
+    async for doc in store.iter_all(user_id):
+        yield doc
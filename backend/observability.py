@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from fastapi import APIRouter, Response
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+
+load_dotenv()
+
+# --- Logging Configuration ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json | text
+# Spans are logged at DEBUG; set LOG_SPANS=1 to log them at INFO instead.
+LOG_SPANS = os.getenv("LOG_SPANS", "0").lower() in ("1", "true", "yes")
+
+request_id_var = ContextVar("request_id", default="-")
+_span_path = ContextVar("span_path", default="")
+logger = logging.getLogger(__name__)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps every record with the request id of the task or thread that logged it."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={"fields": {...}}` adds structured fields."""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local runs, with structured fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+_configured = False
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Routes all logging through one stdout handler with request ids (idempotent)."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    # Provider calls are covered by spans, and RequestContextMiddleware writes the access log.
+    for noisy in ("httpx", "httpcore", "uvicorn.access"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+    _configured = True
+
+
+# --- Metrics ---
+# Set (by gunicorn.conf.py) when several worker processes serve the app: each writes its
+# samples under this directory and /metrics aggregates them, whichever worker is scraped.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served.", ["method"],
+                       multiprocess_mode="livesum")
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "End-to-end request latency (streams included).",
+                         ["method", "route", "status"], buckets=_LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram("pipeline_stage_duration_seconds", "Latency of each query pipeline stage.",
+                          ["stage", "outcome"], buckets=_LATENCY_BUCKETS)
+AUTH_SECONDS = Histogram("auth_duration_seconds", "Latency of authentication steps.",
+                         ["operation", "outcome"], buckets=_LATENCY_BUCKETS)
+DB_SECONDS = Histogram("db_call_duration_seconds", "Latency of database and vector store calls.",
+                       ["store", "operation", "outcome"], buckets=_LATENCY_BUCKETS)
+STAGE_FAILURES = Counter("pipeline_stage_failures_total", "Pipeline stages that raised.", ["stage"])
+
+_SPAN_METRICS = {"stage": STAGE_SECONDS, "auth": AUTH_SECONDS, "db": DB_SECONDS}
+
+
+def observe(kind: str, *labels, seconds: float, outcome: str = "ok"):
+    """Records a duration measured elsewhere (e.g. time to first token)."""
+    _SPAN_METRICS[kind].labels(*labels, outcome).observe(seconds)
+
+
+# --- Latency Percentiles ---
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of `values` (unsorted is fine); 0.0 when there are none."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_summary(samples) -> dict:
+    """Count, p50 and p95 of millisecond samples; None samples are skipped."""
+    ordered = sorted(s for s in samples if s is not None)
+    if not ordered:
+        return {"count": 0, "p50_ms": None, "p95_ms": None}
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 50), 1),
+        "p95_ms": round(percentile(ordered, 95), 1),
+    }
+
+
+@contextmanager
+def span(kind: str, *labels, **fields):
+    """
+    Times a block into the `kind` histogram ("stage", "auth" or "db") and logs
+    it with the current request id and its parent span path.
+    """
+    name = "/".join(labels)
+    parent = _span_path.get()
+    path = f"{parent} > {name}" if parent else name
+    token = _span_path.set(path)
+    outcome = "ok"
+    start = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except BaseException:
+        outcome = "error"
+        if kind == "stage":
+            STAGE_FAILURES.labels(name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _span_path.reset(token)
+        _SPAN_METRICS[kind].labels(*labels, outcome).observe(elapsed)
+        logger.log(logging.INFO if LOG_SPANS else logging.DEBUG, "span", extra={"fields": {
+            "span": path, "kind": kind, "duration_ms": round(elapsed * 1000, 2), "outcome": outcome, **fields,
+        }})
+
+
+def traced(kind: str, *labels):
+    """Decorator form of span() for sync or async functions."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(kind, *labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(kind, *labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- Request Context Middleware ---
+_QUIET_PATHS = ("/metrics", "/health")
+
+
+class RequestContextMiddleware:
+    """
+    Assigns each request an id (the caller's X-Request-ID, or a new one), makes
+    it available to every log line via a contextvar, echoes it in the response,
+    and records in-flight and latency metrics per route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64]
+        request_id = incoming or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        method = scope["method"]
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.labels(method).dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.labels(method, route, str(status)).observe(elapsed)
+            quiet = scope["path"].startswith(_QUIET_PATHS)
+            logger.log(logging.DEBUG if quiet else logging.INFO, "request", extra={"fields": {
+                "method": method, "route": route, "status": status, "duration_ms": round(elapsed * 1000, 2),
+            }})
+            request_id_var.reset(token)
+
+
+# --- Scrape-Time Collectors ---
+_collectors = []
+
+def register_collector(collector):
+    """Registers a prometheus collector once (e.g. gauges read from service stats at scrape time)."""
+    if collector not in _collectors:
+        REGISTRY.register(collector)
+        _collectors.append(collector)
+
+
+router = APIRouter(tags=["Observability"])
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of all registered metrics."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+    # Histograms and counters are summed across workers; scrape-time collectors
+    # (queues, caches, pools) describe the worker that answered.
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _collectors:
+        registry.register(collector)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
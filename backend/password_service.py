@@ -0,0 +1,94 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Hashing Configuration ---
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash/verify jobs allowed to wait or run at once; beyond this callers get HasherBusy.
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "64"))
+
+# Pinning min and max rounds to the configured cost makes `verify_and_update`
+# report any stored hash with a different cost, so it is rehashed on next login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class HasherBusy(Exception):
+    """Raised when the password hashing pool is saturated."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, size-limited thread pool so bursts of logins
+    cannot occupy the threadpool shared with the query endpoints.
+    """
+
+    def __init__(self, workers: int = BCRYPT_WORKERS, max_pending: int = BCRYPT_MAX_PENDING):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_s = 0.0
+        self.total_run_s = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _timed(self, fn, args, submitted_at: float):
+        started = time.perf_counter()
+        with self._stats_lock:
+            self.running += 1
+            self.total_wait_s += started - submitted_at
+        try:
+            return fn(*args)
+        finally:
+            with self._stats_lock:
+                self.running -= 1
+                self.total_run_s += time.perf_counter() - started
+
+    async def _submit(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy(f"{self.pending} password operations already pending.")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, fn, args, time.perf_counter())
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple:
+        """Returns (is_valid, new_hash_or_None); new_hash is set when the stored cost is outdated."""
+        return await self._submit(pwd_context.verify_and_update, password, hashed)
+
+    def stats(self) -> dict:
+        done = max(1, self.completed)
+        return {
+            "workers": self.workers,
+            "queue_depth": max(0, self.pending - self.running),
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_s / done * 1000, 2),
+            "avg_hash_ms": round(self.total_run_s / done * 1000, 2),
+        }
+
+
+hasher = PasswordHasher()
@@ -1,22 +1,102 @@
 import os
-from pinecone import Pinecone 
+import logging
+import hashlib
+import threading
 from dotenv import load_dotenv
 
+from .vector_store import NumpyVectorStore, PineconeVectorStore
+from .observability import traced
+
 load_dotenv()
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+logger = logging.getLogger(__name__)
 
+# --- Vector Index (connected on first use) ---
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 index_name = os.getenv("PINECONE_INDEX")
-index = pc.Index(index_name)
+# "pinecone" uses the hosted index; "numpy" (alias "local") keeps an in-process index.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone" if PINECONE_API_KEY and index_name else "numpy").lower()
+index = None
+_index_lock = threading.Lock()
+_init_attempted = False
+
+
+def get_index():
+    """Creates the configured vector store on first use; returns None if it is unavailable."""
+    global index, _init_attempted
+    if _init_attempted:
+        return index
+    with _index_lock:
+        if not _init_attempted:
+            if VECTOR_BACKEND in ("numpy", "local"):
+                index = NumpyVectorStore()
+                logger.info("Using in-process NumPy vector index.")
+            elif PINECONE_API_KEY and index_name:
+                try:
+                    from pinecone import Pinecone
+                    pc = Pinecone(api_key=PINECONE_API_KEY)
+                    index = PineconeVectorStore(pc.Index(index_name))
+                except Exception as e:
+                    logger.warning(f"Could not connect to Pinecone index '{index_name}'. Error: {e}")
+            else:
+                logger.warning("PINECONE_API_KEY or PINECONE_INDEX not found! Vector memory disabled.")
+            _init_attempted = True
+    return index
+
+
+def content_id(user_id: str, text: str) -> str:
+    """Deterministic vector id for a user's text (stable across restarts, unlike hash())."""
+    return f"{user_id}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]}"
+
 
+def upsert_memory(user_id: str, embedding: list, text: str, metadata: dict = None, namespace: str = "", vid: str = None):
+    upsert_memories([(user_id, embedding, text, metadata)], namespace=namespace, ids=[vid] if vid else None)
 
-def upsert_memory(user_id: str, embedding: list, text: str):
-    if not index or not embedding:
+@traced("db", "vector", "upsert")
+def upsert_memories(items: list, namespace: str = "", ids: list = None):
+    """Batched upsert of (user_id, embedding, text, metadata) tuples."""
+    index = get_index()
+    if not index:
         return
-    vid = f"{user_id}-{abs(hash(text))}"
-    index.upsert([(vid, embedding, {"text": text, "user_id": user_id})])
+    vectors = []
+    for i, (user_id, embedding, text, metadata) in enumerate(items):
+        if not embedding:
+            continue
+        vid = ids[i] if ids else content_id(user_id, text)
+        vectors.append((vid, embedding, {"text": text, "user_id": user_id, **(metadata or {})}))
+    if vectors:
+        index.upsert(vectors, namespace=namespace)
 
-def query_memory(embedding: list, top_k: int = 3):
-    if not index or not embedding:
+@traced("db", "vector", "query")
+def query_matches_batch(embeddings: list, top_k: int = 3, filter: dict = None, namespace: str = "") -> list:
+    """Batched query; returns one list of {id, score, metadata} matches per embedding."""
+    index = get_index()
+    if not index or not embeddings:
+        return [[] for _ in embeddings]
+    results = index.query_batch(embeddings, top_k=top_k, include_metadata=True, filter=filter, namespace=namespace)
+    return [
+        [{"id": m["id"], "score": m["score"], "metadata": m["metadata"] or {}} for m in res["matches"]]
+        for res in results
+    ]
+
+def query_matches(embedding: list, top_k: int = 3, filter: dict = None, namespace: str = "") -> list:
+    """Returns raw matches as dicts with id, score and metadata."""
+    if not embedding:
         return []
-    res = index.query(vector=embedding, top_k=top_k, include_metadata=True)
-    return [m['metadata']['text'] for m in res['matches']]
\ No newline at end of file
+    return query_matches_batch([embedding], top_k, filter=filter, namespace=namespace)[0]
+
+@traced("db", "vector", "delete")
+def delete_memory(ids: list, namespace: str = ""):
+    index = get_index()
+    if not index or not ids:
+        return
+    index.delete(ids=ids, namespace=namespace)
+
+@traced("db", "vector", "count")
+def count_vectors(namespace: str = "") -> int:
+    index = get_index()
+    return index.count(namespace=namespace) if index else 0
+
+def persist():
+    """Flushes a local index to VECTOR_INDEX_DIR (no-op for Pinecone)."""
+    if index is not None:
+        index.persist()
@@ -0,0 +1,240 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+from .observability import latency_summary
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Prompt Configuration ---
+# System prompt variant served to everyone not covered by PROMPT_AB_SPLIT.
+PROMPT_VARIANT = os.getenv("PROMPT_VARIANT", "health-v1")
+# A/B test, e.g. "health-v1=50,health-compact-v1=50": each user is assigned a variant by a
+# stable hash of their id, so a user's prompt prefix stays identical across requests.
+PROMPT_AB_SPLIT = os.getenv("PROMPT_AB_SPLIT", "")
+PROMPT_AB_SALT = os.getenv("PROMPT_AB_SALT", "prompt-ab-1")  # change to reshuffle users
+# Users whose previous request prefix is remembered, to measure how much of each prompt repeats.
+PROMPT_PREFIX_TRACKED_USERS = int(os.getenv("PROMPT_PREFIX_TRACKED_USERS", "10000"))
+
+# Per-message overhead for role/formatting tokens in chat-completion requests.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TOKENIZER_ENCODING = "cl100k_base"
+
+_encoding = None
+_encoding_loaded = False
+
+
+# --- Token Counting ---
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            _encoding = None
+            logger.warning(f"tiktoken is unavailable; token counts are estimated at ~4 characters per token. "
+                           f"Error: {e}")
+        _encoding_loaded = True
+    return _encoding
+
+
+def tokenizer_name() -> str:
+    """The counter behind count_tokens, so reports are not mistaken for real token counts when estimated."""
+    return f"tiktoken:{TOKENIZER_ENCODING}" if _get_encoding() is not None else "estimate:4-chars-per-token"
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken when available, else a ~4 chars/token estimate."""
+    encoding = _get_encoding()
+    if not text:
+        return 0
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + 3) // 4)
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+# --- System Prompt Templates ---
+class PromptTemplate:
+    """A named, versioned system prompt, compiled once into its chat message."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.message = {"role": "system", "content": text}
+        self._tokens = None
+
+    @property
+    def tokens(self) -> int:
+        if self._tokens is None:
+            self._tokens = message_tokens(self.message)
+        return self._tokens
+
+
+# Templates are never edited in place: a changed prompt gets a new name, so
+# reports and A/B results always refer to exactly one text.
+SYSTEM_PROMPTS = {t.name: t for t in (
+    PromptTemplate("health-v1", (
+        "You are a highly sophisticated and empathetic AI Health Assistant. "
+        "Your primary role is to provide safe, informative, and helpful preliminary guidance based on user-provided symptoms, medical questions, or images. "
+        "You must adhere to the following strict guidelines for every response:\n\n"
+        "1. **Safety First Disclaimer (Mandatory):** ALWAYS begin your response with a clear and prominent disclaimer. State that you are an AI assistant, not a medical professional, and your analysis is for informational purposes only. Strongly urge the user to consult a qualified healthcare provider for an accurate diagnosis and treatment plan.\n\n"
+        "2. **Symptom Analysis:** Carefully analyze the symptoms or query provided by the user.\n\n"
+        "3. **Provide Potential Conditions:** Based on the analysis, list a few *potential* conditions that might be associated with the symptoms. Use cautious language like 'Some conditions that can cause these symptoms include...' or 'This could possibly be related to...'.\n\n"
+        "4. **Actionable Advice & Recommendations:** Provide general, safe, and actionable advice. This should include lifestyle or dietary suggestions where appropriate.\n\n"
+        "5. **NEVER Diagnose:** Under no circumstances should you provide a definitive diagnosis. Do not say 'You have...' or 'This is...'. Always frame it as a possibility.\n\n"
+        "6. **Empathetic Tone:** Maintain a professional, calm, and empathetic tone throughout the conversation."
+    )),
+    # Same six rules, without the headings and repetition.
+    PromptTemplate("health-compact-v1", (
+        "You are an empathetic AI Health Assistant giving safe, informative preliminary guidance on symptoms, "
+        "medical questions and images. In every response:\n"
+        "1. Start with a clear disclaimer: you are an AI, not a medical professional; this is information only; "
+        "urge the user to see a qualified healthcare provider for diagnosis and treatment.\n"
+        "2. Analyze the user's symptoms or question carefully.\n"
+        "3. List a few *possible* related conditions in cautious language ('this could be related to...').\n"
+        "4. Give general, safe, actionable advice, including lifestyle and diet where relevant.\n"
+        "5. Never diagnose: never say 'You have...' or 'This is...'.\n"
+        "6. Keep a calm, professional, empathetic tone."
+    )),
+)}
+
+
+def _parse_split(spec: str) -> list:
+    split = []
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if not name:
+            continue
+        if name not in SYSTEM_PROMPTS:
+            logger.warning(f"Unknown prompt variant '{name}' in PROMPT_AB_SPLIT; ignoring it.")
+            continue
+        split.append((name, float(weight or 1)))
+    return [(name, weight) for name, weight in split if weight > 0]
+
+
+if PROMPT_VARIANT not in SYSTEM_PROMPTS:
+    logger.warning(f"Unknown PROMPT_VARIANT '{PROMPT_VARIANT}'; using 'health-v1'.")
+    PROMPT_VARIANT = "health-v1"
+_ab_split = _parse_split(PROMPT_AB_SPLIT)
+
+
+def select_variant(user_id: str = None) -> PromptTemplate:
+    """The user's A/B variant (stable per user), or PROMPT_VARIANT when no split applies."""
+    if not _ab_split or not user_id:
+        return SYSTEM_PROMPTS[PROMPT_VARIANT]
+    digest = hashlib.sha1(f"{PROMPT_AB_SALT}:{user_id}".encode()).digest()
+    point = int.from_bytes(digest[:8], "big") / 2**64 * sum(weight for _, weight in _ab_split)
+    for name, weight in _ab_split:
+        point -= weight
+        if point < 0:
+            return SYSTEM_PROMPTS[name]
+    return SYSTEM_PROMPTS[_ab_split[-1][0]]
+
+
+# --- Message Assembly ---
+_prefix_lock = threading.Lock()
+_previous_prefixes = OrderedDict()  # user id -> message digests of the user's previous request
+
+
+def _digest(message: dict) -> bytes:
+    return hashlib.sha1(json.dumps([message["role"], message["content"]]).encode()).digest()
+
+
+def _repeated_prefix(user_id: str, digests: list) -> int:
+    """Number of leading messages identical to the user's previous request; remembers this one."""
+    if not user_id:
+        return 0
+    with _prefix_lock:
+        previous = _previous_prefixes.pop(user_id, ())
+        _previous_prefixes[user_id] = digests
+        while len(_previous_prefixes) > PROMPT_PREFIX_TRACKED_USERS:
+            _previous_prefixes.popitem(last=False)
+    count = 0
+    for a, b in zip(previous, digests):
+        if a != b:
+            break
+        count += 1
+    return count
+
+
+def build_messages(prompt: str, history: list = None, user_id: str = None) -> tuple:
+    """
+    Returns (messages, report) for a chat completion.
+
+    Messages are always ordered system prompt, then `history` as built by
+    context_builder (summary, verbatim turns, then per-prompt retrieved
+    memories), then the new prompt, so everything up to the first changed
+    message is byte-identical to the user's previous request and can be served
+    from a provider-side prefix cache. The report counts prompt tokens and how
+    many of them repeat that previous request's prefix.
+    """
+    template = select_variant(user_id)
+    messages = [template.message]
+    if history:
+        messages.extend(history)
+    messages.append({"role": "user", "content": prompt})
+
+    tokens = [template.tokens] + [message_tokens(m) for m in messages[1:]]
+    repeated = _repeated_prefix(user_id, [_digest(m) for m in messages])
+    return messages, {
+        "variant": template.name,
+        "messages": len(messages),
+        "prompt_tokens": sum(tokens),
+        "system_tokens": template.tokens,
+        "new_tokens": tokens[-1],
+        "cached_prefix_tokens": sum(tokens[:repeated]),
+        "tokenizer": tokenizer_name(),
+    }
+
+
+# --- Per-Variant Stats ---
+class PromptStats:
+    """Prompt size, repeated prefix and LLM latency per variant, for comparing A/B arms."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._variants = {}
+        self._window = window
+
+    def record(self, report: dict, latency_ms: float):
+        with self._lock:
+            v = self._variants.setdefault(report["variant"], {
+                "requests": 0, "prompt_tokens": 0, "cached_prefix_tokens": 0, "latency": deque(maxlen=self._window),
+            })
+            v["requests"] += 1
+            v["prompt_tokens"] += report["prompt_tokens"]
+            v["cached_prefix_tokens"] += report["cached_prefix_tokens"]
+            v["latency"].append(latency_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            variants = {name: dict(v, latency=list(v["latency"])) for name, v in self._variants.items()}
+        out = {}
+        for name, v in variants.items():
+            latency, n = latency_summary(v["latency"]), v["requests"]
+            out[name] = {
+                "requests": n,
+                "prompt_tokens": v["prompt_tokens"],
+                "cached_prefix_tokens": v["cached_prefix_tokens"],
+                "avg_prompt_tokens": round(v["prompt_tokens"] / n, 1),
+                "avg_cached_prefix_tokens": round(v["cached_prefix_tokens"] / n, 1),
+                "cached_prefix_ratio": round(v["cached_prefix_tokens"] / v["prompt_tokens"], 3) if v["prompt_tokens"] else 0.0,
+                "p50_ms": latency["p50_ms"],
+                "p95_ms": latency["p95_ms"],
+            }
+        return {"default_variant": PROMPT_VARIANT, "ab_split": dict(_ab_split), "tokenizer": tokenizer_name(),
+                "variants": out}
+
+
+prompt_stats = PromptStats()
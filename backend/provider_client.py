@@ -0,0 +1,521 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Provider Configuration ---
+# Groq exposes an OpenAI-compatible REST API; GROQ_BASE_URL can point at a fake server.
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+
+# --- Connection Pool and Deadlines ---
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+PROVIDER_MAX_KEEPALIVE = int(os.getenv("PROVIDER_MAX_KEEPALIVE", "20"))
+PROVIDER_CONNECT_TIMEOUT_S = float(os.getenv("PROVIDER_CONNECT_TIMEOUT_S", "3"))
+PROVIDER_DEADLINE_S = float(os.getenv("PROVIDER_DEADLINE_S", "30"))  # whole call, retries included
+PROVIDER_FIRST_TOKEN_TIMEOUT_S = float(os.getenv("PROVIDER_FIRST_TOKEN_TIMEOUT_S", "10"))
+
+# --- Retries, Circuit Breaker and Hedging ---
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "2"))
+PROVIDER_BACKOFF_BASE_MS = float(os.getenv("PROVIDER_BACKOFF_BASE_MS", "200"))
+PROVIDER_BACKOFF_MAX_MS = float(os.getenv("PROVIDER_BACKOFF_MAX_MS", "2000"))
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "5"))
+PROVIDER_BREAKER_RESET_S = float(os.getenv("PROVIDER_BREAKER_RESET_S", "30"))
+PROVIDER_HEDGE_AFTER_MS = float(os.getenv("PROVIDER_HEDGE_AFTER_MS", "0"))  # 0 disables hedging
+# A smaller model raced against (or substituted for) the primary when it is slow or failing.
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+LLM_FALLBACK_AFTER_MS = float(os.getenv("LLM_FALLBACK_AFTER_MS", "0"))  # 0 = only after failure
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class ProviderError(Exception):
+    """A failed provider call; `retryable` marks transient failures (timeouts, 429, 5xx)."""
+
+    def __init__(self, message: str, status: int = None, retryable: bool = False, retry_after_s: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after_s = retry_after_s
+
+
+class CircuitOpenError(ProviderError):
+    """Raised without calling the provider while a circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_after_s`; then lets a single probe through (half-open) and closes
+    again on its success. A probe that ends without an outcome (cancelled, or
+    an unexpected error) must `release()` its slot so another probe can run.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = PROVIDER_BREAKER_FAILURES,
+                 reset_after_s: float = PROVIDER_BREAKER_RESET_S):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_after_s = reset_after_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after_s:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """Frees the half-open probe slot of a call that ended without success or failure."""
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+def _backoff_s(attempt: int, retry_after_s: float = None) -> float:
+    """Full-jitter exponential backoff, honouring a provider's Retry-After when larger."""
+    cap = min(PROVIDER_BACKOFF_MAX_MS, PROVIDER_BACKOFF_BASE_MS * (2 ** attempt)) / 1000.0
+    delay = random.uniform(0, cap)
+    return max(delay, retry_after_s or 0.0)
+
+
+def _error_from_response(response) -> ProviderError:
+    retry_after = response.headers.get("retry-after")
+    try:
+        retry_after_s = float(retry_after) if retry_after else None
+    except ValueError:
+        retry_after_s = None
+    return ProviderError(
+        f"Provider returned HTTP {response.status_code}: {response.text[:200]}",
+        status=response.status_code,
+        retryable=response.status_code in RETRYABLE_STATUS,
+        retry_after_s=retry_after_s,
+    )
+
+
+def _error_from_exception(exc: Exception) -> ProviderError:
+    import httpx
+    if isinstance(exc, ProviderError):
+        return exc
+    if isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return ProviderError(f"{type(exc).__name__}: {exc}", retryable=True)
+    return ProviderError(f"{type(exc).__name__}: {exc}")
+
+
+def _json_body(response) -> dict:
+    try:
+        return response.json()
+    except ValueError as e:
+        raise ProviderError(f"Provider returned invalid JSON: {e}", status=response.status_code)
+
+
+def _field(data, *path):
+    """`data[path[0]][path[1]]...`, raising ProviderError when the response has another shape."""
+    try:
+        for key in path:
+            data = data[key]
+    except (KeyError, IndexError, TypeError):
+        raise ProviderError(f"Unexpected provider response shape: missing {list(path)}")
+    return data
+
+
+class ProviderClient:
+    """
+    Shared HTTP client for the LLM and speech-to-text provider.
+
+    One pooled connection set is used for sync and one for async calls. Every
+    call runs under a deadline that covers all of its attempts; retryable
+    failures are retried with jittered exponential backoff, and a circuit
+    breaker per model stops sending traffic to a model that keeps failing.
+    Async chat calls can additionally be hedged (a duplicate request after
+    PROVIDER_HEDGE_AFTER_MS) and fall back to LLM_FALLBACK_MODEL.
+    """
+
+    def __init__(self, base_url: str = GROQ_BASE_URL, api_key: str = GROQ_API_KEY):
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._counters = {
+            "calls": 0, "attempts": 0, "retries": 0, "failures": 0, "circuit_rejections": 0,
+            "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "fallback_wins": 0,
+        }
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] += n
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(key)
+            return self._breakers[key]
+
+    # --- Pooled HTTP Clients (created on first use) ---
+    def _client_options(self) -> dict:
+        import httpx
+        return {
+            "base_url": self.base_url,
+            "headers": {"Authorization": f"Bearer {self.api_key}"},
+            "limits": httpx.Limits(max_connections=PROVIDER_MAX_CONNECTIONS,
+                                   max_keepalive_connections=PROVIDER_MAX_KEEPALIVE),
+            "timeout": httpx.Timeout(PROVIDER_DEADLINE_S, connect=PROVIDER_CONNECT_TIMEOUT_S),
+        }
+
+    def sync_client(self):
+        if self._client is None:
+            import httpx
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(**self._client_options())
+        return self._client
+
+    def async_client(self):
+        if self._async_client is None:
+            import httpx
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = httpx.AsyncClient(**self._client_options())
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    # --- Single Attempts ---
+    def _post(self, path: str, timeout_s: float, **kwargs) -> dict:
+        self._count("attempts")
+        try:
+            response = self.sync_client().post(path, timeout=timeout_s, **kwargs)
+        except Exception as e:
+            raise _error_from_exception(e)
+        if response.status_code >= 400:
+            raise _error_from_response(response)
+        return _json_body(response)
+
+    async def _apost(self, path: str, timeout_s: float, **kwargs) -> dict:
+        self._count("attempts")
+        try:
+            response = await self.async_client().post(path, timeout=timeout_s, **kwargs)
+        except Exception as e:
+            raise _error_from_exception(e)
+        if response.status_code >= 400:
+            raise _error_from_response(response)
+        return _json_body(response)
+
+    # --- Retry Policy ---
+    def call(self, key: str, attempt_fn, deadline_s: float = PROVIDER_DEADLINE_S):
+        """Runs `attempt_fn(timeout_s)` with retries under one deadline (blocking)."""
+        self._count("calls")
+        breaker = self.breaker(key)
+        deadline = time.monotonic() + deadline_s
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self._count("circuit_rejections")
+                raise CircuitOpenError(f"Circuit for '{key}' is open.")
+            remaining = deadline - time.monotonic()
+            try:
+                result = attempt_fn(remaining)
+            except ProviderError as e:
+                breaker.record_failure()
+                delay = _backoff_s(attempt, e.retry_after_s)
+                if not e.retryable or attempt >= PROVIDER_MAX_RETRIES or delay >= deadline - time.monotonic():
+                    self._count("failures")
+                    raise
+                attempt += 1
+                self._count("retries")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                breaker.release()
+                raise
+            breaker.record_success()
+            return result
+
+    async def acall(self, key: str, attempt_fn, deadline_s: float = PROVIDER_DEADLINE_S,
+                    hedge_after_s: float = 0.0):
+        """Async variant of `call`; `attempt_fn(timeout_s)` returns a coroutine. Optionally hedged."""
+        self._count("calls")
+        breaker = self.breaker(key)
+        deadline = time.monotonic() + deadline_s
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self._count("circuit_rejections")
+                raise CircuitOpenError(f"Circuit for '{key}' is open.")
+            remaining = deadline - time.monotonic()
+            try:
+                if hedge_after_s > 0:
+                    coro = self._hedged(lambda: attempt_fn(deadline - time.monotonic()), hedge_after_s)
+                else:
+                    coro = attempt_fn(remaining)
+                result = await asyncio.wait_for(coro, remaining)
+            except (ProviderError, asyncio.TimeoutError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = ProviderError(f"Deadline of {deadline_s:g}s exceeded.", retryable=False)
+                breaker.record_failure()
+                delay = _backoff_s(attempt, e.retry_after_s)
+                if not e.retryable or attempt >= PROVIDER_MAX_RETRIES or delay >= deadline - time.monotonic():
+                    self._count("failures")
+                    raise e
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (client gone, stage timeout, lost a fallback race) or an unexpected error.
+                breaker.release()
+                raise
+            breaker.record_success()
+            return result
+
+    async def _hedged(self, make_coro, hedge_after_s: float):
+        """Starts a second identical request if the first has not finished within `hedge_after_s`."""
+        return await self._race(make_coro, make_coro, hedge_after_s, "hedges", "hedge_wins", fail_fast=True)
+
+    async def _race(self, primary, secondary, delay_s: float, started_counter: str, win_counter: str,
+                    fail_fast: bool = False):
+        """
+        Runs `primary()`; if it fails or has not finished after `delay_s`, also
+        runs `secondary()`, and returns the first successful result. If both
+        fail, the last error is raised. With `fail_fast`, a non-retryable
+        primary failure is raised without starting `secondary`.
+        """
+        first = asyncio.ensure_future(primary())
+        done, _ = await asyncio.wait({first}, timeout=delay_s)
+        if done and first.exception() is None:
+            return first.result()
+        if done and fail_fast and not getattr(first.exception(), "retryable", False):
+            raise first.exception()
+        self._count(started_counter)
+        second = asyncio.ensure_future(secondary())
+        pending = {second} if done else {first, second}
+        last_error = first.exception() if done else None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count(win_counter)
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+            # Let the losers unwind (and release any breaker probe) before returning.
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    # --- Chat Completions ---
+    def _models(self, model: str) -> list:
+        return [model] + ([LLM_FALLBACK_MODEL] if LLM_FALLBACK_MODEL and LLM_FALLBACK_MODEL != model else [])
+
+    def chat(self, messages: list, model: str, deadline_s: float = PROVIDER_DEADLINE_S, **params) -> str:
+        """Blocking chat completion with retries, falling back to LLM_FALLBACK_MODEL on failure."""
+        error = None
+        for i, candidate in enumerate(self._models(model)):
+            if i:
+                self._count("fallbacks")
+            payload = {"model": candidate, "messages": messages, **params}
+            try:
+                content = self.call(
+                    f"chat:{candidate}",
+                    lambda timeout_s: _field(self._post("/chat/completions", timeout_s, json=payload),
+                                             "choices", 0, "message", "content"),
+                    deadline_s,
+                )
+            except ProviderError as e:
+                error = e
+                continue
+            if i:
+                self._count("fallback_wins")
+            return content
+        raise error
+
+    async def achat(self, messages: list, model: str, deadline_s: float = PROVIDER_DEADLINE_S, **params) -> str:
+        """
+        Async chat completion. Requests are hedged when PROVIDER_HEDGE_AFTER_MS is
+        set; with LLM_FALLBACK_AFTER_MS the fallback model is raced against a slow
+        primary, otherwise it is only tried after the primary fails.
+        """
+        hedge_after_s = PROVIDER_HEDGE_AFTER_MS / 1000.0
+
+        def run(candidate: str):
+            payload = {"model": candidate, "messages": messages, **params}
+
+            async def attempt(timeout_s: float) -> str:
+                data = await self._apost("/chat/completions", timeout_s, json=payload)
+                return _field(data, "choices", 0, "message", "content")
+
+            return self.acall(f"chat:{candidate}", attempt, deadline_s, hedge_after_s)
+
+        models = self._models(model)
+        if len(models) == 1:
+            return await run(model)
+        if LLM_FALLBACK_AFTER_MS > 0:
+            return await self._race(lambda: run(models[0]), lambda: run(models[1]),
+                                    LLM_FALLBACK_AFTER_MS / 1000.0, "fallbacks", "fallback_wins")
+        try:
+            return await run(models[0])
+        except ProviderError:
+            self._count("fallbacks")
+            content = await run(models[1])
+            self._count("fallback_wins")
+            return content
+
+    async def astream_chat(self, messages: list, model: str, first_token_timeout_s: float = None,
+                           deadline_s: float = PROVIDER_DEADLINE_S, **params):
+        """
+        Streams chat completion deltas. Connection errors, retryable statuses and
+        a missed first-token deadline are retried (then fall back to
+        LLM_FALLBACK_MODEL) only until the first token has been yielded.
+        """
+        first_token_timeout_s = first_token_timeout_s or PROVIDER_FIRST_TOKEN_TIMEOUT_S
+        error = None
+        for i, candidate in enumerate(self._models(model)):
+            if i:
+                self._count("fallbacks")
+            payload = {"model": candidate, "messages": messages, "stream": True, **params}
+            try:
+                opened = await self.acall(
+                    f"chat:{candidate}",
+                    lambda timeout_s: self._open_stream(payload, min(timeout_s, first_token_timeout_s)),
+                    deadline_s,
+                )
+            except ProviderError as e:
+                error = e
+                continue
+            if i:
+                self._count("fallback_wins")
+            first_delta, stream = opened
+            try:
+                if first_delta:
+                    yield first_delta
+                async for delta in stream:
+                    yield delta
+            finally:
+                await stream.aclose()
+            return
+        raise error
+
+    async def _open_stream(self, payload: dict, first_token_timeout_s: float) -> tuple:
+        """Opens a streamed completion and waits for its first delta (one attempt)."""
+        import httpx
+        self._count("attempts")
+        client = self.async_client()
+        request = client.build_request("POST", "/chat/completions", json=payload,
+                                       timeout=httpx.Timeout(PROVIDER_DEADLINE_S, connect=PROVIDER_CONNECT_TIMEOUT_S))
+        try:
+            response = await asyncio.wait_for(client.send(request, stream=True), first_token_timeout_s)
+        except asyncio.TimeoutError:
+            raise ProviderError("Timed out waiting for the stream to start.", retryable=True)
+        except Exception as e:
+            raise _error_from_exception(e)
+        if response.status_code >= 400:
+            await response.aread()
+            await response.aclose()
+            raise _error_from_response(response)
+
+        stream = _iter_deltas(response)
+        try:
+            first = await asyncio.wait_for(stream.__anext__(), first_token_timeout_s)
+        except StopAsyncIteration:
+            first = ""
+        except asyncio.TimeoutError:
+            await stream.aclose()
+            raise ProviderError("Timed out waiting for the first token.", retryable=True)
+        except Exception as e:
+            await stream.aclose()
+            raise _error_from_exception(e)
+        return first, stream
+
+    # --- Speech-to-Text ---
+    def transcribe(self, filename: str, file_obj, model: str, deadline_s: float = PROVIDER_DEADLINE_S,
+                   content_type: str = None) -> str:
+        """Blocking transcription with retries; the file is rewound before every attempt."""
+        start = file_obj.tell() if hasattr(file_obj, "tell") else 0
+
+        def attempt(timeout_s: float):
+            if hasattr(file_obj, "seek"):
+                file_obj.seek(start)
+            file_part = (filename, file_obj, content_type) if content_type else (filename, file_obj)
+            return self._post("/audio/transcriptions", timeout_s,
+                              data={"model": model, "response_format": "json"},
+                              files={"file": file_part})
+
+        return self.call(f"stt:{model}", lambda timeout_s: _field(attempt(timeout_s), "text"), deadline_s)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            breakers = list(self._breakers.values())
+        counters["breakers"] = {b.name: b.stats() for b in breakers}
+        return counters
+
+
+async def _iter_deltas(response):
+    """Parses an OpenAI-style SSE stream into content deltas, closing the response at the end."""
+    try:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if delta:
+                yield delta
+    finally:
+        await response.aclose()
+
+
+provider = ProviderClient()
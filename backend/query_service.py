@@ -1,83 +1,358 @@
 from fastapi import APIRouter, Depends, File, UploadFile, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import Optional
+import os
+import logging
+import json
+import time
+import asyncio
+from datetime import datetime, timezone
 from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
 
 # Import all required custom service modules
 from . import mongo_memory
+from . import caption_service
+from .caption_cache import cache as caption_cache
 from . import llm_service
+from . import context_builder
+from . import memory_retrieval
+from .semantic_cache import cache as semantic_cache
 from . import speech_service
-from .auth import get_current_user
-from .sql import User
+from .auth import get_current_user, AuthenticatedUser
+from .upload_limits import check_upload, UPLOAD_MAX_IMAGE_BYTES, UPLOAD_MAX_AUDIO_BYTES
+from .observability import span, traced, observe
+
+logger = logging.getLogger(__name__)
 
 # --- Router Setup ---
 router = APIRouter(prefix="/query", tags=["Query Service"])
 
-# --- Load Image Captioning Model Globally ---
-try:
-    processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-    model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
-    print("✅ BLIP image captioning model loaded successfully.")
-except Exception as e:
-    processor = None
-    model = None
-    print(f"⚠️ WARNING: Could not load BLIP model. Image functionality will be disabled. Error: {e}")
+# --- Per-Stage Deadlines (seconds) ---
+STT_TIMEOUT_S = float(os.getenv("STT_TIMEOUT_S", "30"))
+CAPTION_TIMEOUT_S = float(os.getenv("CAPTION_TIMEOUT_S", "20"))
 
+# --- Image Pre-Shrinking ---
+# BLIP's processor resizes to 384px anyway; decoding beyond twice that only costs memory.
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", str(2 * caption_service.CAPTION_IMAGE_SIZE)))
+UPLOAD_MAX_IMAGE_PIXELS = int(os.getenv("UPLOAD_MAX_IMAGE_PIXELS", "100000000"))
+_BYTES_PER_PIXEL = 4  # Pillow keeps RGB bitmaps at 4 bytes per pixel
 
-# --- NEW UNIFIED MULTIMODAL ENDPOINT ---
-@router.post("/multimodal")
-async def handle_multimodal_query(
-    current_user: User = Depends(get_current_user),
-    text_query: str = Form(""),
-    audio_file: Optional[UploadFile] = File(None),
-    image_file: Optional[UploadFile] = File(None)
-):
+
+def _load_rgb_image(file_obj) -> tuple:
     """
-    Handles any combination of text, voice, and image inputs in a single request.
+    Decodes an uploaded image into RGB no larger than IMAGE_MAX_SIDE (runs in
+    the threadpool). JPEGs are decoded directly at a reduced scale via draft(),
+    so the full-resolution bitmap is never allocated. Returns (image, memory report).
     """
-    user_id_str = str(current_user.id)
-    transcribed_text = None
-    image_caption = None
-    prompt_parts = []
+    image = Image.open(file_obj)  # reads the header only
+    source_w, source_h = image.size
+    if source_w * source_h > UPLOAD_MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=413, detail=f"The image is {source_w}x{source_h}; it has too many pixels.")
+    image.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+    decoded_w, decoded_h = image.size
+    image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+    image = image.convert("RGB")
+    report = {
+        "source_px": [source_w, source_h],
+        "decoded_px": [decoded_w, decoded_h],
+        "final_px": list(image.size),
+        "full_decode_mb": round(source_w * source_h * _BYTES_PER_PIXEL / 2**20, 2),
+        "decoded_mb": round(decoded_w * decoded_h * _BYTES_PER_PIXEL / 2**20, 2),
+    }
+    return image, report
+
+
+async def _caption_image(image_file: UploadFile, memory: dict) -> str:
+    """Decodes an upload and returns its caption, using the cache when possible."""
+    if not caption_service.engine.available:
+        raise HTTPException(status_code=503, detail="Image processing service is currently unavailable.")
+    try:
+        image, report = await run_in_threadpool(_load_rgb_image, image_file.file)
+    except (OSError, Image.DecompressionBombError) as e:
+        # OSError covers unidentified formats and truncated or corrupt image data.
+        raise HTTPException(status_code=400, detail=f"The uploaded image could not be decoded: {e}")
+    memory["image"].update(report)
+    fingerprint, image_caption = await run_in_threadpool(caption_cache.lookup, image)
+    if image_caption is None:
+        try:
+            image_caption = await caption_service.engine.caption(image)
+        except caption_service.CaptionQueueFull:
+            raise HTTPException(
+                status_code=503,
+                detail="Image processing is busy. Please retry shortly.",
+                headers={"Retry-After": str(caption_service.CAPTION_RETRY_AFTER_S)},
+            )
+        except caption_service.CaptionModelUnavailable:
+            raise HTTPException(status_code=503, detail="Image processing service is currently unavailable.")
+        await run_in_threadpool(caption_cache.put, fingerprint, image_caption)
+    return image_caption
+
+
+async def _transcribe_audio(audio_file: UploadFile, memory: dict) -> str:
+    """Runs the blocking STT call (preprocessing, chunking, retries) in the threadpool."""
+    try:
+        transcribed_text, report = await run_in_threadpool(speech_service.transcribe, audio_file)
+    except speech_service.ProviderError as e:
+        raise HTTPException(status_code=500, detail=f"Speech-to-Text failed: {e}")
+    memory["audio"].update(report)
+    if not transcribed_text:
+        raise HTTPException(status_code=422, detail="No speech was detected in the recording.")
+    return transcribed_text
+
 
-    # 1. Process Voice Input (if provided)
+async def _timed_stage(name: str, coro, timeout_s: float, timings: dict):
+    """Awaits one pipeline stage under a deadline and records its wall time (ms)."""
+    start = time.perf_counter()
+    try:
+        with span("stage", name):
+            return await asyncio.wait_for(coro, timeout_s)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"The '{name}' stage timed out after {timeout_s:g}s.")
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+async def _build_prompt(text_query: str, audio_file: Optional[UploadFile], image_file: Optional[UploadFile]) -> dict:
+    """
+    Turns the raw inputs into the final LLM prompt plus the intermediate results.
+    Voice and image processing are independent, so they run concurrently; if one
+    fails while other input remains, the query continues and the failure is reported.
+    """
+    timings = {}
+    stages = {}
+    # Upload bytes and (for images) decoded-bitmap sizes, to make per-request memory visible.
+    memory = {}
     if audio_file:
-        transcribed_text = speech_service.speech_to_text(audio_file)
-        if transcribed_text.startswith("[stt_error]"):
-            raise HTTPException(status_code=500, detail=f"Speech-to-Text failed: {transcribed_text}")
+        # speech_service resamples, trims and re-encodes the recording before it is uploaded.
+        memory["audio"] = {"upload_mb": round(check_upload(audio_file, UPLOAD_MAX_AUDIO_BYTES, "audio") / 2**20, 2)}
+        stages["stt"] = _timed_stage("stt", _transcribe_audio(audio_file, memory), STT_TIMEOUT_S, timings)
+    if image_file:
+        memory["image"] = {"upload_mb": round(check_upload(image_file, UPLOAD_MAX_IMAGE_BYTES, "image") / 2**20, 2)}
+        stages["caption"] = _timed_stage("caption", _caption_image(image_file, memory), CAPTION_TIMEOUT_S, timings)
+
+    results = dict(zip(stages, await asyncio.gather(*stages.values(), return_exceptions=True)))
+    errors = {}
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            errors[name] = result
+    transcribed_text = results.get("stt") if "stt" not in errors else None
+    image_caption = results.get("caption") if "caption" not in errors else None
+
+    prompt_parts = []
+    # 1. Voice Input (if provided and transcribed)
+    if transcribed_text is not None:
         prompt_parts.append(f"The user said: '{transcribed_text}'.")
 
-    # 2. Process Image Input (if provided)
-    if image_file:
-        if not model or not processor:
-            raise HTTPException(status_code=503, detail="Image processing service is currently unavailable.")
-        image = Image.open(image_file.file).convert("RGB")
-        inputs = processor(image, return_tensors="pt")
-        out = model.generate(**inputs, max_new_tokens=50)
-        image_caption = processor.decode(out[0], skip_special_tokens=True)
+    # 2. Image Input (if provided and captioned)
+    if image_caption is not None:
         prompt_parts.append(f"The uploaded image appears to show: '{image_caption}'.")
 
     # 3. Process Text Input (if provided)
     if text_query.strip():
         prompt_parts.append(f"They also typed: '{text_query}'.")
-        
-    # 4. Check if any input was provided
+
+    # 4. Check if any usable input remains
     if not prompt_parts:
+        if errors:
+            error = next(iter(errors.values()))
+            if isinstance(error, HTTPException):
+                raise error
+            raise HTTPException(status_code=500, detail=f"Input processing failed: {error}")
         raise HTTPException(status_code=400, detail="No input provided. Please provide text, voice, or an image.")
 
+    for name, error in errors.items():
+        logger.warning(f"'{name}' stage failed; continuing with the remaining inputs. Error: {error}")
+
+    return {
+        "final_prompt": " ".join(prompt_parts),
+        "transcribed_text": transcribed_text,
+        "image_caption": image_caption,
+        "timings": timings,
+        "memory": memory,
+        "errors": {
+            name: (error.detail if isinstance(error, HTTPException) else str(error))
+            for name, error in errors.items()
+        },
+    }
+
+
+_background_tasks = set()
+
+def _spawn(coro):
+    """Runs a coroutine in the background, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _semantic_cache_lookup(inputs: dict, history: list) -> dict:
+    """Checks the shared answer cache for standalone text questions."""
+    if not semantic_cache.enabled:
+        return {"status": "disabled", "answer": None, "embedding": None}
+    if not semantic_cache.is_eligible(bool(history), inputs["image_caption"] is not None):
+        semantic_cache.record_bypass()
+        return {"status": "bypass", "answer": None, "embedding": None}
+    try:
+        with span("stage", "semantic_cache"):
+            answer, embedding = await run_in_threadpool(semantic_cache.lookup, inputs["final_prompt"])
+    except Exception as e:
+        logger.warning(f"Semantic cache lookup failed. Error: {e}")
+        return {"status": "error", "answer": None, "embedding": None}
+    return {"status": "hit" if answer is not None else "miss", "answer": answer, "embedding": embedding}
+
+
+def _semantic_cache_store(lookup: dict, prompt: str, text_response: str, failed: bool = False):
+    if lookup["status"] == "miss" and not failed and not llm_service.is_fallback_response(text_response):
+        _spawn(run_in_threadpool(semantic_cache.store, prompt, text_response, lookup["embedding"]))
+
+
+@traced("stage", "store_turn")
+async def _remember_turn(user_id: str, prompt: str, text_response: str, received_at: datetime, failed: bool = False):
+    """Stores the turn in Mongo and, unless the answer failed, queues it for long-term memory indexing."""
+    await mongo_memory.store_turn(user_id, prompt, text_response, user_timestamp=received_at)
+    if (memory_retrieval.MEMORY_RETRIEVAL_ENABLED and not failed
+            and not llm_service.is_fallback_response(text_response)):
+        memory_retrieval.indexer.enqueue(user_id, prompt, text_response, received_at)
+
+
+def _record_retrieval(context: dict, timings: dict):
+    if context["report"]["retrieval_ms"] is not None:
+        timings["retrieval"] = context["report"]["retrieval_ms"]
+
+
+async def _single(text: str):
+    yield text
+
+
+def _sse(event: str, data: dict) -> str:
+    """Formats a single server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def run_query(user_id_str: str, text_query: str, audio_file: Optional[UploadFile] = None,
+                    image_file: Optional[UploadFile] = None, received_at: datetime = None) -> dict:
+    """The full non-streaming pipeline: inputs -> context -> answer -> stored turn. Shared with /jobs."""
+    received_at = received_at or datetime.now(timezone.utc)
+    inputs = await _build_prompt(text_query, audio_file, image_file)
+
     # 5. Assemble the final prompt and get LLM response
-    final_prompt = " ".join(prompt_parts)
-    history = mongo_memory.get_user_memory(user_id_str)
-    text_response = llm_service.get_llm_response(final_prompt, history)
+    final_prompt = inputs["final_prompt"]
+    timings = inputs["timings"]
+    with span("stage", "context"):
+        context = await context_builder.build_context(user_id_str, prompt=final_prompt)
+    _record_retrieval(context, timings)
+    history = context["messages"]
+    cached = await _semantic_cache_lookup(inputs, history)
+    prompt_report = {}
+    if cached["answer"] is not None:
+        text_response = cached["answer"]
+    else:
+        llm_start = time.perf_counter()
+        with span("stage", "llm"):
+            text_response = await llm_service.aget_llm_response(final_prompt, history, user_id=user_id_str,
+                                                                 report=prompt_report)
+        timings["llm"] = round((time.perf_counter() - llm_start) * 1000, 1)
+        _semantic_cache_store(cached, final_prompt, text_response)
 
-    # 6. Store the conversation
-    mongo_memory.store_message(user_id_str, "user", final_prompt)
-    mongo_memory.store_message(user_id_str, "assistant", text_response)
+    # 6. Store the conversation turn in one write
+    await _remember_turn(user_id_str, final_prompt, text_response, received_at)
 
     # 7. Return all relevant data to the frontend
     return {
         "text_response": text_response,
-        "transcribed_text": transcribed_text,
-        "image_caption": image_caption
+        "transcribed_text": inputs["transcribed_text"],
+        "image_caption": inputs["image_caption"],
+        "timings": timings,
+        "memory": inputs["memory"],
+        "errors": inputs["errors"],
+        "context": context["report"],
+        "prompt": prompt_report,
+        "semantic_cache": cached["status"]
     }
 
+
+# --- NEW UNIFIED MULTIMODAL ENDPOINT ---
+@router.post("/multimodal")
+async def handle_multimodal_query(
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    text_query: str = Form(""),
+    audio_file: Optional[UploadFile] = File(None),
+    image_file: Optional[UploadFile] = File(None)
+):
+    """
+    Handles any combination of text, voice, and image inputs in a single request.
+    """
+    return await run_query(str(current_user.id), text_query, audio_file, image_file)
+
+
+# --- STREAMING VARIANT (Server-Sent Events) ---
+@router.post("/multimodal/stream")
+async def stream_multimodal_query(
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    text_query: str = Form(""),
+    audio_file: Optional[UploadFile] = File(None),
+    image_file: Optional[UploadFile] = File(None)
+):
+    """
+    Same inputs as /multimodal, but streams the answer as server-sent events:
+    one `meta` event, a `token` event per chunk, then `done` with timings.
+    """
+    user_id_str = str(current_user.id)
+    received_at = datetime.now(timezone.utc)
+    inputs = await _build_prompt(text_query, audio_file, image_file)
+    final_prompt = inputs["final_prompt"]
+    with span("stage", "context"):
+        context = await context_builder.build_context(user_id_str, prompt=final_prompt)
+    _record_retrieval(context, inputs["timings"])
+    history = context["messages"]
+    cached = await _semantic_cache_lookup(inputs, history)
+
+    async def event_stream():
+        yield _sse("meta", {
+            "transcribed_text": inputs["transcribed_text"],
+            "image_caption": inputs["image_caption"],
+            "timings": inputs["timings"],
+            "memory": inputs["memory"],
+            "errors": inputs["errors"],
+            "context": context["report"],
+            "semantic_cache": cached["status"],
+        })
+        parts = []
+        start = time.perf_counter()
+        ttft_ms = None
+        prompt_report = {}
+        if cached["answer"] is not None:
+            tokens = _single(cached["answer"])
+        else:
+            tokens = llm_service.stream_llm_response(final_prompt, history, user_id=user_id_str,
+                                                     report=prompt_report)
+        async for token in tokens:
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+                if cached["answer"] is None:
+                    # Cache hits have no model latency and would skew the TTFT percentiles.
+                    llm_service.record_ttft(ttft_ms)
+            parts.append(token)
+            yield _sse("token", {"text": token})
+        text_response = "".join(parts)
+        # A stream that fails mid-answer ends with the error message appended to a partial answer.
+        failed = prompt_report.get("failed", False)
+        if cached["answer"] is None:
+            observe("stage", "llm_stream", seconds=time.perf_counter() - start)
+        _semantic_cache_store(cached, final_prompt, text_response, failed)
+
+        # Persist the assembled answer once the stream has completed.
+        await _remember_turn(user_id_str, final_prompt, text_response, received_at, failed)
+        yield _sse("done", {
+            "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+            "prompt": prompt_report,
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
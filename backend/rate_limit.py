@@ -0,0 +1,96 @@
+import os
+import time
+import logging
+import ipaddress
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Login Throttling Configuration ---
+LOGIN_RATE_PER_MIN_USER = float(os.getenv("LOGIN_RATE_PER_MIN_USER", "10"))
+LOGIN_BURST_USER = int(os.getenv("LOGIN_BURST_USER", "5"))
+LOGIN_RATE_PER_MIN_IP = float(os.getenv("LOGIN_RATE_PER_MIN_IP", "60"))
+LOGIN_BURST_IP = int(os.getenv("LOGIN_BURST_IP", "20"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Proxies / load balancers in front of the API, as IPs or CIDRs ("10.0.0.0/8,127.0.0.1").
+# Requests from them are keyed on the client address in X-Forwarded-For; without this,
+# every client behind a proxy shares the proxy's per-IP login bucket. Leave empty when
+# uvicorn/gunicorn already rewrite the client address (--forwarded-allow-ips).
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+
+
+def _parse_networks(spec: str) -> list:
+    networks = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            logger.warning(f"Ignoring invalid TRUSTED_PROXIES entry '{part}'.")
+    return networks
+
+
+_trusted_networks = _parse_networks(TRUSTED_PROXIES)
+
+
+def _is_trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted_networks)
+
+
+def client_ip(request) -> str:
+    """
+    The address to rate-limit a request by: the peer, or, when the peer is a
+    trusted proxy, the nearest X-Forwarded-For hop that is not itself a
+    trusted proxy (hops further left are client-supplied and can be forged).
+    """
+    address = request.client.host if request.client else "unknown"
+    if not _trusted_networks or not _is_trusted(address):
+        return address
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        address = hop
+        if not _is_trusted(hop):
+            break
+    return address
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets: `burst` tokens, refilled at `rate_per_min` per minute."""
+
+    def __init__(self, rate_per_min: float, burst: int, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate_per_s = rate_per_min / 60.0
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last_refill)
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def acquire(self, key: str) -> float:
+        """Takes one token for `key`. Returns 0 on success, else seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate_per_s)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                self.throttled += 1
+                wait = (1 - tokens) / self.rate_per_s if self.rate_per_s > 0 else 60.0
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+login_user_limiter = TokenBucketLimiter(LOGIN_RATE_PER_MIN_USER, LOGIN_BURST_USER)
+login_ip_limiter = TokenBucketLimiter(LOGIN_RATE_PER_MIN_IP, LOGIN_BURST_IP)
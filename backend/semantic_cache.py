@@ -0,0 +1,136 @@
+import os
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+from . import pinecone_store
+from . import embedding_service
+
+load_dotenv()
+
+# --- Semantic Cache Configuration ---
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL_S = int(os.getenv("SEMANTIC_CACHE_TTL_S", str(24 * 3600)))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_NAMESPACE = os.getenv("SEMANTIC_CACHE_NAMESPACE", "semantic-cache")
+SEMANTIC_CACHE_SWEEP_S = float(os.getenv("SEMANTIC_CACHE_SWEEP_S", "60"))  # min interval between eviction sweeps
+_SWEEP_BATCH = 1000  # Pinecone's top_k limit for queries that return metadata
+# Cached answers are shared across users, so they are stored under a neutral owner.
+_SHARED_OWNER = "__shared__"
+
+
+class SemanticCache:
+    """
+    Reuses LLM answers for prompts that embed within `threshold` cosine
+    similarity of an earlier prompt. Entries live in the vector index under
+    their own namespace with a `created_at` timestamp, which drives TTL and
+    max-entry eviction, so entries written by other workers or earlier runs
+    are evicted too.
+    """
+
+    def __init__(self, enabled: bool = SEMANTIC_CACHE_ENABLED, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl_s: int = SEMANTIC_CACHE_TTL_S, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 namespace: str = SEMANTIC_CACHE_NAMESPACE, sweep_s: float = SEMANTIC_CACHE_SWEEP_S):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.namespace = namespace
+        self.sweep_s = sweep_s
+        self._last_sweep = 0.0
+        self._entries = 0  # store size as of the last sweep
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        if enabled:
+            embedding_service.register_model()
+
+    @staticmethod
+    def is_eligible(has_personal_context: bool, has_media: bool) -> bool:
+        """Only standalone text questions are shareable; history- or media-dependent turns bypass."""
+        return not has_personal_context and not has_media
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def lookup(self, prompt: str) -> tuple:
+        """Returns (cached answer or None, embedding). Blocking; run in a worker thread."""
+        embedding = embedding_service.embed_text(prompt)
+        matches = pinecone_store.query_matches(embedding, top_k=1, namespace=self.namespace)
+        now = time.time()
+        answer = None
+        if matches:
+            match = matches[0]
+            created_at = match["metadata"].get("created_at", 0)
+            if match["score"] >= self.threshold and now - created_at <= self.ttl_s:
+                answer = match["metadata"].get("answer")
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer, embedding
+
+    def store(self, prompt: str, answer: str, embedding: list = None):
+        """Adds a prompt/answer pair; at most every `sweep_s`, evicts expired or excess entries. Blocking."""
+        embedding = embedding or embedding_service.embed_text(prompt)
+        vid = "sc-" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:32]
+        now = time.time()
+        pinecone_store.upsert_memory(
+            _SHARED_OWNER, embedding, prompt,
+            metadata={"answer": answer, "created_at": now},
+            namespace=self.namespace, vid=vid,
+        )
+        with self._lock:
+            if now - self._last_sweep < self.sweep_s:
+                return
+            self._last_sweep = now
+        self.sweep(embedding, now)
+
+    def sweep(self, embedding: list, now: float = None) -> int:
+        """
+        Deletes entries whose stored `created_at` is past the TTL, then the
+        oldest entries beyond max_entries (oldest of a `_SWEEP_BATCH` sample),
+        at most `_SWEEP_BATCH` of each per call. `embedding` only anchors the
+        queries. Returns the number evicted. Blocking.
+        """
+        now = now or time.time()
+        total = pinecone_store.count_vectors(namespace=self.namespace)
+        expired = [m["id"] for m in pinecone_store.query_matches(
+            embedding, top_k=_SWEEP_BATCH, filter={"created_at": {"$lt": now - self.ttl_s}}, namespace=self.namespace,
+        )]
+        evicted = list(expired)
+        excess = total - len(expired) - self.max_entries
+        if excess > 0:
+            gone = set(expired)
+            sample = [m for m in pinecone_store.query_matches(embedding, top_k=_SWEEP_BATCH, namespace=self.namespace)
+                      if m["id"] not in gone]
+            sample.sort(key=lambda m: m["metadata"].get("created_at", 0))
+            evicted += [m["id"] for m in sample[:excess]]
+        if evicted:
+            pinecone_store.delete_memory(evicted, namespace=self.namespace)
+        with self._lock:
+            self._entries = max(0, total - len(evicted))
+            self.evictions += len(evicted)
+        return len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": self._entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+cache = SemanticCache()
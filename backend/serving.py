@@ -0,0 +1,69 @@
+import gc
+import os
+import logging
+from dotenv import load_dotenv
+
+from .model_registry import registry
+from .sql import create_db_and_tables, dispose_engines
+from . import pinecone_store
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# --- Pre-fork Configuration ---
+# Models loaded in the gunicorn master before workers fork: "all" (every fork-safe
+# model), "none", or a comma-separated list of registry names.
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "all").lower()
+
+
+def _preload_names() -> list:
+    safe = registry.fork_safe_names()
+    if PRELOAD_MODELS == "none":
+        return []
+    if PRELOAD_MODELS == "all":
+        return safe
+    requested = [name.strip() for name in PRELOAD_MODELS.split(",") if name.strip()]
+    for name in requested:
+        if name not in safe:
+            logger.warning(f"Model '{name}' is not registered as fork-safe; each worker will load its own copy.")
+    return [name for name in requested if name in safe]
+
+
+def _single_threaded_torch():
+    """
+    Keeps torch on one intra-op thread in the master. A parent that has run a
+    multi-threaded OpenMP region leaves children a pool they cannot use (they
+    hang on their first parallel op); workers size their own pool after fork.
+    """
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(1)
+
+
+def preload(workers: int = 1) -> dict:
+    """
+    Runs in the gunicorn master once the app is imported, before any worker forks.
+
+    Loads fork-safe models so every worker shares their weights copy-on-write,
+    creates the SQL tables once (then closes the master's connections), and
+    freezes the garbage collector so collections in the workers never touch, and
+    so never un-share, the pages holding everything loaded so far.
+    """
+    names = _preload_names()
+    if names:
+        _single_threaded_torch()
+    statuses = registry.load(names)
+    create_db_and_tables()
+    dispose_engines()
+    if workers > 1 and pinecone_store.VECTOR_BACKEND in ("numpy", "local"):
+        logger.warning("The NumPy vector index is per process: with several workers each one retrieves only the "
+                       "memories it indexed, and the last to shut down overwrites VECTOR_INDEX_DIR. "
+                       "Use VECTOR_BACKEND=pinecone for multi-worker deployments.")
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded models before fork.", extra={"fields": {
+        "models": statuses, "workers": workers, "frozen_objects": gc.get_freeze_count(),
+    }})
+    return statuses
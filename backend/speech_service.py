@@ -1,40 +1,146 @@
 import os
-from groq import Groq
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from fastapi import UploadFile
 
+from .provider_client import provider, ProviderError
+from .model_registry import registry, resolve_model_source
+from .observability import span
+from . import audio_preprocess
+
 # Load environment variables from .env file
 load_dotenv()
-
-# --- Initialize Groq Client ---
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-groq_client = None
-if GROQ_API_KEY:
-    groq_client = Groq(api_key=GROQ_API_KEY)
-    print("✅ Groq client for Speech-to-Text initialized.")
-else:
-    print("⚠️ WARNING: GROQ_API_KEY not found! Speech-to-Text service will be disabled.")
+logger = logging.getLogger(__name__)
 
 STT_MODEL = "whisper-large-v3"
 
-def speech_to_text(audio_file: UploadFile) -> str:
+# --- Backend Configuration ---
+# "groq" uses the provider (falling back to the local model if one is configured);
+# "local" transcribes on this machine only.
+STT_BACKEND = os.getenv("STT_BACKEND", "groq").lower()
+# Local CPU Whisper: "faster-whisper", "whisper" (openai-whisper) or "none".
+STT_LOCAL_BACKEND = os.getenv("STT_LOCAL_BACKEND", "none").lower()
+STT_LOCAL_MODEL = os.getenv("STT_LOCAL_MODEL", "base")
+STT_LOCAL_COMPUTE_TYPE = os.getenv("STT_LOCAL_COMPUTE_TYPE", "int8")  # faster-whisper only
+STT_CHUNK_CONCURRENCY = int(os.getenv("STT_CHUNK_CONCURRENCY", "4"))
+
+if not provider.configured and STT_BACKEND != "local":
+    if STT_LOCAL_BACKEND == "none":
+        logger.warning("GROQ_API_KEY not found! Speech-to-Text service will be disabled.")
+    else:
+        logger.warning(f"GROQ_API_KEY not found! Speech-to-Text will use the local '{STT_LOCAL_BACKEND}' model.")
+
+
+# --- Local Whisper (offline fallback) ---
+class _LocalWhisper:
+    """Adapts faster-whisper and openai-whisper to one `transcribe(samples)` call on 16 kHz mono floats."""
+
+    def __init__(self, backend: str, model_name: str):
+        self.backend = backend
+        # One CPU-bound transcription at a time; concurrent calls would only contend for cores.
+        self._lock = threading.Lock()
+        if backend == "faster-whisper":
+            from faster_whisper import WhisperModel
+            source, _ = resolve_model_source(model_name)
+            self.model = WhisperModel(source, device="cpu", compute_type=STT_LOCAL_COMPUTE_TYPE)
+        elif backend == "whisper":
+            import whisper
+            self.model = whisper.load_model(model_name, device="cpu")
+        else:
+            raise ValueError(f"Unknown STT_LOCAL_BACKEND '{backend}'. Expected 'faster-whisper', 'whisper' or 'none'.")
+
+    def transcribe(self, samples) -> str:
+        with self._lock:
+            if self.backend == "faster-whisper":
+                segments, _ = self.model.transcribe(samples, beam_size=1)
+                return "".join(segment.text for segment in segments).strip()
+            return self.model.transcribe(samples, fp16=False)["text"].strip()
+
+
+if STT_LOCAL_BACKEND != "none":
+    # CTranslate2 (faster-whisper) starts its worker threads at load, so it cannot be loaded before fork.
+    registry.register("whisper", lambda: _LocalWhisper(STT_LOCAL_BACKEND, STT_LOCAL_MODEL),
+                      fork_safe=STT_LOCAL_BACKEND != "faster-whisper")
+
+
+def _local_model():
+    return registry.get("whisper") if STT_LOCAL_BACKEND != "none" else None
+
+
+# --- Stats ---
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "chunks": 0, "input_bytes": 0, "sent_bytes": 0, "local_fallbacks": 0, "failures": 0}
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for name, n in deltas.items():
+            _stats[name] += n
+
+
+def stats() -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    out["backend"] = STT_BACKEND
+    out["local_backend"] = STT_LOCAL_BACKEND
+    out["upload_codec"] = audio_preprocess.AUDIO_UPLOAD_CODEC if audio_preprocess.soundfile else "wav"
+    return out
+
+
+# --- Transcription ---
+_chunk_pool = ThreadPoolExecutor(max_workers=max(1, STT_CHUNK_CONCURRENCY), thread_name_prefix="stt-chunk")
+
+
+def _transcribe_chunk(chunk: dict) -> str:
+    """Transcribes one chunk with the provider, falling back to the local model on failure."""
+    if STT_BACKEND != "local" and provider.configured:
+        audio_preprocess.encode_chunk(chunk)
+        try:
+            return provider.transcribe(chunk["filename"], audio_preprocess.chunk_body(chunk), STT_MODEL,
+                                       content_type=chunk["content_type"])
+        except ProviderError as e:
+            local = _local_model() if chunk["samples"] is not None else None
+            if local is None:
+                raise
+            logger.warning(f"Groq STT API call failed; using the local model. Error: {e}")
+            _count(local_fallbacks=1)
+    local = _local_model() if chunk["samples"] is not None else None
+    if local is None:
+        raise ProviderError("No speech-to-text backend is available for this recording.")
+    with span("stage", "stt_local"):
+        return local.transcribe(chunk["samples"])
+
+
+def transcribe(audio_file: UploadFile) -> tuple:
     """
-    Transcribes an audio file using Groq's Whisper model.
+    Transcribes an uploaded recording; returns (text, report). The audio is
+    normalized and split on pauses first, and chunks are transcribed concurrently.
+    The spooled upload is decoded block by block (or streamed to the provider
+    unchanged if it cannot be decoded), never read into memory whole.
+    An empty text means no speech was detected. Blocking; run in a worker thread.
     """
-    if not groq_client:
-        return "[stt_error] Speech service is not configured due to missing API key."
-
+    with span("stage", "stt_preprocess"):
+        prepared = audio_preprocess.prepare(audio_file.file, audio_file.filename, audio_file.content_type)
+    chunks, report = prepared["chunks"], prepared["report"]
+    _count(requests=1, chunks=len(chunks), input_bytes=report["input_bytes"])
+    if not chunks:
+        report["sent_bytes"] = 0
+        return "", report
     try:
-        # Pass the file as a (filename, file_object) tuple, which the client expects.
-        file_tuple = (audio_file.filename, audio_file.file)
-
-        transcription = groq_client.audio.transcriptions.create(
-            model=STT_MODEL,
-            file=file_tuple,
-            response_format="verbose_json"
-        )
-        return transcription.text
+        if len(chunks) == 1:
+            texts = [_transcribe_chunk(chunks[0])]
+        else:
+            # Each chunk runs in a copy of the caller's context so its logs keep the request id.
+            contexts = [contextvars.copy_context() for _ in chunks]
+            texts = list(_chunk_pool.map(lambda ctx, chunk: ctx.run(_transcribe_chunk, chunk), contexts, chunks))
     except Exception as e:
-        print(f"❌ ERROR: Groq STT API call failed. Error: {e}")
-        return f"[stt_error] {e}"
-
+        _count(failures=1)
+        logger.error(f"Speech-to-text failed for {len(chunks)} chunk(s). Error: {e}")
+        raise
+    finally:
+        report["sent_bytes"] = sum(c["size"] for c in chunks if c["size"] is not None)
+        _count(sent_bytes=report["sent_bytes"])
+    return " ".join(text.strip() for text in texts if text and text.strip()), report
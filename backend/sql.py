@@ -1,16 +1,155 @@
 import os
+import logging
+import time
+import threading
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import exc, create_engine, Column, Integer, String, Text, DateTime, Float, ForeignKey, Index
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read replica for read-only lookups (e.g. username resolution).
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# --- Connection Pool Configuration ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "10"))
+DB_POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+DB_ASYNC = os.getenv("DB_ASYNC", "1").lower() in ("1", "true", "yes")
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL, echo=False)
+
+# --- Pool Instrumentation ---
+class PoolMetrics:
+    """Checkout latency and saturation counters for one connection pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.timeouts = 0  # no connection freed up within DB_POOL_TIMEOUT_S: the pool is saturated
+        self.errors = 0  # any other failed checkout, e.g. the database refusing new connections
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.pool = None
+        self._lock = threading.Lock()
+
+    def record(self, wait_s: float, timed_out: bool = False, failed: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += int(timed_out)
+            self.errors += int(failed)
+            self.total_wait_s += wait_s
+            self.max_wait_s = max(self.max_wait_s, wait_s)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "avg_checkout_ms": round(self.total_wait_s / max(1, self.checkouts) * 1000, 3),
+                "max_checkout_ms": round(self.max_wait_s * 1000, 3),
+            }
+        if self.pool is not None and hasattr(self.pool, "checkedout"):
+            capacity = self.pool.size() + max(0, getattr(self.pool, "_max_overflow", 0))
+            out.update({
+                "in_use": self.pool.checkedout(),
+                "capacity": capacity,
+                "saturation": round(self.pool.checkedout() / capacity, 3) if capacity else None,
+            })
+        return out
+
+
+def _instrumented(pool_cls, metrics: PoolMetrics):
+    """Returns a subclass of `pool_cls` that times every connection checkout."""
+
+    class InstrumentedPool(pool_cls):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except exc.TimeoutError:
+                metrics.record(time.perf_counter() - start, timed_out=True)
+                raise
+            except Exception:
+                metrics.record(time.perf_counter() - start, failed=True)
+                raise
+            metrics.record(time.perf_counter() - start)
+            return conn
+
+    return InstrumentedPool
+
+
+pool_metrics = {}
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _engine_options(url: str, name: str, pool_cls) -> dict:
+    if _is_sqlite(url):
+        # SQLite (local runs and tests) uses SQLAlchemy's default pool for the file/memory mode.
+        return {"connect_args": {"check_same_thread": False}}
+    metrics = pool_metrics.setdefault(name, PoolMetrics(name))
+    return {
+        "poolclass": _instrumented(pool_cls, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_S,
+        "pool_recycle": DB_POOL_RECYCLE_S,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def _make_engine(url: str, name: str):
+    eng = create_engine(url, echo=False, **_engine_options(url, name, QueuePool))
+    if name in pool_metrics:
+        pool_metrics[name].pool = eng.pool
+    return eng
+
+def to_async_url(url: str) -> str:
+    """Maps a sync database URL to its asyncio driver (asyncpg / aiosqlite)."""
+    scheme, sep, rest = url.partition("://")
+    base = scheme.split("+")[0]
+    if base in ("postgres", "postgresql"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    if base == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+def _make_async_engine(url: str, name: str):
+    """Returns (async engine, session factory), or (None, None) if the async driver is not installed."""
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        async_url = to_async_url(url)
+        options = _engine_options(async_url, name, AsyncAdaptedQueuePool)
+        if _is_sqlite(async_url):
+            options = {}
+        eng = create_async_engine(async_url, echo=False, **options)
+    except Exception as e:
+        logger.warning(f"Async database engine '{name}' unavailable; using the sync engine. Error: {e}")
+        return None, None
+    if name in pool_metrics:
+        pool_metrics[name].pool = eng.sync_engine.pool
+    return eng, async_sessionmaker(eng, expire_on_commit=False)
+
+
+# --- Engines and Session Factories ---
+engine = _make_engine(DATABASE_URL, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_engine = _make_engine(DATABASE_REPLICA_URL, "replica") if DATABASE_REPLICA_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_read_engine, AsyncReadSessionLocal = (None, None)
+if DB_ASYNC:
+    async_read_engine, AsyncReadSessionLocal = _make_async_engine(
+        DATABASE_REPLICA_URL or DATABASE_URL, "async_replica" if DATABASE_REPLICA_URL else "async_primary"
+    )
+
 # --- User Table Model ---
 class User(Base):
     __tablename__ = "users"
@@ -18,20 +157,68 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     password = Column(String, nullable=False)
 
+# --- Token Revocation Table ---
+class TokenRevocation(Base):
+    """Per-user watermark shared by all workers: tokens issued at or before it are rejected."""
+    __tablename__ = "token_revocations"
+    username = Column(String, primary_key=True)
+    revoked_before = Column(Float, nullable=False)  # unix time, compared with the token's `iat`
+
+# --- Background Job Table ---
+class Job(Base):
+    """A queued /jobs query; uploads are spooled to disk and referenced by path."""
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(16), nullable=False, default="queued")  # queued|running|succeeded|failed|cancelled
+    text_query = Column(Text, nullable=False, default="")
+    audio_path = Column(String)
+    audio_name = Column(String)
+    audio_type = Column(String)
+    image_path = Column(String)
+    image_name = Column(String)
+    image_type = Column(String)
+    result = Column(Text)  # JSON-encoded response of the query pipeline
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    __table_args__ = (Index("ix_jobs_user_status", "user_id", "status"), Index("ix_jobs_status_created", "status", "created_at"))
+
 # --- Database Initialization ---
 def create_db_and_tables():
     """Create database tables if they don’t exist."""
     try:
         Base.metadata.create_all(bind=engine)
-        print("✅ SQL tables created successfully (if they didn't exist).")
+        logger.info("SQL tables created successfully (if they didn't exist).")
     except Exception as e:
-        print(f"❌ ERROR: Could not create SQL tables. Error: {e}")
+        logger.error(f"Could not create SQL tables. Error: {e}")
+
+def dispose_engines():
+    """Closes pooled connections, e.g. in a pre-fork master so workers never inherit an open socket."""
+    engine.dispose()
+    if read_engine is not engine:
+        read_engine.dispose()
+    if async_read_engine is not None:
+        # There is no event loop here to close asyncio connections on; dropping the pool is enough.
+        async_read_engine.sync_engine.dispose(close=False)
 
-# --- Dependency for FastAPI ---
+def pool_stats() -> dict:
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
+# --- Dependencies for FastAPI ---
 def get_db():
     """Dependency to provide a SQLAlchemy session per request."""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_read_db():
+    """Yields an AsyncSession for read-only lookups, or None when no async driver is available."""
+    if AsyncReadSessionLocal is None:
+        yield None
+        return
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -0,0 +1,103 @@
+import os
+import json
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile
+
+load_dotenv()
+
+# --- Upload Limits ---
+_MB = 1024 * 1024
+UPLOAD_MAX_IMAGE_BYTES = int(float(os.getenv("UPLOAD_MAX_IMAGE_MB", "10")) * _MB)
+UPLOAD_MAX_AUDIO_BYTES = int(float(os.getenv("UPLOAD_MAX_AUDIO_MB", "25")) * _MB)  # Groq's STT file limit
+# Whole multipart body: both files plus form fields and multipart framing.
+UPLOAD_MAX_BODY_BYTES = int(float(os.getenv(
+    "UPLOAD_MAX_BODY_MB", str((UPLOAD_MAX_IMAGE_BYTES + UPLOAD_MAX_AUDIO_BYTES) / _MB + 1)
+)) * _MB)
+UPLOAD_LIMITED_PREFIXES = ("/query", "/jobs")
+
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=413, detail=detail)
+
+
+class BodySizeLimitMiddleware:
+    """
+    Rejects request bodies over `max_bytes` on upload routes with 413.
+
+    A declared Content-Length over the limit is refused before any body is
+    read; otherwise bytes are counted as they stream in, and the request is
+    aborted as soon as the running total passes the limit, so an oversized
+    upload is never spooled in full.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BODY_BYTES, prefixes: tuple = UPLOAD_LIMITED_PREFIXES):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.prefixes = prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds the {self.max_bytes // _MB} MB upload limit."
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            await self._reject(send, detail)
+            return
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise _too_large(detail)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except HTTPException as e:
+            # Raised from limited_receive outside the route's exception handling.
+            if e.status_code != 413 or started:
+                raise
+            await self._reject(send, e.detail)
+
+    @staticmethod
+    async def _reject(send, detail: str):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def upload_size(upload: UploadFile) -> int:
+    """Size of a spooled upload without reading it."""
+    if getattr(upload, "size", None) is not None:
+        return upload.size
+    position = upload.file.tell()
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(position)
+    return size
+
+
+def check_upload(upload: UploadFile, max_bytes: int, kind: str) -> int:
+    """Raises 413 if a single uploaded file is over its own limit; returns its size."""
+    size = upload_size(upload)
+    if size > max_bytes:
+        raise _too_large(f"The {kind} upload is {size / _MB:.1f} MB; the limit is {max_bytes / _MB:g} MB.")
+    return size
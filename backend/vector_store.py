@@ -0,0 +1,338 @@
+import os
+import json
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Local Index Configuration ---
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR")  # enables on-disk persistence when set
+VECTOR_IVF_MIN_VECTORS = int(os.getenv("VECTOR_IVF_MIN_VECTORS", "50000"))  # below this, brute force
+VECTOR_IVF_NLIST = int(os.getenv("VECTOR_IVF_NLIST", "0"))  # 0 = ~sqrt(n) lists
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "8"))
+PINECONE_UPSERT_BATCH = 100
+
+
+_RANGE_OPS = {
+    "$lt": lambda value, bound: value < bound,
+    "$lte": lambda value, bound: value <= bound,
+    "$gt": lambda value, bound: value > bound,
+    "$gte": lambda value, bound: value >= bound,
+}
+
+
+def _matches_filter(metadata: dict, filter: dict) -> bool:
+    """Supports the equality and numeric range subset of Pinecone's metadata filter syntax."""
+    for key, condition in (filter or {}).items():
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$eq":
+                if value != expected:
+                    return False
+            elif value is None or not _RANGE_OPS[op](value, expected):
+                return False
+    return True
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorStore:
+    """
+    Interface shared by the vector backends. Mirrors the Pinecone index calls
+    (`upsert`, `query`, `delete`) and adds batched queries and persistence.
+    """
+
+    def upsert(self, vectors: list, namespace: str = ""):
+        raise NotImplementedError
+
+    def query(self, vector, top_k: int = 3, include_metadata: bool = True, filter: dict = None, namespace: str = "") -> dict:
+        return self.query_batch([vector], top_k, include_metadata, filter, namespace)[0]
+
+    def query_batch(self, vectors: list, top_k: int = 3, include_metadata: bool = True,
+                    filter: dict = None, namespace: str = "") -> list:
+        raise NotImplementedError
+
+    def delete(self, ids: list, namespace: str = ""):
+        raise NotImplementedError
+
+    def count(self, namespace: str = "") -> int:
+        raise NotImplementedError
+
+    def persist(self):
+        return None
+
+
+# --- Pinecone Backend ---
+class PineconeVectorStore(VectorStore):
+    """Hosted Pinecone index; upserts are chunked into batched requests."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors: list, namespace: str = ""):
+        for start in range(0, len(vectors), PINECONE_UPSERT_BATCH):
+            self.index.upsert(vectors[start:start + PINECONE_UPSERT_BATCH], namespace=namespace)
+
+    def query_batch(self, vectors: list, top_k: int = 3, include_metadata: bool = True,
+                    filter: dict = None, namespace: str = "") -> list:
+        results = []
+        for vector in vectors:
+            res = self.index.query(vector=list(vector), top_k=top_k, include_metadata=include_metadata,
+                                   filter=filter, namespace=namespace)
+            results.append({"matches": [
+                {"id": m["id"], "score": m["score"], "metadata": m.get("metadata")} for m in res["matches"]
+            ]})
+        return results
+
+    def delete(self, ids: list, namespace: str = ""):
+        self.index.delete(ids=ids, namespace=namespace)
+
+    def count(self, namespace: str = "") -> int:
+        # Index stats are eventually consistent: recent upserts and deletes may not show yet.
+        summary = self.index.describe_index_stats()["namespaces"].get(namespace or "")
+        return int(summary["vector_count"]) if summary else 0
+
+
+# --- Local NumPy Backend ---
+class _Partition:
+    """
+    One namespace: a contiguous float32 matrix of unit vectors (rows [0, count)),
+    parallel id/metadata arrays, a per-user row index, and optional IVF lists.
+    Deletes swap the last row into the hole so the live rows stay contiguous.
+    """
+
+    def __init__(self, dim: int, matrix: np.ndarray = None, ids: list = None, metadata: list = None):
+        self.dim = dim
+        self.count = len(ids or [])
+        self.matrix = matrix if matrix is not None else np.zeros((1024, dim), dtype=np.float32)
+        self.ids = list(ids or [])
+        self.metadata = list(metadata or [])
+        self.row_of = {vid: row for row, vid in enumerate(self.ids)}
+        self.user_rows = {}
+        for row, meta in enumerate(self.metadata):
+            self.user_rows.setdefault(meta.get("user_id"), set()).add(row)
+        self.centroids = None
+        self.assign = None
+        self.trained_at = 0
+
+    def _reserve(self, extra: int):
+        needed = self.count + extra
+        if needed <= self.matrix.shape[0] and self.matrix.flags.writeable:
+            return
+        capacity = max(needed, self.matrix.shape[0] * 2, 1024)
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self.count] = self.matrix[:self.count]
+        self.matrix = grown
+        if self.assign is not None:
+            assign = np.zeros(capacity, dtype=np.int32)
+            assign[:self.count] = self.assign[:self.count]
+            self.assign = assign
+
+    def upsert(self, ids: list, vectors: np.ndarray, metadata: list):
+        self._reserve(len(ids))
+        vectors = _normalize(vectors.astype(np.float32, copy=False))
+        for vid, vec, meta in zip(ids, vectors, metadata):
+            row = self.row_of.get(vid)
+            if row is None:
+                row = self.count
+                self.count += 1
+                self.ids.append(vid)
+                self.metadata.append(meta)
+                self.row_of[vid] = row
+            else:
+                self.user_rows.get(self.metadata[row].get("user_id"), set()).discard(row)
+                self.metadata[row] = meta
+            self.matrix[row] = vec
+            self.user_rows.setdefault(meta.get("user_id"), set()).add(row)
+            if self.centroids is not None:
+                self.assign[row] = int(np.argmax(self.centroids @ vec))
+
+    def delete(self, ids: list):
+        for vid in ids:
+            row = self.row_of.pop(vid, None)
+            if row is None:
+                continue
+            last = self.count - 1
+            self.user_rows.get(self.metadata[row].get("user_id"), set()).discard(row)
+            if row != last:
+                moved_id, moved_meta = self.ids[last], self.metadata[last]
+                self.matrix[row] = self.matrix[last]
+                if self.assign is not None:
+                    self.assign[row] = self.assign[last]
+                self.ids[row], self.metadata[row] = moved_id, moved_meta
+                self.row_of[moved_id] = row
+                rows = self.user_rows.get(moved_meta.get("user_id"), set())
+                rows.discard(last)
+                rows.add(row)
+            self.ids.pop()
+            self.metadata.pop()
+            self.count -= 1
+
+    def train_ivf(self, nlist: int = 0, iterations: int = 10, sample: int = 100_000, seed: int = 0):
+        """Clusters the rows with spherical k-means and assigns each row to its nearest centroid."""
+        rng = np.random.default_rng(seed)
+        data = self.matrix[:self.count]
+        nlist = nlist or max(1, int(np.sqrt(self.count)))
+        train = data[rng.choice(self.count, size=min(sample, self.count), replace=False)]
+        centroids = train[rng.choice(len(train), size=min(nlist, len(train)), replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(train @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = train[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        assign = np.zeros(self.matrix.shape[0], dtype=np.int32)
+        for start in range(0, self.count, 65536):
+            block = data[start:start + 65536]
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        self.centroids, self.assign, self.trained_at = centroids, assign, self.count
+
+    def candidate_rows(self, filter: dict):
+        """Rows allowed by `filter`, or None for all rows. user_id filters use the per-user index."""
+        if not filter:
+            return None
+        user_cond = filter.get("user_id")
+        if user_cond is not None and len(filter) == 1:
+            user_id = user_cond.get("$eq") if isinstance(user_cond, dict) else user_cond
+            return np.fromiter(sorted(self.user_rows.get(user_id, ())), dtype=np.int64)
+        return np.array([r for r in range(self.count) if _matches_filter(self.metadata[r], filter)], dtype=np.int64)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector index. Exact (brute-force) search on a contiguous float32
+    matrix; once a namespace holds VECTOR_IVF_MIN_VECTORS rows it switches to an
+    IVF index (k-means lists, probing `nprobe` lists per query). With a
+    persistence directory, matrices are saved as .npy and reopened memory-mapped.
+    """
+
+    def __init__(self, directory: str = VECTOR_INDEX_DIR, ivf_min_vectors: int = VECTOR_IVF_MIN_VECTORS,
+                 nlist: int = VECTOR_IVF_NLIST, nprobe: int = VECTOR_IVF_NPROBE):
+        self.directory = directory
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._partitions = {}
+        self._lock = threading.RLock()
+        if directory and os.path.isdir(directory):
+            self._load()
+
+    def _partition(self, namespace: str, dim: int) -> _Partition:
+        part = self._partitions.get(namespace)
+        if part is None:
+            part = self._partitions[namespace] = _Partition(dim)
+        return part
+
+    def upsert(self, vectors: list, namespace: str = ""):
+        if not vectors:
+            return
+        ids = [v[0] for v in vectors]
+        matrix = np.asarray([v[1] for v in vectors], dtype=np.float32)
+        metadata = [dict(v[2] or {}) for v in vectors]
+        with self._lock:
+            part = self._partition(namespace or "", matrix.shape[1])
+            part.upsert(ids, matrix, metadata)
+            # (Re)train IVF once the partition is large enough, and again after it doubles.
+            if part.count >= self.ivf_min_vectors and part.count >= 2 * part.trained_at:
+                part.train_ivf(self.nlist)
+
+    def query_batch(self, vectors: list, top_k: int = 3, include_metadata: bool = True,
+                    filter: dict = None, namespace: str = "") -> list:
+        queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        with self._lock:
+            part = self._partitions.get(namespace or "")
+            if part is None or part.count == 0:
+                return [{"matches": []} for _ in range(len(queries))]
+            allowed = part.candidate_rows(filter)
+            if allowed is not None or part.centroids is None:
+                results = self._exact(part, queries, top_k, allowed)
+            else:
+                results = [self._ivf(part, q, top_k) for q in queries]
+            return [{"matches": [
+                {"id": part.ids[r], "score": float(s), "metadata": dict(part.metadata[r]) if include_metadata else None}
+                for r, s in zip(rows, scores)
+            ]} for rows, scores in results]
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        if k >= scores.shape[-1]:
+            return np.argsort(-scores, axis=-1)
+        idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        order = np.argsort(-np.take_along_axis(scores, idx, axis=-1), axis=-1)
+        return np.take_along_axis(idx, order, axis=-1)
+
+    def _exact(self, part: _Partition, queries: np.ndarray, top_k: int, allowed) -> list:
+        if allowed is not None:
+            if len(allowed) == 0:
+                return [([], []) for _ in range(len(queries))]
+            scores = queries @ part.matrix[allowed].T
+            top = self._top_k(scores, top_k)
+            return [(allowed[t], np.take(s, t)) for t, s in zip(top, scores)]
+        scores = queries @ part.matrix[:part.count].T
+        top = self._top_k(scores, top_k)
+        return [(t, np.take(s, t)) for t, s in zip(top, scores)]
+
+    def _ivf(self, part: _Partition, query: np.ndarray, top_k: int) -> tuple:
+        nprobe = min(self.nprobe, len(part.centroids))
+        probe = self._top_k(part.centroids @ query, nprobe)
+        rows = np.nonzero(np.isin(part.assign[:part.count], probe))[0]
+        if len(rows) == 0:
+            return [], []
+        scores = part.matrix[rows] @ query
+        top = self._top_k(scores, top_k)
+        return rows[top], scores[top]
+
+    def delete(self, ids: list, namespace: str = ""):
+        with self._lock:
+            part = self._partitions.get(namespace or "")
+            if part is not None:
+                part.delete(ids)
+
+    def count(self, namespace: str = "") -> int:
+        with self._lock:
+            part = self._partitions.get(namespace or "")
+            return part.count if part is not None else 0
+
+    # --- Persistence ---
+    def persist(self):
+        """Writes each namespace as <dir>/<namespace>/{vectors.npy, meta.jsonl}."""
+        if not self.directory:
+            return
+        with self._lock:
+            for namespace, part in self._partitions.items():
+                path = os.path.join(self.directory, namespace or "_default")
+                os.makedirs(path, exist_ok=True)
+                np.save(os.path.join(path, "vectors.tmp.npy"), np.ascontiguousarray(part.matrix[:part.count]))
+                with open(os.path.join(path, "meta.jsonl.tmp"), "w", encoding="utf-8") as f:
+                    for vid, meta in zip(part.ids, part.metadata):
+                        f.write(json.dumps({"id": vid, "metadata": meta}) + "\n")
+                os.replace(os.path.join(path, "vectors.tmp.npy"), os.path.join(path, "vectors.npy"))
+                os.replace(os.path.join(path, "meta.jsonl.tmp"), os.path.join(path, "meta.jsonl"))
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            vectors_path = os.path.join(path, "vectors.npy")
+            if not os.path.isfile(vectors_path):
+                continue
+            # Copy-on-write mapping: pages are shared with the file until a row is modified.
+            matrix = np.load(vectors_path, mmap_mode="c")
+            ids, metadata = [], []
+            with open(os.path.join(path, "meta.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    ids.append(record["id"])
+                    metadata.append(record["metadata"])
+            namespace = "" if name == "_default" else name
+            part = _Partition(matrix.shape[1], matrix=matrix, ids=ids, metadata=metadata)
+            if part.count >= self.ivf_min_vectors:
+                part.train_ivf(self.nlist)
+            self._partitions[namespace] = part
@@ -0,0 +1,75 @@
+"""
+Microbenchmark of per-request authentication overhead.
+
+Times `get_current_user` against a local SQLite database in three modes:
+no identity cache (JWT decode + SQL lookup every request), with the TTL
+identity cache, and with the user id embedded in the token claims.
+
+    python -m benchmarks.auth_overhead --requests 5000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def _time_calls(auth, token: str, n: int) -> list:
+    from backend.sql import AsyncReadSessionLocal
+
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        if AsyncReadSessionLocal is not None:
+            async with AsyncReadSessionLocal() as db:
+                await auth.get_current_user(token=token, db=db)
+        else:
+            await auth.get_current_user(token=token, db=None)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "auth_bench.db")
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, ROOT)
+
+    from backend import auth
+    from backend.observability import percentile
+    from backend.sql import SessionLocal, User, create_db_and_tables
+
+    create_db_and_tables()
+    db = SessionLocal()
+    user = User(username="bench-user", password="not-a-real-hash")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    plain_token = auth.create_access_token({"sub": user.username})
+    uid_token = auth.create_access_token({"sub": user.username, "uid": user.id})
+
+    results = {}
+    for mode, token, ttl in (("no_cache", plain_token, 0), ("ttl_cache", plain_token, 60), ("uid_claim", uid_token, 0)):
+        auth.identity_cache = auth.IdentityCache(ttl_s=ttl)
+        timings = asyncio.run(_time_calls(auth, token, args.requests))
+        results[mode] = {
+            "mean_us": round(statistics.mean(timings), 1),
+            "p50_us": round(percentile(timings, 50), 1),
+            "p99_us": round(percentile(timings, 99), 1),
+        }
+    db.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
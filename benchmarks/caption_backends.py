@@ -0,0 +1,118 @@
+"""
+Compares BLIP captioning backends on a fixed local image set.
+
+Each backend runs in its own subprocess so peak RSS is measured in isolation.
+Captions are compared against the fp32 baseline (exact match rate and mean
+token overlap) alongside p50/p95 latency per image.
+
+    python -m benchmarks.caption_backends --images ./sample_images --backends fp32,int8,torchscript
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+from backend.observability import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def _token_overlap(a: str, b: str) -> float:
+    ta, tb = set(a.lower().split()), set(b.lower().split())
+    if not ta and not tb:
+        return 1.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def run_worker(backend: str, image_dir: str, repeat: int):
+    """Runs inside the subprocess: loads one backend and captions every image."""
+    from PIL import Image
+    from backend import caption_service
+
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    images = [Image.open(path).convert("RGB") for path in paths]
+
+    caption_service.apply_num_threads()
+    load_start = time.perf_counter()
+    processor, model = caption_service.load_captioner(backend)
+    load_s = time.perf_counter() - load_start
+
+    caption_service.generate_captions(processor, model, images[:1])  # warm-up
+    captions, latencies = {}, []
+    for _ in range(repeat):
+        for path, image in zip(paths, images):
+            start = time.perf_counter()
+            captions[os.path.basename(path)] = caption_service.generate_captions(processor, model, [image])[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "captions": captions,
+        "latencies_ms": latencies,
+        # ru_maxrss is reported in KiB on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def run_backend(backend: str, image_dir: str, repeat: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.caption_backends", "--worker", backend,
+         "--images", image_dir, "--repeat", str(repeat)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="directory of sample images")
+    parser.add_argument("--backends", default="fp32,int8,torchscript")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="optional path for the JSON report")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.images, args.repeat)
+        return
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "fp32" not in backends:
+        backends.insert(0, "fp32")
+    results = {b: run_backend(b, args.images, args.repeat) for b in backends}
+    baseline = results["fp32"]["captions"]
+
+    report = []
+    for backend, res in results.items():
+        names = list(baseline)
+        exact = sum(res["captions"].get(n) == baseline[n] for n in names) / max(1, len(names))
+        overlap = sum(_token_overlap(res["captions"].get(n, ""), baseline[n]) for n in names) / max(1, len(names))
+        report.append({
+            "backend": backend,
+            "exact_match": round(exact, 3),
+            "token_overlap": round(overlap, 3),
+            "p50_ms": round(percentile(res["latencies_ms"], 50), 1),
+            "p95_ms": round(percentile(res["latencies_ms"], 95), 1),
+            "peak_rss_mb": res["peak_rss_mb"],
+            "load_s": res["load_s"],
+        })
+
+    print(f"{'backend':<12}{'exact':>8}{'overlap':>9}{'p50 ms':>9}{'p95 ms':>9}{'rss MB':>9}")
+    for row in report:
+        print(f"{row['backend']:<12}{row['exact_match']:>8}{row['token_overlap']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['peak_rss_mb']:>9}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"report": report, "captions": {b: r["captions"] for b, r in results.items()}}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
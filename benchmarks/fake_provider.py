@@ -0,0 +1,302 @@
+"""
+A fake OpenAI-compatible provider (the subset of Groq's API the backend uses).
+
+Serves POST /chat/completions (plain and streamed) and POST /audio/transcriptions
+with configurable latency, tail latency, error rate, hangs and malformed
+bodies (and, for
+transcriptions, upload bandwidth and per-audio-second processing time; for chat,
+prefill time per prompt token not covered by its prefix cache), so retries,
+circuit breaking, hedging and model fallback can be exercised locally:
+
+    python -m benchmarks.fake_provider --port 8900 --latency-ms 80 --error-rate 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8900 GROQ_API_KEY=fake uvicorn backend.main:app
+
+Behaviour can be changed at runtime with POST /_control (a JSON object of the
+options below, plus "models": {name: {option: value}} per-model overrides), and
+GET /_stats returns per-path/model request counts.
+"""
+import json
+import time
+import hashlib
+import random
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULTS = {
+    "latency_ms": 50.0,       # base latency before the response (or the first token)
+    "jitter_ms": 10.0,        # uniform extra latency
+    "slow_rate": 0.0,         # fraction of requests that take `slow_ms` instead
+    "slow_ms": 2000.0,
+    "error_rate": 0.0,        # fraction of requests answered with `error_status`
+    "error_status": 503,
+    "fail_first": 0,          # the first N requests per model (or "stt") fail with `error_status`
+    "slow_first": 0,          # the first N requests per model (or "stt") take `slow_ms`
+    "hang_rate": 0.0,         # fraction of requests that stall for `hang_ms` before answering
+    "hang_ms": 60000.0,
+    "stream_tokens": 20,
+    "token_interval_ms": 5.0,
+    "reply": "This is a fake response from the local provider.",
+    "transcript": "This is a fake transcription.",
+    "upload_mbps": 0.0,       # simulated client uplink for transcription uploads (0 = unlimited)
+    "stt_ms_per_audio_s": 0.0,  # transcription time per second of (decodable) audio
+    "prefill_ms_per_1k_tokens": 0.0,  # chat time per 1k prompt tokens (~4 chars each) not served from cache
+    "prefix_cache": True,     # leading messages identical to an earlier request's are cached
+    "malformed": "",          # "json": 200 responses with an unparseable body; "shape": valid JSON, wrong fields
+}
+_PREFIX_CACHE_ENTRIES = 50000
+
+
+class ProviderBehaviour:
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self.options = dict(DEFAULTS, **{k: v for k, v in options.items() if v is not None})
+        self.models = {}
+        self.counts = {}
+        self._seen = {}
+        self._prefixes = OrderedDict()
+
+    def prefill(self, messages: list, use_cache: bool) -> tuple:
+        """(prompt tokens, of which cached): a message is cached if it and every message before it were seen."""
+        digest = hashlib.sha1()
+        total = cached = 0
+        hit = use_cache
+        with self._lock:
+            for message in messages:
+                content = message.get("content") or ""
+                digest.update(json.dumps([message.get("role"), content]).encode("utf-8"))
+                key = digest.hexdigest()
+                tokens = len(content) // 4 + 4
+                total += tokens
+                hit = hit and key in self._prefixes
+                if hit:
+                    cached += tokens
+                    self._prefixes.move_to_end(key)
+                else:
+                    self._prefixes[key] = True
+            while len(self._prefixes) > _PREFIX_CACHE_ENTRIES:
+                self._prefixes.popitem(last=False)
+        return total, cached
+
+    def update(self, changes: dict):
+        with self._lock:
+            models = changes.pop("models", None)
+            if changes.pop("reset", False):
+                self.options = dict(DEFAULTS)
+                self.models = {}
+                self.counts = {}
+                self._seen = {}
+                self._prefixes.clear()
+            self.options.update(changes)
+            if models is not None:
+                self.models.update(models)
+
+    def for_model(self, model: str) -> dict:
+        with self._lock:
+            return dict(self.options, **self.models.get(model, {}))
+
+    def next_request(self, key: str) -> int:
+        """1-based sequence number of a new request for `key` since the last reset."""
+        with self._lock:
+            self._seen[key] = self._seen.get(key, 0) + 1
+            return self._seen[key]
+
+    def count(self, key: str, outcome: str, n: int = 1):
+        with self._lock:
+            entry = self.counts.setdefault(key, {})
+            entry[outcome] = entry.get(outcome, 0) + n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "options": dict(self.options),
+                "models": dict(self.models),
+                "counts": {key: dict(outcomes) for key, outcomes in self.counts.items()},
+            }
+
+
+def _audio_seconds(content_type: str, body: bytes) -> float:
+    """Duration of the `file` part of a multipart upload (WAV, or anything soundfile reads); 0 if unknown."""
+    import io
+    import wave
+    boundary = content_type.partition("boundary=")[2].strip('"').encode()
+    if not boundary:
+        return 0.0
+    for part in body.split(b"--" + boundary):
+        head, _, data = part.partition(b"\r\n\r\n")
+        if b'name="file"' not in head:
+            continue
+        data = data[:-2] if data.endswith(b"\r\n") else data
+        try:
+            with wave.open(io.BytesIO(data)) as w:
+                return w.getnframes() / w.getframerate()
+        except Exception:
+            pass
+        try:
+            import soundfile
+            return soundfile.info(io.BytesIO(data)).duration
+        except Exception:
+            return 0.0
+    return 0.0
+
+
+def make_handler(behaviour: ProviderBehaviour):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _json(self, status: int, payload: dict, headers: dict = None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _delay_or_fail(self, opts: dict, key: str) -> bool:
+            """Sleeps for the sampled latency; returns False after sending an error response."""
+            seq = behaviour.next_request(key)
+            roll = random.random()
+            if seq <= opts["slow_first"]:
+                behaviour.count(key, "slow")
+                time.sleep(opts["slow_ms"] / 1000.0)
+            elif roll < opts["hang_rate"]:
+                behaviour.count(key, "hang")
+                time.sleep(opts["hang_ms"] / 1000.0)
+            elif roll < opts["hang_rate"] + opts["slow_rate"]:
+                behaviour.count(key, "slow")
+                time.sleep(opts["slow_ms"] / 1000.0)
+            else:
+                time.sleep((opts["latency_ms"] + random.uniform(0, opts["jitter_ms"])) / 1000.0)
+            if seq <= opts["fail_first"] or random.random() < opts["error_rate"]:
+                behaviour.count(key, f"http_{opts['error_status']}")
+                headers = {"Retry-After": "0"} if opts["error_status"] == 429 else None
+                self._json(opts["error_status"], {"error": {"message": "injected failure"}}, headers)
+                return False
+            behaviour.count(key, "ok")
+            return True
+
+        def _ok(self, opts: dict, payload: dict):
+            if opts["malformed"] == "json":
+                data = b'{"choices": [{"message": '
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            elif opts["malformed"] == "shape":
+                self._json(200, {"id": "fake", "object": "error", "detail": "unexpected shape"})
+            else:
+                self._json(200, payload)
+
+        def do_GET(self):
+            if self.path == "/_stats":
+                self._json(200, behaviour.stats())
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            path = self.path.split("?")[0].rstrip("/")
+            body = self._body()
+            if path.endswith("/_control"):
+                behaviour.update(json.loads(body or b"{}"))
+                self._json(200, behaviour.stats())
+            elif path.endswith("/chat/completions"):
+                self._chat(json.loads(body or b"{}"))
+            elif path.endswith("/audio/transcriptions"):
+                opts = behaviour.for_model("stt")
+                behaviour.count("stt_bytes", "received", len(body))
+                if opts["upload_mbps"] > 0:
+                    time.sleep(len(body) * 8 / (opts["upload_mbps"] * 1e6))
+                if opts["stt_ms_per_audio_s"] > 0:
+                    time.sleep(_audio_seconds(self.headers.get("Content-Type", ""), body) * opts["stt_ms_per_audio_s"] / 1000.0)
+                if self._delay_or_fail(opts, "stt"):
+                    self._ok(opts, {"text": opts["transcript"]})
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def _chat(self, payload: dict):
+            model = payload.get("model", "unknown")
+            opts = behaviour.for_model(model)
+            prompt_tokens, cached_tokens = behaviour.prefill(payload.get("messages") or [], opts["prefix_cache"])
+            behaviour.count("prompt_tokens", "total", prompt_tokens)
+            behaviour.count("prompt_tokens", "cached", cached_tokens)
+            if opts["prefill_ms_per_1k_tokens"] > 0:
+                time.sleep((prompt_tokens - cached_tokens) * opts["prefill_ms_per_1k_tokens"] / 1e6)
+            if not self._delay_or_fail(opts, f"chat:{model}"):
+                return
+            reply = f"[{model}] {opts['reply']}"
+            if not payload.get("stream"):
+                self._ok(opts, {
+                    "id": "fake", "object": "chat.completion", "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+                })
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = reply.split(" ")
+            per_chunk = max(1, len(words) // max(1, int(opts["stream_tokens"])))
+            for i in range(0, len(words), per_chunk):
+                text = " ".join(words[i:i + per_chunk]) + (" " if i + per_chunk < len(words) else "")
+                chunk = {"choices": [{"index": 0, "delta": {"content": text}}]}
+                self._chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(opts["token_interval_ms"] / 1000.0)
+            self._chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _chunk(self, text: str):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that hedge or time out hang up mid-response; that is expected here.
+        pass
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, **options):
+    """Starts the fake provider on a background thread; returns (server, base_url, behaviour)."""
+    behaviour = ProviderBehaviour(**options)
+    server = _Server((host, port), make_handler(behaviour))
+    threading.Thread(target=server.serve_forever, name="fake-provider", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", behaviour
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    for name, default in DEFAULTS.items():
+        if isinstance(default, (int, float)) and not isinstance(default, bool):
+            parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=None)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    server, base_url, _ = serve(host, port, **args)
+    print(f"Fake provider listening on {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+Reproducible mixed-traffic load test for the whole API.
+
+Starts the API in a uvicorn subprocess with local stand-ins for every external
+service: SQLite for Postgres, the in-memory conversation store for Mongo, the
+in-process NumPy vector index with hashing embeddings, and
+benchmarks.fake_provider for Groq (chat and speech-to-text). Then drives a
+weighted mix of traffic from `--concurrency` virtual users:
+
+  login      - POST /auth/login (bcrypt verify)
+  text       - POST /query/multimodal with a text question
+  stream     - POST /query/multimodal/stream, read to the end
+  multimodal - POST /query/multimodal with an image and a short WAV recording
+  job        - POST /jobs with an image and audio, then long-poll the result
+  history    - GET /dashboard/history
+
+Without torch/BLIP installed the caption stage fails fast and image queries
+are answered from the transcript alone, as the API itself degrades.
+
+Reports throughput, p50/p95/p99 per endpoint, status counts and the server's
+RSS (start, end, peak), and writes everything as JSON (with the git commit)
+so runs can be compared between commits:
+
+    python -m benchmarks.load_test --duration 30 --concurrency 16 --output before.json
+    python -m benchmarks.load_test --duration 30 --concurrency 16 --compare before.json
+
+With --compare, exits non-zero if any endpoint's p95 grew by more than
+--max-regression percent.
+"""
+import io
+import os
+import sys
+import json
+import time
+import wave
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_provider import serve  # noqa: E402
+from backend.observability import percentile  # noqa: E402
+
+DEFAULT_MIX = "login=1,text=5,stream=2,multimodal=1,job=0,history=2"
+QUESTIONS = [
+    "I have a mild headache since this morning",
+    "What should I eat to lower my cholesterol?",
+    "Is it normal to feel dizzy after running?",
+    "How much water should I drink per day?",
+    "My knee hurts when I climb stairs",
+]
+
+
+# --- Statistics ---
+def _summary(latencies_ms: list, elapsed_s: float) -> dict:
+    return {
+        "count": len(latencies_ms),
+        "throughput_rps": round(len(latencies_ms) / elapsed_s, 2) if elapsed_s else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 1),
+        "p95_ms": round(percentile(latencies_ms, 95), 1),
+        "p99_ms": round(percentile(latencies_ms, 99), 1),
+        "max_ms": round(max(latencies_ms), 1) if latencies_ms else 0.0,
+    }
+
+
+class Recorder:
+    """Latencies and status codes per endpoint label."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, label: str, status: int, elapsed_ms: float):
+        statuses = self.statuses.setdefault(label, {})
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if 200 <= status < 300:
+            self.latencies.setdefault(label, []).append(elapsed_ms)
+        else:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def report(self, elapsed_s: float) -> dict:
+        labels = sorted(set(self.latencies) | set(self.statuses))
+        return {
+            label: {
+                **_summary(self.latencies.get(label, []), elapsed_s),
+                "errors": self.errors.get(label, 0),
+                "statuses": self.statuses.get(label, {}),
+            }
+            for label in labels
+        }
+
+
+# --- Server Memory ---
+def _rss_mb(pid: int) -> dict:
+    """Current and peak RSS of `pid` from /proc (Linux only; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {
+            "rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1),
+            "peak_rss_mb": round(int(fields["VmHWM"].split()[0]) / 1024, 1),
+        }
+    except (OSError, KeyError, ValueError):
+        return {"rss_mb": None, "peak_rss_mb": None}
+
+
+async def _sample_rss(pid: int, samples: list, interval_s: float = 0.5):
+    while True:
+        samples.append(_rss_mb(pid)["rss_mb"])
+        await asyncio.sleep(interval_s)
+
+
+# --- Payloads ---
+def _make_image() -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (640, 480), (235, 225, 210))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((200, 120, 440, 360), fill=(190, 60, 60))
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _make_wav(seconds: float = 2.0, rate: int = 16000) -> bytes:
+    import math
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        sample = int(6000 * math.sin(2 * math.pi * 220 * i / rate))
+        frames += sample.to_bytes(2, "little", signed=True)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+# --- Scenarios ---
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, username: str, password: str, payloads: dict, rec: Recorder):
+        self.client = client
+        self.username = username
+        self.password = password
+        self.payloads = payloads
+        self.rec = rec
+        self.token = None
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def _timed(self, label: str, request):
+        start = time.perf_counter()
+        try:
+            r = await request
+            status = r.status_code
+        except httpx.HTTPError:
+            r, status = None, 599  # transport failure or client timeout
+        self.rec.record(label, status, (time.perf_counter() - start) * 1000)
+        return r
+
+    def _files(self) -> dict:
+        return {
+            "image_file": ("photo.jpg", self.payloads["image"], "image/jpeg"),
+            "audio_file": ("voice.wav", self.payloads["audio"], "audio/wav"),
+        }
+
+    async def signup(self):
+        r = await self.client.post("/auth/signup", json={"username": self.username, "password": self.password})
+        if r.status_code == 400:  # already exists from an earlier run against the same database
+            r = await self.client.post("/auth/login", data={"username": self.username, "password": self.password})
+        r.raise_for_status()
+        self.token = r.json()["access_token"]
+
+    async def login(self):
+        r = await self._timed("login", self.client.post(
+            "/auth/login", data={"username": self.username, "password": self.password}
+        ))
+        if r is not None and r.status_code == 200:
+            self.token = r.json()["access_token"]
+
+    async def text(self):
+        await self._timed("query_text", self.client.post(
+            "/query/multimodal", data={"text_query": random.choice(QUESTIONS)}, headers=self.headers
+        ))
+
+    async def stream(self):
+        start = time.perf_counter()
+        first_token_ms = None
+        try:
+            async with self.client.stream("POST", "/query/multimodal/stream",
+                                          data={"text_query": random.choice(QUESTIONS)}, headers=self.headers) as r:
+                status = r.status_code
+                async for line in r.aiter_lines():
+                    if first_token_ms is None and line == "event: token":
+                        first_token_ms = (time.perf_counter() - start) * 1000
+        except httpx.HTTPError:
+            status = 599
+        self.rec.record("query_stream", status, (time.perf_counter() - start) * 1000)
+        if first_token_ms is not None:
+            self.rec.record("query_stream_first_token", status, first_token_ms)
+
+    async def multimodal(self):
+        await self._timed("query_multimodal", self.client.post(
+            "/query/multimodal", data={"text_query": "What is this on my skin?"},
+            files=self._files(), headers=self.headers,
+        ))
+
+    async def job(self):
+        start = time.perf_counter()
+        status = 599
+        try:
+            r = await self.client.post("/jobs", data={"text_query": "What is this on my skin?"},
+                                       files=self._files(), headers=self.headers)
+            status = r.status_code
+            if status == 202:
+                job_id = r.json()["id"]
+                while True:
+                    r = await self.client.get(f"/jobs/{job_id}", params={"wait": 10}, headers=self.headers)
+                    status = r.status_code
+                    if status != 200 or r.json()["status"] not in ("queued", "running"):
+                        break
+                if status == 200 and r.json()["status"] != "succeeded":
+                    status = 500
+        except httpx.HTTPError:
+            pass
+        self.rec.record("job_roundtrip", status, (time.perf_counter() - start) * 1000)
+
+    async def history(self):
+        await self._timed("dashboard_history", self.client.get(
+            "/dashboard/history", params={"limit": 50}, headers=self.headers
+        ))
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if not hasattr(VirtualUser, name) or name in ("signup", "headers"):
+            raise SystemExit(f"Unknown scenario '{name}' in --mix.")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise SystemExit("--mix needs at least one scenario with a positive weight.")
+    return mix
+
+
+async def _wait_until_up(base_url: str, deadline_s: float = 60.0):
+    start = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() - start < deadline_s:
+            try:
+                if (await client.get(f"{base_url}/health/live")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise TimeoutError("API did not start")
+
+
+async def run(args, base_url: str, server_pid: int) -> dict:
+    await _wait_until_up(base_url)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    payloads = {"image": _make_image(), "audio": _make_wav()}
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        users = [
+            VirtualUser(client, f"load-user-{i}", f"password-{i}", payloads, rec)
+            for i in range(args.concurrency)
+        ]
+        for user in users:
+            await user.signup()
+        # Give every user some history so context building and the dashboard have work to do.
+        for user in users:
+            await user.text()
+        rec.reset()
+
+        rss_start = _rss_mb(server_pid)["rss_mb"]
+        rss_samples = []
+        sampler = asyncio.create_task(_sample_rss(server_pid, rss_samples))
+        deadline = time.perf_counter() + args.duration
+        sent = 0
+
+        async def drive(user: VirtualUser):
+            nonlocal sent
+            while time.perf_counter() < deadline and (not args.requests or sent < args.requests):
+                sent += 1
+                await getattr(user, rng.choices(names, weights)[0])()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(drive(user) for user in users))
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+
+        memory = _rss_mb(server_pid)
+        stats = (await client.get("/health/stats")).json()
+
+    endpoints = rec.report(elapsed)
+    total = sum(sum(e["statuses"].values()) for label, e in endpoints.items() if label != "query_stream_first_token")
+    errors = sum(e["errors"] for label, e in endpoints.items() if label != "query_stream_first_token")
+    samples = [s for s in rss_samples if s is not None]
+    return {
+        "totals": {
+            "duration_s": round(elapsed, 2),
+            "requests": total,
+            "errors": errors,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        },
+        "endpoints": endpoints,
+        "memory": {
+            "rss_start_mb": rss_start,
+            "rss_end_mb": memory["rss_mb"],
+            "rss_peak_sampled_mb": max(samples) if samples else None,
+            "rss_high_water_mb": memory["peak_rss_mb"],
+        },
+        "server_stats": stats,
+    }
+
+
+# --- Comparison ---
+def compare(baseline: dict, current: dict, max_regression_pct: float) -> bool:
+    """Prints per-endpoint deltas against a previous run; False if any p95 regressed past the limit."""
+    ok = True
+    print(f"{'endpoint':26}" + "".join(f"{name:>23}" for name in ("p50 ms", "p95 ms", "p99 ms", "rps")))
+    for label, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(label)
+        if not before:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            change = (now[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            cells.append(f"{before[key]:>8g} -> {now[key]:<8g}{change:>+4.0f}%")
+            if key == "p95_ms" and change > max_regression_pct:
+                ok = False
+        print(f"{label:26}" + "".join(cells))
+    before_rss, now_rss = baseline.get("memory", {}).get("rss_end_mb"), current["memory"]["rss_end_mb"]
+    print(f"server RSS at end: {before_rss} MB -> {now_rss} MB")
+    print(f"commits: {baseline.get('meta', {}).get('git_commit')} -> {current['meta']['git_commit']}")
+    return ok
+
+
+def server_env(workdir: str, provider_url: str) -> dict:
+    """Environment for an API process backed by local stand-ins under `workdir`."""
+    env = dict(os.environ)
+    env.update({
+        "JWT_SECRET_KEY": env.get("JWT_SECRET_KEY", "benchmark-secret"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        "MONGO_BACKEND": "memory",
+        "VECTOR_BACKEND": "numpy",
+        "VECTOR_INDEX_DIR": os.path.join(workdir, "vectors"),
+        "EMBEDDING_BACKEND": env.get("EMBEDDING_BACKEND", "hashing"),
+        "MEMORY_RETRIEVAL_ENABLED": env.get("MEMORY_RETRIEVAL_ENABLED", "1"),
+        "JOB_SPOOL_DIR": os.path.join(workdir, "spool"),
+        "GROQ_API_KEY": "fake-key",
+        "GROQ_BASE_URL": provider_url,
+        "MODEL_WARMUP": env.get("MODEL_WARMUP", "0"),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        # Measure the API, not the login throttles.
+        "LOGIN_RATE_PER_MIN_IP": "1000000",
+        "LOGIN_BURST_IP": "1000000",
+        "LOGIN_RATE_PER_MIN_USER": "1000000",
+        "LOGIN_BURST_USER": "1000000",
+    })
+    return env
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "") if out.returncode == 0 else None
+    except OSError:
+        return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of measured traffic")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 = duration only)")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users, one request in flight each")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. 'text=5,login=1'")
+    parser.add_argument("--llm-latency-ms", type=float, default=80.0, help="fake provider latency to first token")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--port", type=int, default=0, help="API port (0 picks a free one)")
+    parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="a previous --output file to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="allowed p95 growth (%%) with --compare")
+    parser.add_argument("--server-log", help="file for the API's logs (default: discarded)")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    _provider, provider_url, _behaviour = serve(latency_ms=args.llm_latency_ms)
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    port = args.port or _free_port()
+    env = server_env(workdir, provider_url)
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--no-access-log"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        result = asyncio.run(run(args, f"http://127.0.0.1:{port}", proc.pid))
+    finally:
+        proc.terminate()
+        proc.wait()
+        if log is not subprocess.DEVNULL:
+            log.close()
+
+    result = {
+        "meta": {
+            "git_commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "server_log")},
+        },
+        **result,
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(baseline, result, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Login-storm load test.
+
+Starts the API on a local SQLite database with the in-memory conversation
+store, measures text-query latency at steady state, then again while a
+storm of concurrent logins (valid and invalid passwords) hits /auth/login.
+With bcrypt on its own bounded pool, query p99 should stay roughly flat.
+
+    python -m benchmarks.login_storm --queries 200 --logins 2000 --login-concurrency 64
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from backend.observability import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _summary(latencies_ms: list) -> dict:
+    return {
+        "count": len(latencies_ms),
+        "p50_ms": round(percentile(latencies_ms, 50), 1),
+        "p95_ms": round(percentile(latencies_ms, 95), 1),
+        "p99_ms": round(percentile(latencies_ms, 99), 1),
+    }
+
+
+async def _wait_until_up(base_url: str, deadline_s: float = 60.0):
+    start = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() - start < deadline_s:
+            try:
+                if (await client.get(f"{base_url}/health/live")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise TimeoutError("API did not start")
+
+
+async def _query_loop(client: httpx.AsyncClient, token: str, count: int, latencies: list):
+    for _ in range(count):
+        start = time.perf_counter()
+        r = await client.post("/query/multimodal", data={"text_query": "I have a mild headache"},
+                              headers={"Authorization": f"Bearer {token}"})
+        r.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def _login_storm(client: httpx.AsyncClient, users: list, total: int, concurrency: int, statuses: dict):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        username, password = random.choice(users)
+        if random.random() < 0.5:
+            password += "-wrong"
+        async with sem:
+            r = await client.post("/auth/login", data={"username": username, "password": password})
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    await asyncio.gather(*(one() for _ in range(total)))
+
+
+async def run(args, base_url: str) -> dict:
+    await _wait_until_up(base_url)
+    limits = httpx.Limits(max_connections=args.login_concurrency + 8)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        users = [(f"storm-user-{i}", f"password-{i}") for i in range(args.users)]
+        for username, password in users:
+            await client.post("/auth/signup", json={"username": username, "password": password})
+        r = await client.post("/auth/signup", json={"username": "query-user", "password": "query-pass"})
+        token = r.json()["access_token"]
+
+        baseline = []
+        await _query_loop(client, token, args.queries, baseline)
+
+        during, statuses = [], {}
+        storm = asyncio.create_task(_login_storm(client, users, args.logins, args.login_concurrency, statuses))
+        await asyncio.sleep(0.2)
+        await _query_loop(client, token, args.queries, during)
+        await storm
+        stats = (await client.get("/health/stats")).json()
+
+    return {
+        "query_baseline": _summary(baseline),
+        "query_during_login_storm": _summary(during),
+        "login_status_counts": statuses,
+        "password_hashing": stats.get("password_hashing"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--logins", type=int, default=1000)
+    parser.add_argument("--login-concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        "JWT_SECRET_KEY": env.get("JWT_SECRET_KEY", "benchmark-secret"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'storm.db')}",
+        "MONGO_BACKEND": "memory",
+        "MODEL_WARMUP": "0",
+        # Let the storm reach bcrypt instead of being absorbed by the throttles.
+        "LOGIN_RATE_PER_MIN_IP": "1000000",
+        "LOGIN_BURST_IP": "1000000",
+    })
+    env.pop("GROQ_API_KEY", None)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(args.port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        result = asyncio.run(run(args, f"http://127.0.0.1:{args.port}"))
+    finally:
+        proc.terminate()
+        proc.wait()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Prompt tokens, repeated prefix and LLM latency per system prompt variant.
+
+Replays multi-turn conversations for --users users through the real
+context_builder and llm_service (conversation store in memory, NumPy vector
+index, hashing embeddings) against benchmarks.fake_provider, which charges
+prefill time per prompt token that is not covered by its prefix cache
+(--prefill-ms-per-1k), as hosted providers with prompt caching do.
+
+For each variant, sums the per-request prompt reports: prompt tokens, system
+prompt tokens, tokens repeating the user's previous request prefix (what a
+prefix cache can serve), and p50/p95 LLM latency.
+
+    python -m benchmarks.prompt_variants --users 8 --turns 12
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_provider import serve  # noqa: E402
+
+_server, BASE_URL, behaviour = serve()
+os.environ.update({
+    "GROQ_API_KEY": "fake-key",
+    "GROQ_BASE_URL": BASE_URL,
+    "MONGO_BACKEND": "memory",
+    "VECTOR_BACKEND": "numpy",
+    "EMBEDDING_BACKEND": os.getenv("EMBEDDING_BACKEND", "hashing"),
+    "MEMORY_RETRIEVAL_ENABLED": os.getenv("MEMORY_RETRIEVAL_ENABLED", "1"),
+    "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+})
+
+from backend.observability import configure_logging, percentile  # noqa: E402
+configure_logging()
+from backend import prompts, llm_service, context_builder, mongo_memory, memory_retrieval  # noqa: E402
+
+QUESTIONS = [
+    "I have had a mild headache since this morning and feel tired",
+    "What should I eat to lower my cholesterol?",
+    "Is it normal to feel dizzy after running?",
+    "How much water should I drink per day?",
+    "My knee hurts when I climb stairs",
+    "I get heartburn after dinner most nights",
+]
+
+
+async def _turn(user_id: str, question: str) -> dict:
+    context = await context_builder.build_context(user_id, prompt=question)
+    report = {}
+    answer = await llm_service.aget_llm_response(question, context["messages"], user_id=user_id, report=report)
+    await mongo_memory.store_turn(user_id, question, answer)
+    memory_retrieval.indexer.enqueue(user_id, question, answer, datetime.now(timezone.utc))
+    return report
+
+
+async def run_variant(variant: str, args) -> dict:
+    prompts.PROMPT_VARIANT = variant
+    reports = []
+    for turn in range(args.turns):
+        reports += await asyncio.gather(*(
+            _turn(f"{variant}-user-{i}", f"{QUESTIONS[(i + turn) % len(QUESTIONS)]} (day {turn + 1})")
+            for i in range(args.users)
+        ))
+    # The first turn of each user has no previous prefix; the rest show steady state.
+    steady = [r for r in reports[args.users:]] or reports
+    prompt_tokens = sum(r["prompt_tokens"] for r in steady)
+    cached = sum(r["cached_prefix_tokens"] for r in steady)
+    latencies = [r["llm_ms"] for r in steady]
+    return {
+        "variant": variant,
+        "requests": len(steady),
+        "system_tokens": steady[0]["system_tokens"],
+        "avg_prompt_tokens": round(prompt_tokens / len(steady), 1),
+        "avg_cached_prefix_tokens": round(cached / len(steady), 1),
+        "cached_prefix_ratio": round(cached / prompt_tokens, 3) if prompt_tokens else 0.0,
+        "avg_uncached_tokens": round((prompt_tokens - cached) / len(steady), 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+    }
+
+
+async def main_async(args) -> list:
+    await mongo_memory.init_memory()
+    memory_retrieval.indexer.start()
+    results = []
+    for variant in args.variants:
+        results.append(await run_variant(variant, args))
+        print(json.dumps(results[-1]), flush=True)
+    memory_retrieval.indexer.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", nargs="+", default=list(prompts.SYSTEM_PROMPTS), choices=list(prompts.SYSTEM_PROMPTS))
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="fixed provider latency per call")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40.0, help="provider time per 1k uncached prompt tokens")
+    args = parser.parse_args()
+
+    behaviour.update({"latency_ms": args.latency_ms, "jitter_ms": 0.0,
+                      "prefill_ms_per_1k_tokens": args.prefill_ms_per_1k})
+    results = asyncio.run(main_async(args))
+    print(json.dumps({"provider": behaviour.stats()["counts"].get("prompt_tokens"), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
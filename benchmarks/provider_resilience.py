@@ -0,0 +1,134 @@
+"""
+Exercises the provider client's failure handling against the fake provider.
+
+Each scenario reconfigures benchmarks.fake_provider and drives
+backend.provider_client directly, reporting success rate, latency
+percentiles and the client's counters:
+
+  retries   - 30% injected 503s, with and without retries
+  breaker   - a hard outage: calls are rejected locally once the circuit opens
+  hedging   - 5% of requests take 2s; p99 with and without hedged requests
+  fallback  - a slow primary model raced against a faster fallback model
+  streaming - the first streamed request stalls before its first token
+
+The pass/fail behaviour of these paths is covered by tests/test_provider_client.py.
+
+    python -m benchmarks.provider_resilience --requests 200 --concurrency 16
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_provider import serve  # noqa: E402
+
+_server, BASE_URL, behaviour = serve()
+os.environ.setdefault("GROQ_API_KEY", "fake-key")
+os.environ["GROQ_BASE_URL"] = BASE_URL
+
+from backend import provider_client  # noqa: E402
+from backend.observability import percentile  # noqa: E402
+
+PRIMARY, FALLBACK = "primary-model", "fallback-model"
+MESSAGES = [{"role": "user", "content": "I have a mild headache"}]
+
+
+def configure(**settings):
+    """Resets the fake provider and applies `settings` (use `models=` for per-model overrides)."""
+    behaviour.update({"reset": True, "latency_ms": 30.0, "jitter_ms": 10.0, **settings})
+
+
+def fresh_client(**module_settings) -> provider_client.ProviderClient:
+    """A client with its own pool, breakers and counters, after overriding module settings."""
+    for name, value in module_settings.items():
+        setattr(provider_client, name, value)
+    return provider_client.ProviderClient(BASE_URL, "fake-key")
+
+
+async def drive(client, requests: int, concurrency: int, call) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], {}
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(client)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except provider_client.ProviderError as e:
+                kind = type(e).__name__ if e.status is None else f"http_{e.status}"
+                failures[kind] = failures.get(kind, 0) + 1
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    stats = client.stats()
+    await client.aclose()
+    return {
+        "success_rate": round(len(latencies) / requests, 4),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "failures": failures,
+        "client": stats,
+        "provider_counts": behaviour.stats()["counts"],
+    }
+
+
+def chat(client):
+    return client.achat(MESSAGES, PRIMARY)
+
+
+async def stream(client):
+    async for _ in client.astream_chat(MESSAGES, PRIMARY):
+        pass
+
+
+async def run(args) -> dict:
+    defaults = {"PROVIDER_MAX_RETRIES": 2, "PROVIDER_HEDGE_AFTER_MS": 0.0, "LLM_FALLBACK_MODEL": "",
+                "LLM_FALLBACK_AFTER_MS": 0.0, "PROVIDER_BACKOFF_BASE_MS": 50.0}
+    n, c = args.requests, args.concurrency
+    results = {}
+
+    configure(error_rate=0.3)
+    results["retries_off"] = await drive(fresh_client(**dict(defaults, PROVIDER_MAX_RETRIES=0)), n, c, chat)
+    configure(error_rate=0.3)
+    results["retries_on"] = await drive(fresh_client(**defaults), n, c, chat)
+
+    configure(error_rate=1.0)
+    results["breaker"] = await drive(fresh_client(**dict(defaults, PROVIDER_MAX_RETRIES=0)), n, c, chat)
+
+    configure(slow_rate=0.05, slow_ms=2000.0)
+    results["hedging_off"] = await drive(fresh_client(**defaults), n, c, chat)
+    configure(slow_rate=0.05, slow_ms=2000.0)
+    results["hedging_on"] = await drive(fresh_client(**dict(defaults, PROVIDER_HEDGE_AFTER_MS=150.0)), n, c, chat)
+
+    configure(models={PRIMARY: {"latency_ms": 1500.0}, FALLBACK: {"latency_ms": 40.0}})
+    results["fallback_race"] = await drive(
+        fresh_client(**dict(defaults, LLM_FALLBACK_MODEL=FALLBACK, LLM_FALLBACK_AFTER_MS=300.0)), n, c, chat)
+
+    configure(hang_rate=0.2, hang_ms=3000.0)
+    results["stream_first_token_retry"] = await drive(
+        fresh_client(**dict(defaults, PROVIDER_FIRST_TOKEN_TIMEOUT_S=0.5)), n, c, stream)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", help="optional path for the JSON results")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Measures backend cold-start time.
+
+Reports how long `import backend.main` takes in a fresh interpreter, and, with
+--serve, how long a uvicorn process takes to answer /health/live and
+/health/ready.
+
+    python -m benchmarks.startup_time --runs 5 --serve
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import backend.main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def _bench_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+    env.setdefault("DATABASE_URL", "sqlite:///./startup_bench.db")
+    return env
+
+
+def measure_import(runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            cwd=ROOT, env=_bench_env(), capture_output=True, text=True, check=True,
+        )
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def _wait_for(url: str, deadline: float, expect_ok: bool = True) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200 or not expect_ok:
+                    return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} did not become available within {deadline}s")
+
+
+def measure_serve(port: int, deadline: float) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port)],
+        cwd=ROOT, env=_bench_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_for(f"http://127.0.0.1:{port}/health/live", deadline)
+        live_s = time.perf_counter() - start
+        _wait_for(f"http://127.0.0.1:{port}/health/ready", deadline)
+        ready_s = time.perf_counter() - start
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready") as resp:
+            models = json.loads(resp.read())["models"]
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"time_to_live_s": round(live_s, 3), "time_to_ready_s": round(ready_s, 3), "models": models}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--serve", action="store_true", help="also time a uvicorn process until ready")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--deadline", type=float, default=300.0)
+    args = parser.parse_args()
+
+    timings = measure_import(args.runs)
+    result = {
+        "import_s": {
+            "min": round(min(timings), 3),
+            "median": round(statistics.median(timings), 3),
+            "max": round(max(timings), 3),
+        }
+    }
+    if args.serve:
+        result["serve"] = measure_serve(args.port, args.deadline)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
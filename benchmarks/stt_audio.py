@@ -0,0 +1,121 @@
+"""
+Bytes sent and transcription latency by recording length: raw WAV vs preprocessed.
+
+Synthesizes recordings shaped like the frontend's st_audiorec output (44.1 kHz
+stereo 16-bit WAV: bursts of voiced sound separated by short pauses, with
+silence before and after), then transcribes each through
+backend.speech_service.transcribe against benchmarks.fake_provider, which is
+set up to charge for upload bandwidth (--upload-mbps) and for processing time
+per second of audio (--ms-per-audio-s), as a hosted Whisper API does.
+
+Modes:
+  raw        - preprocessing disabled; the WAV is uploaded as-is in one call
+  wav        - 16 kHz mono, silence trimmed, split on pauses, 16-bit WAV chunks
+  flac       - as `wav`, FLAC-encoded (needs soundfile)
+  ogg        - as `wav`, Opus-encoded (needs soundfile)
+  flac-whole - as `flac`, but never split (shows what concurrent chunks buy)
+
+    python -m benchmarks.stt_audio --lengths 10 30 60 120 300 --runs 3
+"""
+import io
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import statistics
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_provider import serve  # noqa: E402
+
+_server, BASE_URL, behaviour = serve()
+os.environ.setdefault("GROQ_API_KEY", "fake-key")
+os.environ["GROQ_BASE_URL"] = BASE_URL
+os.environ.setdefault("STT_LOCAL_BACKEND", "none")
+
+from starlette.datastructures import Headers, UploadFile  # noqa: E402
+from backend import audio_preprocess, speech_service  # noqa: E402
+
+MODES = ("raw", "wav", "flac", "ogg", "flac-whole")
+
+
+def make_recording(seconds: float, rate: int = 44100, seed: int = 0) -> bytes:
+    """Speech-like test audio: voiced bursts of 0.5-3 s with 0.2-1.2 s pauses and a faint noise floor."""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * rate)
+    signal = rng.normal(0, 10 ** (-62 / 20), total).astype(np.float32)  # room noise around -62 dBFS
+    pos = int(1.5 * rate)
+    while pos < total - int(1.5 * rate):
+        burst = int(rng.uniform(0.5, 3.0) * rate)
+        end = min(pos + burst, total - int(1.5 * rate))
+        t = np.arange(end - pos) / rate
+        pitch = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 6) * t)  # syllable-rate modulation
+        signal[pos:end] += (0.25 * voiced * envelope).astype(np.float32)
+        pos = end + int(rng.uniform(0.2, 1.2) * rate)
+    pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    stereo = np.repeat(pcm[:, None], 2, axis=1)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(stereo.tobytes())
+    return buf.getvalue()
+
+
+def _configure(mode: str):
+    audio_preprocess.AUDIO_PREPROCESS_ENABLED = mode != "raw"
+    audio_preprocess.AUDIO_UPLOAD_CODEC = {"wav": "wav", "ogg": "ogg"}.get(mode, "flac")
+    audio_preprocess.AUDIO_CHUNK_MAX_S = 10 ** 9 if mode == "flac-whole" else float(os.getenv("AUDIO_CHUNK_MAX_S", "45"))
+
+
+def run_once(data: bytes, mode: str) -> dict:
+    _configure(mode)
+    upload = UploadFile(file=io.BytesIO(data), filename="recording.wav", headers=Headers({"content-type": "audio/wav"}))
+    start = time.perf_counter()
+    text, report = speech_service.transcribe(upload)
+    return {"total_ms": (time.perf_counter() - start) * 1000, "text_chars": len(text), **report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=float, nargs="+", default=[10, 30, 60, 120, 300], help="seconds")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--upload-mbps", type=float, default=10.0, help="simulated client uplink")
+    parser.add_argument("--ms-per-audio-s", type=float, default=10.0, help="simulated provider processing time")
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="fixed provider latency per call")
+    args = parser.parse_args()
+
+    behaviour.update({"upload_mbps": args.upload_mbps, "stt_ms_per_audio_s": args.ms_per_audio_s,
+                      "latency_ms": args.latency_ms, "jitter_ms": 0.0})
+    modes = [m for m in MODES if audio_preprocess.soundfile is not None or m in ("raw", "wav")]
+
+    results = []
+    for seconds in args.lengths:
+        data = make_recording(seconds)
+        for mode in modes:
+            runs = [run_once(data, mode) for _ in range(args.runs)]
+            last = runs[-1]
+            results.append({
+                "length_s": seconds,
+                "mode": mode,
+                "input_mb": round(last["input_bytes"] / 2**20, 3),
+                "sent_mb": round(last["sent_bytes"] / 2**20, 3),
+                "reduction_x": round(last["input_bytes"] / max(1, last["sent_bytes"]), 1),
+                "speech_s": last.get("speech_s"),
+                "chunks": last["chunks"],
+                "median_ms": round(statistics.median(r["total_ms"] for r in runs), 1),
+            })
+            print(json.dumps(results[-1]), flush=True)
+    print(json.dumps({"provider": behaviour.stats()["options"], "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
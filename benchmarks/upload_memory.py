@@ -0,0 +1,82 @@
+"""
+Peak memory of decoding a large upload: full decode vs draft/thumbnail pre-shrinking.
+
+Generates a large JPEG (40 MP by default), then in a fresh subprocess per mode
+decodes it either the old way (`Image.open(f).convert("RGB")`) or with
+backend.query_service._load_rgb_image, and reports the growth in peak RSS
+caused by the decode alone.
+
+    python -m benchmarks.upload_memory --megapixels 40 --runs 3
+"""
+import io
+import os
+import sys
+import json
+import argparse
+import resource
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)  # bytes on macOS, KiB on Linux
+
+
+def make_jpeg(path: str, megapixels: float):
+    from PIL import Image, ImageDraw
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, width, max(1, width // 64)):
+        draw.line([(i, 0), (width - i, height)], fill=(i % 255, 90, 200), width=9)
+    image.save(path, "JPEG", quality=90)
+
+
+def decode(path: str, mode: str) -> dict:
+    """Runs in the child: imports first, then measures the RSS high-water mark added by decoding."""
+    sys.path.insert(0, ROOT)
+    from PIL import Image
+    if mode == "preshrink":
+        from backend.query_service import _load_rgb_image
+    with open(path, "rb") as f:
+        data = f.read()
+    baseline = _peak_rss_mb()
+    if mode == "full":
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        report = {"final_px": list(image.size)}
+    else:
+        image, report = _load_rgb_image(io.BytesIO(data))
+    return {"mode": mode, "peak_rss_added_mb": round(_peak_rss_mb() - baseline, 1), **report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, default=40.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(decode(*args.child)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "upload.jpg")
+        make_jpeg(path, args.megapixels)
+        results = {"upload_mb": round(os.path.getsize(path) / 2**20, 2), "runs": []}
+        for _ in range(args.runs):
+            for mode in ("full", "preshrink"):
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.upload_memory", "--child", path, mode],
+                    cwd=ROOT, capture_output=True, text=True, check=True,
+                )
+                results["runs"].append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Recall and throughput of the local NumPy vector index.
+
+For each collection size, builds an index of clustered random unit vectors,
+then measures batched query QPS for exact search and IVF search, and IVF
+recall@k against the exact results.
+
+    python -m benchmarks.vector_index --sizes 10000,100000,1000000 --dim 384
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.vector_store import NumpyVectorStore  # noqa: E402
+
+
+def clustered_vectors(n: int, dim: int, clusters: int, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    data = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def build(store: NumpyVectorStore, data: np.ndarray, batch: int = 10000) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(data), batch):
+        chunk = data[offset:offset + batch]
+        store.upsert([(f"v{offset + i}", vec, {"user_id": str((offset + i) % 100)}) for i, vec in enumerate(chunk)])
+    return time.perf_counter() - start
+
+
+def timed_queries(store: NumpyVectorStore, queries: np.ndarray, top_k: int, batch: int, **kwargs) -> tuple:
+    ids = []
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch):
+        for res in store.query_batch(queries[offset:offset + batch], top_k=top_k, include_metadata=False, **kwargs):
+            ids.append([m["id"] for m in res["matches"]])
+    return ids, len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--output", help="optional path for the JSON results")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    results = []
+    for n in (int(s) for s in args.sizes.split(",")):
+        data = clustered_vectors(n, args.dim, clusters=max(8, n // 1000), rng=rng)
+        queries = clustered_vectors(args.queries, args.dim, clusters=8, rng=rng)
+
+        exact_store = NumpyVectorStore(directory=None, ivf_min_vectors=10**12)
+        build_s = build(exact_store, data)
+        exact_ids, exact_qps = timed_queries(exact_store, queries, args.top_k, args.batch)
+        _, filtered_qps = timed_queries(exact_store, queries, args.top_k, args.batch, filter={"user_id": "7"})
+        del exact_store
+
+        ivf_store = NumpyVectorStore(directory=None, ivf_min_vectors=1, nprobe=args.nprobe)
+        ivf_build_s = build(ivf_store, data, batch=n)  # single batch -> one k-means training
+        ivf_ids, ivf_qps = timed_queries(ivf_store, queries, args.top_k, args.batch)
+        del ivf_store
+
+        recall = np.mean([len(set(a) & set(b)) / args.top_k for a, b in zip(exact_ids, ivf_ids)])
+        row = {
+            "vectors": n,
+            "exact_build_s": round(build_s, 2),
+            "exact_qps": round(exact_qps, 1),
+            "exact_user_filtered_qps": round(filtered_qps, 1),
+            "ivf_build_s": round(ivf_build_s, 2),
+            "ivf_qps": round(ivf_qps, 1),
+            f"ivf_recall@{args.top_k}": round(float(recall), 4),
+            "matrix_mb": round(n * args.dim * 4 / 2**20, 1),
+        }
+        results.append(row)
+        print(json.dumps(row))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Memory and throughput of the gunicorn profile as the worker count grows.
+
+For each worker count, and with and without preloading models in the master,
+starts `gunicorn -c gunicorn.conf.py backend.main:app` against the same local
+stand-ins as benchmarks.load_test, waits for every worker to finish loading,
+and measures the whole process tree from /proc/<pid>/smaps_rollup (Linux):
+
+  rss_mb  - sum of RSS; counts each shared page once per process
+  pss_mb  - sum of PSS; shared pages split between the processes mapping them,
+            i.e. what the tree really costs the node
+  uss_mb  - sum of private pages; what each extra worker adds
+
+then drives the load_test traffic mix for --duration seconds and reports
+throughput, errors and p95 per endpoint.
+
+Model weights dominate the savings, so run it where the models load, e.g.
+with torch and transformers installed and EMBEDDING_BACKEND=sentence-transformers;
+without them only the interpreter, libraries and app state are shared.
+
+    python -m benchmarks.worker_scaling --workers 1 2 4 --duration 20 --output scaling.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_provider import serve  # noqa: E402
+from benchmarks import load_test  # noqa: E402
+
+MODES = ("preload", "no-preload")
+
+
+# --- Process Tree Memory ---
+def _children(pid: int) -> list:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 is the parent pid; the command name (field 2) may contain spaces.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def _smaps_mb(pid: int) -> dict:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {line.split(":")[0]: int(line.split()[1]) for line in f if line.endswith("kB\n")}
+    except OSError:
+        return {"rss_mb": 0.0, "pss_mb": 0.0, "uss_mb": 0.0}
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {"rss_mb": fields.get("Rss", 0) / 1024, "pss_mb": fields.get("Pss", 0) / 1024, "uss_mb": private / 1024}
+
+
+def tree_memory(master_pid: int) -> dict:
+    """Summed RSS/PSS/USS of the master and its workers, plus the per-worker averages."""
+    workers = _children(master_pid)
+    per_process = {pid: _smaps_mb(pid) for pid in [master_pid] + workers}
+    totals = {key: round(sum(m[key] for m in per_process.values()), 1) for key in ("rss_mb", "pss_mb", "uss_mb")}
+    worker_stats = [per_process[pid] for pid in workers]
+    return {
+        "processes": len(per_process),
+        **totals,
+        "master_pss_mb": round(per_process[master_pid]["pss_mb"], 1),
+        "worker_pss_mb": round(sum(m["pss_mb"] for m in worker_stats) / len(worker_stats), 1) if workers else None,
+        "worker_uss_mb": round(sum(m["uss_mb"] for m in worker_stats) / len(worker_stats), 1) if workers else None,
+    }
+
+
+async def _wait_until_settled(base_url: str, master_pid: int, workers: int, deadline_s: float):
+    """Waits for every worker to answer /health/ready and the tree's PSS to stop growing."""
+    start = time.perf_counter()
+    last, stable_since = None, None
+    async with httpx.AsyncClient(base_url=base_url, timeout=5.0) as client:
+        while time.perf_counter() - start < deadline_s:
+            ready = False
+            try:
+                ready = (await client.get("/health/ready")).status_code == 200
+            except httpx.TransportError:
+                pass
+            pss = tree_memory(master_pid)["pss_mb"] if len(_children(master_pid)) >= workers else None
+            if ready and pss is not None and last is not None and abs(pss - last) <= max(1.0, 0.01 * last):
+                stable_since = stable_since or time.perf_counter()
+                if time.perf_counter() - stable_since >= 3.0:
+                    return
+            else:
+                stable_since = None
+            last = pss
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{workers} worker(s) did not settle within {deadline_s:.0f}s")
+
+
+def measure(args, workers: int, mode: str, provider_url: str) -> dict:
+    workdir = tempfile.mkdtemp(prefix="worker-scaling-")
+    port = load_test._free_port()
+    env = load_test.server_env(workdir, provider_url)
+    env.update({
+        "WEB_CONCURRENCY": str(workers),
+        "PRELOAD_APP": "1" if mode == "preload" else "0",
+        "BIND": f"127.0.0.1:{port}",
+        # Without preloading, each worker loads its models at startup.
+        "MODEL_WARMUP": "1",
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "metrics"),
+    })
+    log = open(args.server_log, "a") if args.server_log else subprocess.DEVNULL
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "backend.main:app"],
+                            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        started = time.perf_counter()
+        asyncio.run(_wait_until_settled(base_url, proc.pid, workers, args.startup_timeout))
+        startup_s = time.perf_counter() - started
+        idle = tree_memory(proc.pid)
+        models = {name: m["status"] for name, m in httpx.get(f"{base_url}/health/ready").json()["models"].items()}
+        load_args = SimpleNamespace(duration=args.duration, requests=0, concurrency=args.concurrency,
+                                    mix=args.mix, timeout=args.timeout, seed=args.seed)
+        traffic = asyncio.run(load_test.run(load_args, base_url, proc.pid))
+        loaded = tree_memory(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+        if log is not subprocess.DEVNULL:
+            log.close()
+    return {
+        "mode": mode,
+        "workers": workers,
+        "startup_s": round(startup_s, 1),
+        "memory_idle": idle,
+        "memory_after_load": loaded,
+        "totals": traffic["totals"],
+        "p95_ms": {label: e["p95_ms"] for label, e in traffic["endpoints"].items()},
+        "models": models,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of traffic per configuration")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=load_test.DEFAULT_MIX)
+    parser.add_argument("--llm-latency-ms", type=float, default=80.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+    parser.add_argument("--server-log", help="file for the servers' logs (default: discarded)")
+    args = parser.parse_args()
+    load_test.parse_mix(args.mix)
+
+    _provider, provider_url, _behaviour = serve(latency_ms=args.llm_latency_ms)
+    results = []
+    print(f"{'mode':12}{'workers':>8}{'rss MB':>10}{'pss MB':>10}{'worker uss':>12}{'rps':>9}{'errors':>8}")
+    for mode in args.modes:
+        for workers in args.workers:
+            result = measure(args, workers, mode, provider_url)
+            results.append(result)
+            memory = result["memory_after_load"]
+            print(f"{mode:12}{workers:>8}{memory['rss_mb']:>10}{memory['pss_mb']:>10}{memory['worker_uss_mb']:>12}"
+                  f"{result['totals']['throughput_rps']:>9}{result['totals']['errors']:>8}", flush=True)
+
+    text = json.dumps({
+        "meta": {"git_commit": load_test._git_commit(), "cpu_count": os.cpu_count(),
+                 "args": {k: v for k, v in vars(args).items() if k not in ("output", "server_log")}},
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,26 @@
+import os
+import json
+import time
 import streamlit as st
 import requests
 from io import BytesIO
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageOps
 from st_audiorec import st_audiorec
 
 # --- Configuration ---
 st.set_page_config(page_title="AI Health Assistant", layout="wide")
-BACKEND_URL = "https://multimodal-health-assistant-production.up.railway.app"
+BACKEND_URL = os.getenv("BACKEND_URL", "https://multimodal-health-assistant-production.up.railway.app").rstrip("/")
+HTTP_CONNECT_TIMEOUT_S = float(os.getenv("HTTP_CONNECT_TIMEOUT_S", "5"))
+HTTP_READ_TIMEOUT_S = float(os.getenv("HTTP_READ_TIMEOUT_S", "60"))  # longest silence between bytes, streams included
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_CACHE_TTL_S = int(os.getenv("HISTORY_CACHE_TTL_S", "300"))
+# The backend shrinks images to 768 px before captioning; sending more is wasted upload.
+IMAGE_UPLOAD_MAX_SIDE = int(os.getenv("IMAGE_UPLOAD_MAX_SIDE", "768"))
+IMAGE_UPLOAD_QUALITY = int(os.getenv("IMAGE_UPLOAD_QUALITY", "85"))
+DEBUG_TIMINGS = os.getenv("DEBUG_TIMINGS", "0").lower() in ("1", "true", "yes")
+MAX_TIMINGS_SHOWN = 20
 
 # --- State Management Initialization ---
 if "token" not in st.session_state:
@@ -16,16 +31,147 @@ if "page" not in st.session_state:
     st.session_state.page = "Login"
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "history_version" not in st.session_state:
+    st.session_state.history_version = 0  # bumped after each query to invalidate cached history
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 1
+if "timings" not in st.session_state:
+    st.session_state.timings = []
+if "last_query" not in st.session_state:
+    st.session_state.last_query = {}
+
+# --- HTTP Session ---
+@st.cache_resource
+def get_http_session():
+    """
+    One pooled session for the whole Streamlit server, so reruns reuse
+    keep-alive connections instead of opening a TLS connection per call.
+    Shared by every browser session, so it must never hold cookies.
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def record_timing(label, elapsed_ms, status=None):
+    st.session_state.timings = (st.session_state.timings + [{
+        "call": label, "ms": round(elapsed_ms, 1), "status": status,
+    }])[-MAX_TIMINGS_SHOWN:]
+
+def api_request(method, path, label=None, **kwargs):
+    """Calls the backend through the pooled session, with timeouts, and records the call's duration."""
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT_S, HTTP_READ_TIMEOUT_S))
+    start = time.perf_counter()
+    r = get_http_session().request(method, f"{BACKEND_URL}/{path.lstrip('/')}", **kwargs)
+    record_timing(label or f"{method} /{path.lstrip('/')}", (time.perf_counter() - start) * 1000, r.status_code)
+    return r
+
+def auth_headers():
+    return {"Authorization": f"Bearer {st.session_state.token}"}
 
 # --- API Error Helper ---
 def handle_api_error(e, context="request"):
     """Displays a user-friendly error message from the backend."""
+    if getattr(e, "response", None) is None:
+        st.error(f"Could not reach the server for {context}: {e}")
+        return
     try:
         error_detail = e.response.json().get("detail", "No detail provided.")
         st.error(f"Error with {context}: {error_detail}")
     except (requests.exceptions.JSONDecodeError, AttributeError):
         st.error(f"An error occurred: {e.response.text}")
 
+# --- Server-Sent Events Helper ---
+def iter_sse_events(response):
+    """Yields (event, data) pairs from a streaming text/event-stream response."""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+# --- Background Job Helper ---
+JOB_POLL_WAIT_S = 10  # server-side long-poll per request
+JOB_MAX_POLL_S = 300
+
+def run_query_job(data, files, headers):
+    """Submits a heavy query to /jobs and long-polls until it finishes; returns the job."""
+    r = api_request("POST", "jobs", data=data, files=files, headers=headers)
+    r.raise_for_status()
+    job = r.json()
+    deadline = time.monotonic() + JOB_MAX_POLL_S
+    while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+        r = api_request("GET", f"jobs/{job['id']}", label="GET /jobs/{id}", params={"wait": JOB_POLL_WAIT_S},
+                        headers=headers)
+        r.raise_for_status()
+        job = r.json()
+    return job
+
+# --- Image Upload Helper ---
+def prepare_image_upload(uploaded_image):
+    """
+    Downscales an image to IMAGE_UPLOAD_MAX_SIDE and re-encodes it as JPEG before
+    upload. Returns ((filename, bytes, mime type), report); images that are already
+    small, or that Pillow cannot read, are sent unchanged for the server to judge.
+    """
+    raw = uploaded_image.getvalue()
+    start = time.perf_counter()
+    report = {"original_kb": round(len(raw) / 1024, 1)}
+    try:
+        image = Image.open(BytesIO(raw))
+        report["original_px"] = list(image.size)
+        if max(image.size) <= IMAGE_UPLOAD_MAX_SIDE and image.format in ("JPEG", "PNG", "WEBP"):
+            report.update({"sent_kb": report["original_kb"], "sent_px": list(image.size), "resized": False})
+            return (uploaded_image.name, raw, uploaded_image.type), report
+        image.draft("RGB", (IMAGE_UPLOAD_MAX_SIDE, IMAGE_UPLOAD_MAX_SIDE))  # JPEG: decode at reduced scale
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((IMAGE_UPLOAD_MAX_SIDE, IMAGE_UPLOAD_MAX_SIDE))
+        buf = BytesIO()
+        image.convert("RGB").save(buf, format="JPEG", quality=IMAGE_UPLOAD_QUALITY, optimize=True)
+    except Exception as e:
+        report["error"] = str(e)
+        return (uploaded_image.name, raw, uploaded_image.type), report
+    data = buf.getvalue()
+    report.update({
+        "sent_kb": round(len(data) / 1024, 1),
+        "sent_px": list(image.size),
+        "resized": True,
+        "resize_ms": round((time.perf_counter() - start) * 1000, 1),
+    })
+    name = os.path.splitext(uploaded_image.name or "image")[0] + ".jpg"
+    return (name, data, "image/jpeg"), report
+
+# --- Cached History ---
+@st.cache_data(ttl=HISTORY_CACHE_TTL_S, max_entries=500, show_spinner=False)
+def fetch_history_page(token, version, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    One newest-first page of history. Cached per token, cursor and `version`, so
+    reruns (e.g. sidebar changes) reuse it until a new query bumps the version.
+    """
+    params = {"limit": limit}
+    if before:
+        params["before"] = before
+    r = get_http_session().get(
+        f"{BACKEND_URL}/dashboard/history",
+        params=params,
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=(HTTP_CONNECT_TIMEOUT_S, HTTP_READ_TIMEOUT_S),
+    )
+    r.raise_for_status()
+    return r.json()
+
+def invalidate_history():
+    st.session_state.history_version += 1
+
 # --- UI Pages ---
 def render_login_page():
     st.header("Login / Signup")
@@ -36,31 +182,31 @@ def render_login_page():
         with col1:
             if st.form_submit_button("Login", use_container_width=True):
                 try:
-                    r = requests.post(f"{BACKEND_URL}auth/login", data={'username': username, 'password': password})
+                    r = api_request("POST", "auth/login", data={'username': username, 'password': password})
                     r.raise_for_status()
                     data = r.json()
                     st.session_state.token = data['access_token']
                     st.session_state.username = data['username']
                     st.session_state.page = "Chat"
                     st.rerun()
-                except requests.exceptions.HTTPError as e:
+                except requests.exceptions.RequestException as e:
                     handle_api_error(e, "login")
         with col2:
             if st.form_submit_button("Sign Up", use_container_width=True):
                 try:
-                    r = requests.post(f"{BACKEND_URL}auth/signup", json={"username": username, "password": password})
+                    r = api_request("POST", "auth/signup", json={"username": username, "password": password})
                     r.raise_for_status()
                     data = r.json()
                     st.session_state.token = data['access_token']
                     st.session_state.username = data['username']
                     st.session_state.page = "Chat"
                     st.rerun()
-                except requests.exceptions.HTTPError as e:
+                except requests.exceptions.RequestException as e:
                     handle_api_error(e, "signup")
 
 def render_chat_page():
     st.title(f"Welcome, {st.session_state.username}!")
-    headers = {"Authorization": f"Bearer {st.session_state.token}"}
+    headers = auth_headers()
 
     # Display existing chat messages
     for message in st.session_state.messages:
@@ -86,6 +232,8 @@ def render_chat_page():
 
             try:
                 # --- UNIFIED SUBMISSION LOGIC ---
+                query_start = time.perf_counter()
+                last_query = {"image": None}
                 with st.spinner("Processing your multimodal query..."):
                     # Prepare data and files for the multipart request.
                     files_to_send = []
@@ -96,35 +244,75 @@ def render_chat_page():
                             ('audio_file', ('recorded_audio.wav', BytesIO(recorded_audio_bytes), 'audio/wav'))
                         )
                     if uploaded_image:
-                        files_to_send.append(
-                            ('image_file', (uploaded_image.name, uploaded_image.getvalue(), uploaded_image.type))
+                        image_upload, last_query["image"] = prepare_image_upload(uploaded_image)
+                        files_to_send.append(('image_file', image_upload))
+
+                    # Voice + image together can take many seconds: run it as a background job.
+                    use_job = bool(recorded_audio_bytes and uploaded_image)
+                    if use_job:
+                        job = run_query_job(data_to_send, files_to_send, headers)
+                    else:
+                        # Stream the answer from the unified endpoint as server-sent events.
+                        r = api_request(
+                            "POST",
+                            "query/multimodal/stream",
+                            label="POST /query/multimodal/stream (headers)",
+                            data=data_to_send,
+                            files=files_to_send,
+                            headers=headers,
+                            stream=True
                         )
+                        r.raise_for_status()
 
-                    # Send all data to the new unified endpoint in a single request.
-                    r = requests.post(
-                        f"{BACKEND_URL}query/multimodal",
-                        data=data_to_send,
-                        files=files_to_send,
-                        headers=headers
-                    )
-                    r.raise_for_status()
-                    response_data = r.json()
-
-                    # Build a user-friendly summary of what was sent based on the response.
-                    user_summary = []
-                    if response_data.get("transcribed_text"):
-                        user_summary.append(f"🎤 **You said:** *{response_data['transcribed_text']}*")
-                    if text_input:
-                        user_summary.append(f"📝 **You wrote:** *{text_input}*")
-                    if response_data.get("image_caption"):
-                        user_summary.append(f"🖼️ **Image analysis:** *{response_data['image_caption']}*")
-
-                    # Display the results in the chat.
-                    st.session_state.messages.append({"role": "user", "content": "\n\n".join(user_summary)})
-                    st.session_state.messages.append({"role": "assistant", "content": response_data['text_response']})
-                    st.rerun()
+                meta = {}
+                tokens = []
+                if use_job:
+                    if job["status"] != "succeeded":
+                        st.error(f"Your query did not complete ({job['status']}): {job.get('error') or 'timed out'}")
+                        st.stop()
+                    meta = job["result"]
+                    tokens = [meta["text_response"]]
+                    last_query["job"] = {k: job.get(k) for k in ("queue_wait_ms", "processing_ms")}
+                    with st.chat_message("assistant"):
+                        st.markdown(meta["text_response"])
+                else:
+                    with st.chat_message("assistant"):
+                        placeholder = st.empty()
+                        first_token_ms = None
+                        for event, payload in iter_sse_events(r):
+                            if event == "meta":
+                                meta = payload
+                            elif event == "token":
+                                if first_token_ms is None:
+                                    first_token_ms = round((time.perf_counter() - query_start) * 1000, 1)
+                                tokens.append(payload["text"])
+                                placeholder.markdown("".join(tokens) + "▌")
+                            elif event == "done":
+                                last_query["stream"] = payload
+                        placeholder.markdown("".join(tokens))
+                    r.close()
+                    last_query["client_first_token_ms"] = first_token_ms
+
+                last_query["server_stages_ms"] = meta.get("timings")
+                last_query["client_total_ms"] = round((time.perf_counter() - query_start) * 1000, 1)
+                st.session_state.last_query = last_query
+                invalidate_history()
+
+                # Build a user-friendly summary of what was sent based on the response.
+                user_summary = []
+                if meta.get("transcribed_text"):
+                    user_summary.append(f"🎤 **You said:** *{meta['transcribed_text']}*")
+                if text_input:
+                    user_summary.append(f"📝 **You wrote:** *{text_input}*")
+                if meta.get("image_caption"):
+                    user_summary.append(f"🖼️ **Image analysis:** *{meta['image_caption']}*")
 
-            except requests.exceptions.HTTPError as e:
+                # Display the results in the chat.
+                st.session_state.messages.append({"role": "user", "content": "\n\n".join(user_summary)})
+                st.session_state.messages.append({"role": "assistant", "content": "".join(tokens)})
+                st.rerun()
+
+            except requests.exceptions.RequestException as e:
                 handle_api_error(e, "query submission")
             except Exception as e:
                 st.error(f"An unexpected client-side error occurred: {e}")
@@ -132,26 +320,54 @@ def render_chat_page():
 def render_dashboard_page():
     st.title("Your Health Dashboard")
     try:
-        headers = {"Authorization": f"Bearer {st.session_state.token}"}
-        r = requests.get(f"{BACKEND_URL}dashboard/history", headers=headers)
-        r.raise_for_status()
-        history = r.json()
-        if not history:
+        # Pages are cached, so reruns only fetch what is new: the first page after a
+        # query, or the next older page when asked for it.
+        pages, before = [], None
+        for _ in range(st.session_state.history_pages):
+            start = time.perf_counter()
+            page = fetch_history_page(st.session_state.token, st.session_state.history_version, before)
+            record_timing(f"history page {len(pages) + 1}", (time.perf_counter() - start) * 1000)
+            pages.append(page)
+            before = page.get("next_cursor")
+            if not page.get("has_more") or not before:
+                break
+
+        if not pages[0]["items"]:
             st.info("No conversation history yet.")
-        for item in reversed(history):
-            role = "You" if item['role'] == 'user' else "Assistant"
-            content = item.get("content", "")
-            timestamp_str = item.get("timestamp", "").split(".")[0].replace("T", " ")
-            st.markdown(f"**{role}** (_{timestamp_str}_): {content}")
-            st.markdown("---")
-    except requests.exceptions.HTTPError as e:
+            return
+        if pages[-1].get("has_more"):
+            if st.button("Load older messages"):
+                st.session_state.history_pages += 1
+                st.rerun()
+
+        # Oldest first; one markdown block per page instead of two elements per message.
+        for page in reversed(pages):
+            lines = []
+            for item in reversed(page["items"]):
+                role = "You" if item['role'] == 'user' else "Assistant"
+                content = item.get("content", "")
+                timestamp_str = (item.get("timestamp") or "").split(".")[0].replace("T", " ")
+                lines.append(f"**{role}** (_{timestamp_str}_): {content}")
+            st.markdown("\n\n---\n\n".join(lines) + "\n\n---")
+    except requests.exceptions.RequestException as e:
         handle_api_error(e, "dashboard")
 
+def render_debug_panel():
+    """Client-side call durations and the last query's server stage timings."""
+    with st.sidebar.expander("Timings", expanded=True):
+        if st.session_state.last_query:
+            st.caption("Last query")
+            st.json(st.session_state.last_query, expanded=False)
+        if st.session_state.timings:
+            st.caption("Recent backend calls (ms)")
+            st.dataframe(list(reversed(st.session_state.timings)), hide_index=True, use_container_width=True)
+
 # --- Main App Logic ---
 st.sidebar.title("Navigation")
 if st.session_state.get("token"):
     st.sidebar.write(f"Logged in as: **{st.session_state.username}**")
     page = st.sidebar.radio("Navigate", ["Chat", "Dashboard", "Logout"])
+    show_timings = st.sidebar.checkbox("Show timings", value=DEBUG_TIMINGS)
     if page == "Chat":
         render_chat_page()
     elif page == "Dashboard":
@@ -160,6 +376,7 @@ if st.session_state.get("token"):
         st.session_state.clear()
         st.session_state.page = "Login"
         st.rerun()
+    if show_timings:
+        render_debug_panel()
 else:
     render_login_page()
-
@@ -0,0 +1,79 @@
+"""
+Multi-worker serving profile for the API:
+
+    gunicorn -c gunicorn.conf.py backend.main:app
+
+The app is imported once in the master and its fork-safe models (BLIP, the
+sentence-transformers embedder, openai-whisper) are loaded there before any
+worker forks, so every worker shares one copy of the weights copy-on-write
+instead of loading its own. Everything else (DB pools, Mongo, caption and
+indexer threads, job workers, HTTP clients) starts per worker, after fork.
+
+Sizing (all overridable through the environment):
+
+  WEB_CONCURRENCY      worker processes; default = usable cores. Each worker is one
+                       event loop, and provider/database waits are already async, so
+                       workers beyond the core count add memory, not throughput.
+  CAPTION_NUM_THREADS  torch/onnxruntime threads per worker; default = cores // workers,
+                       so inference threads across all workers add up to the core count.
+  BCRYPT_WORKERS, JOB_WORKERS, DB_POOL_SIZE + DB_MAX_OVERFLOW
+                       are per worker: total bcrypt threads, running jobs and database
+                       connections are these times WEB_CONCURRENCY (keep the latter under
+                       the server's max_connections).
+
+Caches, login rate limits and the NumPy vector index are per worker too; token
+revocations (password change, account deletion) are shared through the database and
+reach every worker within AUTH_REVOCATION_SYNC_S. RSS counts shared pages once per
+process; budget memory with PSS (benchmarks/worker_scaling.py), which is roughly the
+master plus each worker's private heap.
+"""
+import os
+import glob
+import tempfile
+
+
+def _usable_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPU_COUNT = _usable_cpus()
+
+# --- Server ---
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", str(CPU_COUNT)))
+preload_app = os.getenv("PRELOAD_APP", "1").lower() in ("1", "true", "yes")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Behind a proxy, set this (or the app's TRUSTED_PROXIES) to the proxy addresses so login
+# throttling keys on the real client IP rather than one shared proxy address.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+# Recycling a worker re-forks it from the master, returning pages it has un-shared over time.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# --- Process Environment (read by the app when it is imported below) ---
+os.environ.setdefault("CAPTION_NUM_THREADS", str(max(1, CPU_COUNT // max(1, workers))))
+# Tokenizers' Rust thread pool is disabled after fork anyway; this skips the warning.
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"prometheus-{os.getpid()}"))
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+for stale in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+    os.remove(stale)
+
+
+# --- Hooks ---
+def when_ready(server):
+    """Master, after the app is imported and before the first fork."""
+    if preload_app:
+        from backend import serving
+        serving.preload(workers)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Backend modules read their configuration at import time, so it is set before any test imports them.
+_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="backend-tests-"), "test.db")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_DB_PATH}",
+    # The same file under a second URL stands in for a read replica.
+    "DATABASE_REPLICA_URL": f"sqlite:///{_DB_PATH}",
+    "JWT_SECRET_KEY": "test-secret",
+    "GROQ_API_KEY": "fake-key",
+    "MONGO_BACKEND": "memory",
+    "VECTOR_BACKEND": "numpy",
+    "EMBEDDING_BACKEND": "hashing",
+})
+
+
+@pytest.fixture(scope="session")
+def fake_provider():
+    """A benchmarks.fake_provider server for the whole session: (base_url, behaviour)."""
+    from benchmarks.fake_provider import serve
+
+    server, base_url, behaviour = serve()
+    yield base_url, behaviour
+    server.shutdown()
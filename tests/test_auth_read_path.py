@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend import auth, sql
+
+
+@pytest.fixture(scope="module")
+def user():
+    sql.create_db_and_tables()
+    db = sql.SessionLocal()
+    try:
+        user = sql.User(username="read-path-user", password="not-a-real-hash")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return auth.AuthenticatedUser(id=user.id, username=user.username)
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def no_identity_cache(monkeypatch):
+    # Every lookup below must reach the database.
+    monkeypatch.setattr(auth, "identity_cache", auth.IdentityCache(ttl_s=0))
+
+
+def run(scenario):
+    """Runs `scenario()` on a fresh event loop; aiosqlite connections cannot outlive their loop."""
+    async def main():
+        try:
+            return await scenario()
+        finally:
+            await sql.async_read_engine.dispose()
+    return asyncio.run(main())
+
+
+async def resolve(token: str) -> auth.AuthenticatedUser:
+    """Resolves `token` the way FastAPI does: through the get_async_read_db dependency."""
+    dependency = sql.get_async_read_db()
+    db = await dependency.__anext__()
+    try:
+        return await auth.get_current_user(token=token, db=db)
+    finally:
+        await dependency.aclose()
+
+
+def test_async_read_path_uses_aiosqlite_on_the_replica():
+    assert sql.AsyncReadSessionLocal is not None, "aiosqlite and greenlet are required (requirements-dev.txt)"
+    assert sql.async_read_engine.url.drivername == "sqlite+aiosqlite"
+    assert sql.read_engine is not sql.engine
+
+
+def test_get_current_user_resolves_through_the_async_session(user):
+    token = auth.create_access_token({"sub": user.username})
+    assert run(lambda: resolve(token)) == user
+
+
+def test_get_current_user_rejects_unknown_users(user):
+    token = auth.create_access_token({"sub": "nobody"})
+    with pytest.raises(HTTPException) as excinfo:
+        run(lambda: resolve(token))
+    assert excinfo.value.status_code == 401
+
+
+def test_sync_fallback_resolves_the_same_user(user):
+    assert run(lambda: auth._lookup_user(None, user.username)) == user
+
+
+def test_dispose_engines_drops_pooled_async_connections(user):
+    token = auth.create_access_token({"sub": user.username})
+
+    async def scenario():
+        await resolve(token)
+        pool = sql.async_read_engine.sync_engine.pool
+        assert pool.checkedin() == 1
+        sql.dispose_engines()
+        assert sql.async_read_engine.sync_engine.pool.checkedin() == 0
+        return await resolve(token)
+
+    assert run(scenario) == user
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from backend import context_builder, llm_service, mongo_memory
+from backend.prompts import message_tokens
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    """Replaces the LLM summary with one that lists the contents it was given."""
+    calls = []
+
+    def summarize(previous_summary, messages, max_words=200):
+        calls.append([m["content"] for m in messages])
+        return " | ".join(filter(None, [previous_summary] + [m["content"] for m in messages]))
+
+    monkeypatch.setattr(llm_service, "summarize_conversation", summarize)
+    monkeypatch.setattr(context_builder, "CONTEXT_SUMMARY_MIN_BATCH", 4)
+    return calls
+
+
+async def store_turns(user_id: str, start: int, count: int):
+    for i in range(start, start + count):
+        await mongo_memory.store_turn(user_id, f"question {i} " + "word " * 10, f"answer {i} " + "word " * 10)
+        await asyncio.sleep(0.01)  # keep each turn after the previous reply's timestamp
+
+
+async def build(user_id: str, verbatim_messages: int) -> tuple:
+    """Builds a context whose budget fits `verbatim_messages` turns, then lets any summary refresh finish."""
+    recent = await mongo_memory.get_recent_messages(user_id, context_builder.CONTEXT_FETCH_LIMIT)
+    summary_doc = await mongo_memory.get_summary(user_id)
+    budget = sum(message_tokens(m) for m in recent[-verbatim_messages:])
+    if summary_doc:
+        budget += message_tokens(context_builder._summary_message(summary_doc["summary"]))
+    context = await context_builder.build_context(user_id, budget=budget)
+    await asyncio.gather(*context_builder._summary_tasks)
+    contents = " ".join(m["content"] for m in context["messages"])
+    return context, contents
+
+
+def test_overflow_stays_verbatim_until_summarized(summarizer):
+    async def scenario():
+        await store_turns("overflow-user", 0, 4)
+        # 6 of 8 messages overflow the window: too many to wait, so they are carried and summarized.
+        context, contents = await build("overflow-user", 2)
+        assert all(f"question {i}" in contents and f"answer {i}" in contents for i in range(4))
+        assert context["report"]["pending_summary_messages"] == 6
+        assert len(summarizer) == 1 and len(summarizer[0]) == 6
+
+        # Now covered by the summary: only the window is verbatim.
+        context, contents = await build("overflow-user", 2)
+        assert context["report"]["summarized"] and context["report"]["verbatim_messages"] == 2
+        assert context["report"]["pending_summary_messages"] == 0
+
+        # One more turn pushes 2 messages out: below the batch size, so they stay verbatim unsummarized.
+        await store_turns("overflow-user", 4, 1)
+        context, contents = await build("overflow-user", 2)
+        turns = [" ".join(m["content"].split()[:2]) for m in context["messages"][1:]]
+        assert turns == ["question 3", "answer 3", "question 4", "answer 4"]
+        assert context["report"]["pending_summary_messages"] == 2
+        assert len(summarizer) == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,24 @@
+from backend import embedding_service, semantic_cache
+from backend.model_registry import ModelRegistry
+
+
+def test_embedder_is_registered_only_by_enabled_features(monkeypatch):
+    registry = ModelRegistry()
+    monkeypatch.setattr(embedding_service, "registry", registry)
+    monkeypatch.setattr(embedding_service, "EMBEDDING_BACKEND", "auto")
+
+    semantic_cache.SemanticCache(enabled=False)
+    assert "embedder" not in registry
+
+    semantic_cache.SemanticCache(enabled=True)
+    assert "embedder" in registry
+
+
+def test_hashing_backend_never_registers_the_embedder(monkeypatch):
+    registry = ModelRegistry()
+    monkeypatch.setattr(embedding_service, "registry", registry)
+    monkeypatch.setattr(embedding_service, "EMBEDDING_BACKEND", "hashing")
+
+    semantic_cache.SemanticCache(enabled=True)
+    assert len(embedding_service.embed_text("a mild headache")) == embedding_service.EMBEDDING_DIM
+    assert "embedder" not in registry
@@ -0,0 +1,76 @@
+import io
+import os
+import asyncio
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+
+from backend import auth, sql, jobs_service
+
+
+@pytest.fixture(scope="module")
+def user():
+    sql.create_db_and_tables()
+    db = sql.SessionLocal()
+    try:
+        user = sql.User(username="jobs-user", password="not-a-real-hash")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return auth.AuthenticatedUser(id=user.id, username=user.username)
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs_service, "JOB_SPOOL_DIR", str(tmp_path))
+    return tmp_path
+
+
+def upload(data: bytes, filename: str, content_type: str) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=filename, size=len(data),
+                      headers=Headers({"content-type": content_type}))
+
+
+def submit(user, **files):
+    """Calls the endpoint with a runner whose queue accepts jobs but has no workers."""
+    async def main():
+        runner = jobs_service.JobRunner()
+        runner._queue = asyncio.Queue(maxsize=10)
+        jobs_service.runner, previous = runner, jobs_service.runner
+        try:
+            return await jobs_service.submit_job(current_user=user, text_query="What is this?",
+                                                 audio_file=files.get("audio"), image_file=files.get("image"))
+        finally:
+            jobs_service.runner = previous
+    return asyncio.run(main())
+
+
+def test_oversized_image_spools_nothing(user, spool_dir, monkeypatch):
+    monkeypatch.setattr(jobs_service, "UPLOAD_MAX_IMAGE_BYTES", 10)
+    with pytest.raises(HTTPException) as excinfo:
+        submit(user, audio=upload(b"RIFF" * 100, "a.wav", "audio/wav"),
+               image=upload(b"\x89PNG" * 100, "a.png", "image/png"))
+    assert excinfo.value.status_code == 413
+    assert os.listdir(spool_dir) == []
+
+
+def test_failed_insert_removes_the_spooled_uploads(user, spool_dir, monkeypatch):
+    def broken_create(job, max_active):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(jobs_service, "_create_job", broken_create)
+    with pytest.raises(RuntimeError):
+        submit(user, audio=upload(b"RIFF" * 100, "a.wav", "audio/wav"))
+    assert os.listdir(spool_dir) == []
+
+
+def test_active_job_limit_rejects_and_cleans_up(user, spool_dir, monkeypatch):
+    monkeypatch.setattr(jobs_service, "JOB_MAX_ACTIVE_PER_USER", 2)
+    accepted = [submit(user, audio=upload(b"RIFF" * 100, "a.wav", "audio/wav")) for _ in range(2)]
+    with pytest.raises(HTTPException) as excinfo:
+        submit(user, audio=upload(b"RIFF" * 100, "a.wav", "audio/wav"))
+    assert excinfo.value.status_code == 429
+    assert sorted(os.listdir(spool_dir)) == sorted(job.id for job in accepted)
@@ -0,0 +1,13 @@
+from backend.observability import percentile, latency_summary
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(100, 0, -1))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 100)) == (51, 96, 100)
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 95) == 0.0
+
+
+def test_latency_summary_skips_missing_samples():
+    assert latency_summary([]) == {"count": 0, "p50_ms": None, "p95_ms": None}
+    assert latency_summary([None, 3.14159, 1.0, None, 2.0]) == {"count": 3, "p50_ms": 2.0, "p95_ms": 3.1}
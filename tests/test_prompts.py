@@ -0,0 +1,24 @@
+from backend import prompts
+
+
+def test_estimated_counts_are_labelled(monkeypatch):
+    monkeypatch.setattr(prompts, "_encoding", None)
+    monkeypatch.setattr(prompts, "_encoding_loaded", True)
+    assert prompts.tokenizer_name() == "estimate:4-chars-per-token"
+    assert prompts.count_tokens("a mild headache") == 4
+
+    _, report = prompts.build_messages("a mild headache", user_id="tokenizer-user")
+    assert report["tokenizer"] == "estimate:4-chars-per-token"
+    prompts.prompt_stats.record(report, 10.0)
+    assert prompts.prompt_stats.stats()["tokenizer"] == "estimate:4-chars-per-token"
+
+
+def test_tiktoken_counts_are_labelled(monkeypatch):
+    class Encoding:
+        def encode(self, text, disallowed_special=()):
+            return text.split()
+
+    monkeypatch.setattr(prompts, "_encoding", Encoding())
+    monkeypatch.setattr(prompts, "_encoding_loaded", True)
+    assert prompts.tokenizer_name() == f"tiktoken:{prompts.TOKENIZER_ENCODING}"
+    assert prompts.count_tokens("a mild headache") == 3
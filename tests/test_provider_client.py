@@ -0,0 +1,254 @@
+import io
+import time
+import asyncio
+
+import pytest
+
+from backend import provider_client
+from backend.provider_client import ProviderClient, ProviderError, CircuitOpenError
+
+PRIMARY, FALLBACK = "primary-model", "fallback-model"
+MESSAGES = [{"role": "user", "content": "I have a mild headache"}]
+
+
+@pytest.fixture
+def configure(fake_provider):
+    """Resets the fake provider and applies the given options (`models=` for per-model overrides)."""
+    _, behaviour = fake_provider
+
+    def apply(**settings):
+        behaviour.update({"reset": True, "latency_ms": 10.0, "jitter_ms": 0.0, **settings})
+
+    apply()
+    yield apply
+    apply()
+
+
+@pytest.fixture
+def make_client(fake_provider, monkeypatch):
+    """Builds a client with its own pool, breakers and counters after overriding module settings."""
+    base_url, _ = fake_provider
+    monkeypatch.setattr(provider_client, "PROVIDER_BACKOFF_BASE_MS", 10.0)
+    monkeypatch.setattr(provider_client, "PROVIDER_HEDGE_AFTER_MS", 0.0)
+    monkeypatch.setattr(provider_client, "LLM_FALLBACK_MODEL", "")
+    monkeypatch.setattr(provider_client, "LLM_FALLBACK_AFTER_MS", 0.0)
+
+    clients = []
+
+    def make(**settings) -> ProviderClient:
+        for name, value in settings.items():
+            monkeypatch.setattr(provider_client, name, value)
+        clients.append(ProviderClient(base_url, "fake-key"))
+        return clients[-1]
+
+    yield make
+    for client in clients:
+        asyncio.run(client.aclose())
+
+
+def run(client: ProviderClient, scenario):
+    """Runs `scenario(client)` on a fresh event loop and closes the client's pools afterwards."""
+    async def main():
+        try:
+            return await scenario(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def chat(client):
+    return client.achat(MESSAGES, PRIMARY)
+
+
+async def open_circuit(client, reset_after_s: float = 0.2) -> provider_client.CircuitBreaker:
+    """Trips the primary's breaker with one failed call (the provider must be failing)."""
+    breaker = client.breaker(f"chat:{PRIMARY}")
+    breaker.failure_threshold, breaker.reset_after_s = 1, reset_after_s
+    with pytest.raises(ProviderError):
+        await chat(client)
+    assert breaker.state == "open"
+    return breaker
+
+
+# --- Retries ---
+def test_retry_succeeds_after_transient_errors(configure, make_client):
+    configure(fail_first=2)
+    client = make_client(PROVIDER_MAX_RETRIES=2)
+    assert run(client, chat).startswith(f"[{PRIMARY}]")
+    stats = client.stats()
+    assert (stats["attempts"], stats["retries"], stats["failures"]) == (3, 2, 0)
+
+
+def test_sync_retry_succeeds_after_transient_errors(configure, make_client):
+    configure(fail_first=1)
+    client = make_client(PROVIDER_MAX_RETRIES=2)
+    assert client.chat(MESSAGES, PRIMARY).startswith(f"[{PRIMARY}]")
+    assert client.stats()["retries"] == 1
+
+
+def test_retry_budget_runs_out(configure, make_client):
+    configure(error_rate=1.0)
+    client = make_client(PROVIDER_MAX_RETRIES=2)
+    with pytest.raises(ProviderError) as excinfo:
+        run(client, chat)
+    assert excinfo.value.status == 503
+    stats = client.stats()
+    assert (stats["attempts"], stats["retries"], stats["failures"]) == (3, 2, 1)
+
+
+def test_non_retryable_status_is_not_retried(configure, make_client):
+    configure(error_rate=1.0, error_status=400)
+    client = make_client(PROVIDER_MAX_RETRIES=2)
+    with pytest.raises(ProviderError) as excinfo:
+        run(client, chat)
+    assert excinfo.value.status == 400
+    assert client.stats()["attempts"] == 1
+
+
+# --- Circuit Breaker ---
+def test_breaker_opens_then_half_opens_and_closes(configure, make_client, fake_provider):
+    _, behaviour = fake_provider
+    configure(error_rate=1.0)
+    client = make_client(PROVIDER_MAX_RETRIES=0)
+
+    async def scenario(client):
+        breaker = await open_circuit(client)
+        sent = behaviour.stats()["counts"][f"chat:{PRIMARY}"]
+        with pytest.raises(CircuitOpenError):
+            await chat(client)
+        assert behaviour.stats()["counts"][f"chat:{PRIMARY}"] == sent, "an open circuit must not send requests"
+
+        await asyncio.sleep(0.25)
+        configure()
+        assert await chat(client)  # the half-open probe succeeds
+        assert breaker.state == "closed"
+        return breaker
+
+    breaker = run(client, scenario)
+    assert breaker.trips == 1
+    assert client.stats()["circuit_rejections"] == 1
+
+
+def test_failed_half_open_probe_reopens(configure, make_client):
+    configure(error_rate=1.0)
+    client = make_client(PROVIDER_MAX_RETRIES=0)
+
+    async def scenario(client):
+        breaker = await open_circuit(client)
+        await asyncio.sleep(0.25)
+        with pytest.raises(ProviderError):
+            await chat(client)
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await chat(client)
+
+    run(client, scenario)
+
+
+def test_cancelled_half_open_probe_frees_its_slot(configure, make_client):
+    configure(error_rate=1.0)
+    client = make_client(PROVIDER_MAX_RETRIES=0)
+
+    async def scenario(client):
+        breaker = await open_circuit(client)
+        await asyncio.sleep(0.25)
+        configure(latency_ms=2000.0)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(chat(client), 0.2)  # the probe is cancelled by the caller's timeout
+        configure()
+        assert await chat(client), "a new probe must be let through after a cancelled one"
+        assert breaker.state == "closed"
+
+    run(client, scenario)
+
+
+def test_unexpected_probe_error_frees_its_slot(configure, make_client):
+    configure(error_rate=1.0)
+    client = make_client(PROVIDER_MAX_RETRIES=0)
+
+    async def broken_attempt(timeout_s):
+        raise RuntimeError("bug in the attempt")
+
+    async def scenario(client):
+        breaker = await open_circuit(client)
+        await asyncio.sleep(0.25)
+        with pytest.raises(RuntimeError):
+            await client.acall(f"chat:{PRIMARY}", broken_attempt)
+        configure()
+        assert await chat(client)
+        assert breaker.state == "closed"
+
+    run(client, scenario)
+
+
+# --- Hedging ---
+def test_hedge_wins_over_a_slow_request(configure, make_client):
+    configure(slow_first=1, slow_ms=2000.0)
+    client = make_client(PROVIDER_MAX_RETRIES=0, PROVIDER_HEDGE_AFTER_MS=100.0)
+    start = time.perf_counter()
+    assert run(client, chat).startswith(f"[{PRIMARY}]")
+    assert time.perf_counter() - start < 1.5
+    stats = client.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_no_hedge_for_a_fast_request(configure, make_client):
+    client = make_client(PROVIDER_MAX_RETRIES=0, PROVIDER_HEDGE_AFTER_MS=500.0)
+    run(client, chat)
+    assert client.stats()["hedges"] == 0
+
+
+# --- Model Fallback ---
+def test_fallback_model_is_used_when_the_primary_fails(configure, make_client):
+    configure(models={PRIMARY: {"error_rate": 1.0}})
+    client = make_client(PROVIDER_MAX_RETRIES=0, LLM_FALLBACK_MODEL=FALLBACK)
+    assert run(client, chat).startswith(f"[{FALLBACK}]")
+    stats = client.stats()
+    assert (stats["fallbacks"], stats["fallback_wins"]) == (1, 1)
+
+
+def test_sync_fallback_model_is_used_when_the_primary_fails(configure, make_client):
+    configure(models={PRIMARY: {"error_rate": 1.0}})
+    client = make_client(PROVIDER_MAX_RETRIES=0, LLM_FALLBACK_MODEL=FALLBACK)
+    assert client.chat(MESSAGES, PRIMARY).startswith(f"[{FALLBACK}]")
+
+
+def test_fallback_races_a_slow_primary(configure, make_client):
+    configure(models={PRIMARY: {"latency_ms": 1500.0}, FALLBACK: {"latency_ms": 10.0}})
+    client = make_client(PROVIDER_MAX_RETRIES=0, LLM_FALLBACK_MODEL=FALLBACK, LLM_FALLBACK_AFTER_MS=100.0)
+
+    assert run(client, chat).startswith(f"[{FALLBACK}]")
+    stats = client.stats()
+    assert (stats["fallbacks"], stats["fallback_wins"]) == (1, 1)
+    assert stats["breakers"][f"chat:{PRIMARY}"]["state"] == "closed"
+
+
+def test_probe_that_loses_the_fallback_race_frees_its_slot(configure, make_client):
+    configure(error_rate=1.0)
+    client = make_client(PROVIDER_MAX_RETRIES=0, LLM_FALLBACK_MODEL=FALLBACK, LLM_FALLBACK_AFTER_MS=100.0)
+
+    async def scenario(client):
+        breaker = await open_circuit(client)
+        await asyncio.sleep(0.25)
+        configure(models={PRIMARY: {"latency_ms": 1500.0}, FALLBACK: {"latency_ms": 10.0}})
+        assert (await chat(client)).startswith(f"[{FALLBACK}]")
+        assert breaker.state == "half_open"
+        configure()
+        assert (await chat(client)).startswith(f"[{PRIMARY}]"), "the cancelled primary probe kept its slot"
+        assert breaker.state == "closed"
+
+    run(client, scenario)
+
+
+# --- Malformed Responses ---
+@pytest.mark.parametrize("malformed", ["json", "shape"])
+def test_malformed_responses_raise_provider_error(configure, make_client, malformed):
+    configure(malformed=malformed)
+    client = make_client(PROVIDER_MAX_RETRIES=0)
+    with pytest.raises(ProviderError):
+        client.chat(MESSAGES, PRIMARY)
+    with pytest.raises(ProviderError):
+        client.transcribe("a.wav", io.BytesIO(b"RIFF"), "stt")
+    with pytest.raises(ProviderError):
+        run(client, chat)
+    assert client.breaker(f"chat:{PRIMARY}").failures == 2
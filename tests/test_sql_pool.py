@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from backend import sql
+
+
+def make_pool(creator, name: str):
+    metrics = sql.PoolMetrics(name)
+    pool = sql._instrumented(QueuePool, metrics)(creator, pool_size=1, max_overflow=0, timeout=0.05)
+    metrics.pool = pool
+    return pool, metrics
+
+
+def test_saturated_pool_counts_a_timeout():
+    pool, metrics = make_pool(lambda: sqlite3.connect(":memory:"), "saturated")
+    held = pool.connect()
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    held.close()
+    stats = metrics.stats()
+    assert (stats["checkouts"], stats["timeouts"], stats["errors"]) == (2, 1, 0)
+    assert stats["capacity"] == 1
+
+
+def test_connection_failure_is_an_error_not_a_timeout():
+    def refuse():
+        raise sqlite3.OperationalError("connection refused")
+
+    pool, metrics = make_pool(refuse, "refusing")
+    with pytest.raises(sqlite3.OperationalError):
+        pool.connect()
+    stats = metrics.stats()
+    assert (stats["timeouts"], stats["errors"]) == (0, 1)